@@ -0,0 +1,132 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ActionBuffer:
+    """Буфер событий аналитики с пакетной записью.
+
+    События копятся в памяти и сбрасываются функцией ``flush_func`` одной
+    транзакцией: когда набирается ``max_events`` событий или раз в
+    ``flush_interval`` секунд. Запись идет в фоновом потоке, поэтому
+    ``add`` не касается базы и не блокирует обработчик.
+    """
+
+    def __init__(self, flush_func, max_events=50, flush_interval=1.0, max_pending=10000, name='analytics-flush'):
+        self.flush_func = flush_func
+        self.name = name
+        self.max_events = max_events
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        self._flushes = 0
+        self._flushed_events = 0
+        self._flush_errors = 0
+        self._dropped_events = 0
+        self._max_queue_depth = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def add(self, event):
+        with self._lock:
+            if not self._closed:
+                self._pending.append(event)
+                depth = len(self._pending)
+                if depth > self._max_queue_depth:
+                    self._max_queue_depth = depth
+                if self._thread is None:
+                    self._start()
+                if depth >= self.max_events:
+                    self._wakeup.notify()
+                return
+        # После остановки пишем сразу, чтобы не потерять событие
+        self.flush_func([event])
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._closed and len(self._pending) < self.max_events:
+                    self._wakeup.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Записывает все накопленные события. Возвращает их количество"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                events = list(self._pending)
+                self._pending.clear()
+
+            started = time.perf_counter()
+            try:
+                self.flush_func(events)
+            except Exception as e:
+                logger.error(f"Error flushing {len(events)} events ({self.name}): {e}")
+                with self._lock:
+                    self._flush_errors += 1
+                    # Возвращаем события в начало очереди, но не растем бесконечно
+                    self._pending.extendleft(reversed(events))
+                    overflow = len(self._pending) - self.max_pending
+                    for _ in range(max(overflow, 0)):
+                        self._pending.popleft()
+                        self._dropped_events += 1
+                return 0
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._flushes += 1
+                self._flushed_events += len(events)
+                self._last_flush_ms = elapsed_ms
+                self._total_flush_ms += elapsed_ms
+                if elapsed_ms > self._max_flush_ms:
+                    self._max_flush_ms = elapsed_ms
+            return len(events)
+
+    def close(self):
+        """Останавливает фоновый поток и сбрасывает оставшиеся события"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'queue_depth': len(self._pending),
+                'max_queue_depth': self._max_queue_depth,
+                'flushes': self._flushes,
+                'flushed_events': self._flushed_events,
+                'flush_errors': self._flush_errors,
+                'dropped_events': self._dropped_events,
+                'last_flush_ms': round(self._last_flush_ms, 3),
+                'avg_flush_ms': round(self._total_flush_ms / self._flushes, 3) if self._flushes else 0.0,
+                'max_flush_ms': round(self._max_flush_ms, 3),
+            }
+
+
+def create_buffer(flush_func, **kwargs):
+    """Создает буфер и регистрирует его сброс при завершении процесса"""
+    buffer = ActionBuffer(flush_func, **kwargs)
+    atexit.register(buffer.close)
+    return buffer
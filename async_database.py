@@ -0,0 +1,81 @@
+"""Асинхронные обертки над database.py для обработчиков бота.
+
+Каждый вызов выполняется в отдельном пуле потоков, поэтому запись в SQLite
+и fsync не блокируют цикл событий python-telegram-bot. Имена и аргументы
+функций совпадают с синхронными версиями из database.py.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from db_pool import DEFAULT_POOL_SIZE
+
+# Потоков столько же, сколько соединений в пуле: больше просто ждали бы свободное соединение
+_executor = ThreadPoolExecutor(max_workers=DEFAULT_POOL_SIZE, thread_name_prefix='db')
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет синхронную функцию работы с базой в пуле потоков"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _offload(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def _list_weight_history(user_id, days=30):
+    # Генератор нужно дочитать в рабочем потоке, а не в цикле событий
+    return list(database.get_weight_history(user_id, days))
+
+
+save_weight = _offload(database.save_weight)
+get_weight_history = _offload(_list_weight_history)
+save_user_params = _offload(database.save_user_params)
+get_user_params = _offload(database.get_user_params)
+save_calculation_results = _offload(database.save_calculation_results)
+get_calculation_history = _offload(database.get_calculation_history)
+get_calculation_page = _offload(database.get_calculation_page)
+get_last_calculation = _offload(database.get_last_calculation)
+set_target_weight = _offload(database.set_target_weight)
+get_target_weight = _offload(database.get_target_weight)
+register_user = _offload(database.register_user)
+get_user_statistics = _offload(database.get_user_statistics)
+get_popular_actions = _offload(database.get_popular_actions)
+get_daily_stats = _offload(database.get_daily_stats)
+get_payment_link = _offload(database.get_payment_link)
+save_payment_link = _offload(database.save_payment_link)
+set_payment_link_status = _offload(database.set_payment_link_status)
+record_payment = _offload(database.record_payment)
+save_media_file_id = _offload(database.save_media_file_id)
+forget_media_file_id = _offload(database.forget_media_file_id)
+
+
+async def get_nutrition_cards(category=None, limit=10):
+    # После первой загрузки карточки читаются из памяти без обращения к базе
+    if database.is_card_cache_loaded():
+        return database.get_nutrition_cards(category, limit)
+    return await run_db(database.get_nutrition_cards, category, limit)
+
+
+async def get_media_file_id(card_id, image_hash):
+    # file_id лежат в памяти вместе с кэшем карточек, листание карточек не ходит в базу
+    if database.is_card_cache_loaded():
+        return database.get_media_file_id(card_id, image_hash)
+    return await run_db(database.get_media_file_id, card_id, image_hash)
+
+
+async def track_user_action(user_id, action_type, action_data=None):
+    # Событие только кладется в буфер аналитики, поток для этого не нужен
+    database.track_user_action(user_id, action_type, action_data)
+
+
+def shutdown():
+    """Дожидается завершения начатых операций, сбрасывает аналитику и останавливает пул потоков"""
+    _executor.shutdown(wait=True)
+    database.action_buffer.close()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Нагрузочный тест: задержка обработки апдейтов, пока много пользователей считают нормы.
+
+Каждый "расчет" повторяет работу handle_activity с базой: track_user_action,
+save_calculation_results и track_user_action. Параллельно зонд каждые 5 мс
+обрабатывает легкий апдейт без обращения к базе (как нажатие кнопки меню) и
+измеряет, сколько он ждал цикл событий. При прямых синхронных вызовах p99
+растет вместе с числом пользователей, с async_database остается ровным.
+
+Запуск: python benchmarks/bench_async_db.py [--levels 10,100,500]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_database
+import database
+import db_pool
+
+RESULTS = {
+    'bmr': 1500, 'maintenance_calories': 1800, 'deficit_calories_15': 1530,
+    'deficit_calories_20': 1440, 'surplus_calories': 1980, 'protein_min': 120,
+    'protein_max': 150, 'fat_min': 40, 'fat_max': 60, 'carbs_min': 180,
+    'carbs_max': 220, 'bmi': 22.5, 'bmi_category': 'Нормальный вес',
+    'water_norm_min': 2000, 'water_norm_max': 2500,
+    'recommended_steps_min': 8000, 'recommended_steps_max': 10000,
+}
+PARAMS = {'weight': 70, 'height': 175, 'age': 30, 'gender': 'мужской', 'activity_level': 'средняя'}
+
+
+async def calculate_sync(user_id):
+    database.track_user_action(user_id, "activity_medium")
+    database.save_calculation_results(user_id, RESULTS, PARAMS)
+    database.track_user_action(user_id, "calculation_completed")
+
+
+async def calculate_async(user_id):
+    await async_database.track_user_action(user_id, "activity_medium")
+    await async_database.save_calculation_results(user_id, RESULTS, PARAMS)
+    await async_database.track_user_action(user_id, "calculation_completed")
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+async def run_level(handler, users, rounds):
+    probe_latencies = []
+    calc_latencies = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            scheduled = time.perf_counter()
+            await asyncio.sleep(0)  # легкий апдейт: только переключение задач
+            probe_latencies.append(time.perf_counter() - scheduled)
+            await asyncio.sleep(0.005)
+
+    async def user(user_id):
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await handler(user_id)
+            calc_latencies.append(time.perf_counter() - started)
+
+    probe_task = asyncio.create_task(probe())
+    await asyncio.sleep(0.01)
+    await asyncio.gather(*(user(user_id) for user_id in range(users)))
+    done.set()
+    await probe_task
+    return probe_latencies, calc_latencies
+
+
+async def main_async(levels, rounds):
+    # Печать из save_calculation_results здесь только мешает
+    sys.stdout, real_stdout = open(os.devnull, 'w'), sys.stdout
+    try:
+        results = []
+        for users in levels:
+            for label, handler in (("sync", calculate_sync), ("executor", calculate_async)):
+                probes, calcs = await run_level(handler, users, rounds)
+                results.append((users, label, probes, calcs))
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    print(f"{'users':>6} {'mode':<9} {'probe p50':>10} {'probe p99':>10} {'calc p99':>10}")
+    for users, label, probes, calcs in results:
+        print(f"{users:>6} {label:<9} {percentile(probes, 0.5):>8.2f}ms "
+              f"{percentile(probes, 0.99):>8.2f}ms {percentile(calcs, 0.99):>8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--levels", default="10,100,500")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_pool.configure(db_path=os.path.join(tmp, "bench.db"))
+        database.init_db()
+        asyncio.run(main_async(levels, args.rounds))
+        database.action_buffer.flush()
+        db_pool.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Разбор callback_data: прежние регулярные выражения и split против callback_codec.
+
+Прежний путь повторяет то, что происходило на каждое нажатие: python-telegram-bot
+по очереди проверял регулярные выражения CallbackQueryHandler из main(), затем
+обработчик разбирал строку сам (split('_'), startswith, сравнения). Новый путь -
+один вызов callback_codec.decode: для кнопок прежнего формата и для компактных.
+Для обоих форматов выводится и средняя длина callback_data.
+
+Запуск: python benchmarks/bench_callback_codec.py [--calls 200000]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from callback_codec import decode, encode
+
+# Шаблоны CallbackQueryHandler в порядке регистрации до маршрутизатора
+LEGACY_PATTERNS = [re.compile(pattern) for pattern in (
+    "^calculate$|^tips$|^share_bot$|^calc_self$|^calc_friend$|^set_target$|^back_to_weight$|^back_to_gender$|^back_to_age$",
+    "^gender_",
+    "^activity_",
+    "^calc_history(_(older|newer)_\\d+)?$",
+    "^back_to_main$",
+    "^back_to_tips$",
+    "^card_prev_|^card_next_",
+    "^about_bot$",
+    "^donate$",
+    "^donate_\\d+$",
+    "^refresh_stats$|^stats_today$|^stats_week$",
+)]
+
+
+def legacy_parse(data):
+    """Шаблон обработчика и разбор строки так, как это делали обработчики"""
+    for number, pattern in enumerate(LEGACY_PATTERNS):
+        if pattern.match(data):
+            break
+    else:
+        return None
+    if number == 1:
+        return number, ("male" if data == "gender_male" or data == "gender_male_friend" else "female",)
+    if number == 2:
+        return number, (data.replace('activity_', ''),)
+    if number == 3:
+        if data.startswith("calc_history_older_"):
+            return number, ("older", int(data.rsplit('_', 1)[1]))
+        if data.startswith("calc_history_newer_"):
+            return number, ("newer", int(data.rsplit('_', 1)[1]))
+        return number, ()
+    if number == 6:
+        return number, (data.startswith('card_next_'), data.split('_')[-1])
+    if number == 9:
+        return number, (int(data.split('_')[1]),)
+    return number, (data,)
+
+
+# Нажатия в пропорциях обычной сессии: листание карточек и расчет чаще всего
+PRESSES = [
+    (("card_next", "vitamins"), "card_next_vitamins", 6),
+    (("card_prev", "nutrition"), "card_prev_nutrition", 3),
+    (("calculate",), "calculate", 2),
+    (("calc_self",), "calc_self", 2),
+    (("gender", "female"), "gender_female", 1),
+    (("gender", "male"), "gender_male_friend", 1),
+    (("activity", "very_high"), "activity_very_high", 2),
+    (("calc_history_page", "older", 1834), "calc_history_older_1834", 1),
+    (("back_to_main",), "back_to_main", 2),
+    (("donate_amount", 500), "donate_500", 1),
+    (("stats", "today"), "stats_today", 1),
+]
+
+
+def make_presses(count, seed=5):
+    rng = random.Random(seed)
+    weighted = [(encode(*action), legacy) for action, legacy, weight in PRESSES for _ in range(weight)]
+    return [rng.choice(weighted) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200000)
+    args = parser.parse_args()
+
+    presses = make_presses(args.calls)
+    compact = [data for data, _ in presses]
+    legacy = [data for _, data in presses]
+    for data, old in set(presses):
+        assert decode(data) == decode(old) and legacy_parse(old) is not None, old
+
+    print(f"callback_data: legacy {sum(map(len, legacy)) / len(legacy):.1f} B, "
+          f"compact {sum(map(len, compact)) / len(compact):.1f} B on average")
+    results = {}
+    for label, func, payloads in (
+        ("regex + split", legacy_parse, legacy),
+        ("codec, legacy", decode, legacy),
+        ("codec, compact", decode, compact),
+    ):
+        elapsed = timeit.timeit(lambda: [func(data) for data in payloads], number=1)
+        results[label] = elapsed
+        print(f"{label:<15} {elapsed / len(payloads) * 1e9:8.0f} ns/press")
+    print(f"speedup x{results['regex + split'] / results['codec, compact']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Задержка вызовов database.py: соединение на каждый вызов против пула.
+
+Запуск: python benchmarks/bench_db_pool.py [--users 3000] [--workers 8]
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_pool
+import database
+
+
+# Старые реализации: новое соединение на каждый вызов
+def legacy_register_user(db_path, user_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('''INSERT OR IGNORE INTO user_stats
+                        (user_id, first_seen, last_seen)
+                        VALUES (?, datetime('now', '+3 hours'), datetime('now', '+3 hours'))''', (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def legacy_track_user_action(db_path, user_id, action_type):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('''INSERT INTO user_actions (user_id, action_type, action_data)
+                        VALUES (?, ?, ?)''', (user_id, action_type, None))
+        conn.execute('''INSERT OR REPLACE INTO user_stats
+                        (user_id, last_seen, is_active)
+                        VALUES (?, datetime('now', '+3 hours'), 1)''', (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def legacy_get_user_params(db_path, user_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT weight, height, age, gender, target_weight FROM user_params WHERE user_id = ?',
+                            (user_id,)).fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def legacy_get_calculation_history(db_path, user_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('''SELECT * FROM calculation_history WHERE user_id = ?
+                               ORDER BY date DESC LIMIT 5''', (user_id,)).fetchall()
+    finally:
+        conn.close()
+
+
+def legacy_session(db_path, user_id):
+    return [
+        lambda: legacy_register_user(db_path, user_id),
+        lambda: legacy_track_user_action(db_path, user_id, "start_bot"),
+        lambda: legacy_get_user_params(db_path, user_id),
+        lambda: legacy_track_user_action(db_path, user_id, "calculate"),
+        lambda: legacy_get_calculation_history(db_path, user_id),
+    ]
+
+
+def pooled_session(db_path, user_id):
+    return [
+        lambda: database.register_user(user_id),
+        lambda: database.track_user_action(user_id, "start_bot"),
+        lambda: database.get_user_params(user_id),
+        lambda: database.track_user_action(user_id, "calculate"),
+        lambda: database.get_calculation_history(user_id),
+    ]
+
+
+def run_user(calls):
+    timings = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run(label, session, db_path, users, workers):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(run_user, (session(db_path, user_id) for user_id in range(users)))
+        timings = [t for user_timings in results for t in user_timings]
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    ms = lambda value: value * 1000
+    print(f"{label:<10} calls={len(timings):>6}  total={elapsed:6.2f}s  "
+          f"mean={ms(statistics.fmean(timings)):6.3f}ms  "
+          f"p50={ms(timings[len(timings) // 2]):6.3f}ms  "
+          f"p99={ms(timings[int(len(timings) * 0.99)]):6.3f}ms")
+
+
+def prepare(db_path, journal_mode):
+    db_pool.configure(db_path=db_path)
+    database.init_db()
+    db_pool.close_pool()
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, "before.db")
+        after_path = os.path.join(tmp, "after.db")
+        prepare(before_path, "DELETE")
+        prepare(after_path, "WAL")
+
+        print(f"{args.users} users x 5 calls, {args.workers} worker threads")
+        run("before", legacy_session, before_path, args.users, args.workers)
+
+        db_pool.configure(db_path=after_path, pool_size=args.workers)
+        run("after", pooled_session, after_path, args.users, args.workers)
+        database.action_buffer.flush()
+        db_pool.close_pool()
+
+
+if __name__ == "__main__":
+    main()
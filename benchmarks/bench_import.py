@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Время импорта database.py и первой загрузки каталога карточек.
+
+Каждый замер - отдельный процесс интерпретатора. Зависимости (hashlib, json,
+sqlite3, db_pool, analytics, migrations, rollups) импортируются заранее, так что
+измеряется только сам модуль. "cold" - без кэша байткода (компиляция исходника), "warm" - с кэшем.
+Для сравнения с другой версией укажи ее каталог: --repo /path/to/checkout
+
+Запуск: python benchmarks/bench_import.py [--runs 20]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import time
+import hashlib, json, mmap, sqlite3, db_pool, analytics, migrations, rollups
+started = time.perf_counter()
+import database
+imported = time.perf_counter()
+load = getattr(database, 'load_card_catalog', None)
+if load is not None:
+    load()
+print(imported - started, time.perf_counter() - imported)
+'''
+
+
+def measure(repo, pycache_prefix):
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache_prefix)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=repo, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return [float(value) * 1000 for value in output.split()]
+
+
+def report(label, samples):
+    imports = [sample[0] for sample in samples]
+    loads = [sample[1] for sample in samples]
+    print(f"{label:<6} import median {statistics.median(imports):7.2f}ms  "
+          f"min {min(imports):7.2f}ms  catalog load median {statistics.median(loads):6.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repo", default=REPO)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cold = [measure(args.repo, os.path.join(tmp, f"cold{run}")) for run in range(args.runs)]
+        warm_prefix = os.path.join(tmp, "warm")
+        measure(args.repo, warm_prefix)
+        warm = [measure(args.repo, warm_prefix) for _ in range(args.runs)]
+
+    print(f"database.py: {os.path.getsize(os.path.join(args.repo, 'database.py'))} bytes")
+    report("cold", cold)
+    report("warm", warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Клавиатуры на один обработанный апдейт: реестр keyboards.py против сборки в обработчике.
+
+Поток апдейтов повторяет типичную сессию: главное меню, выбор режима и
+пола, активность, листание карточек категории и страниц истории. На каждый
+апдейт берется та клавиатура, которую отправил бы обработчик. Для обоих
+вариантов меряются время и память, выделенная под клавиатуры (tracemalloc),
+в пересчете на апдейт. Прежние функции берутся из test_keyboards.py.
+
+Запуск: python benchmarks/bench_keyboards.py [--updates 20000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import keyboards
+from test_keyboards import (layout, legacy_activity, legacy_calc_mode, legacy_card_browser, legacy_gender,
+                            legacy_history_navigation, legacy_main_menu, legacy_tips_navigation)
+
+CATEGORIES = ('seasonal', 'tables', 'vitamins', 'nutrition')
+
+
+def make_updates(count, seed=11):
+    """Апдейты как (вид клавиатуры, аргументы)"""
+    rng = random.Random(seed)
+    kinds = ['main_menu', 'calc_mode', 'gender', 'activity', 'tips', 'tips', 'card', 'card', 'history']
+    updates = []
+    for _ in range(count):
+        kind = rng.choice(kinds)
+        if kind in ('tips', 'card'):
+            total = rng.randrange(3, 12)
+            args = (rng.choice(CATEGORIES), rng.randrange(total), total)
+        elif kind == 'history':
+            newest = rng.randrange(4, 400)
+            args = (newest if rng.random() < 0.5 else None, newest - 2)
+        else:
+            args = ()
+        updates.append((kind, args))
+    return updates
+
+
+LEGACY = {
+    'main_menu': legacy_main_menu,
+    'calc_mode': legacy_calc_mode,
+    'gender': legacy_gender,
+    'activity': legacy_activity,
+    'tips': legacy_tips_navigation,
+    'card': lambda category, index, total: legacy_card_browser(category),
+    'history': legacy_history_navigation,
+}
+
+
+def neighbours(index, total):
+    """Соседние карточки (позиция, id) так, как их передает обработчик; id = позиция + 100"""
+    return ((index - 1, index + 99) if index > 0 else None,
+            (index + 1, index + 101) if index < total - 1 else None)
+
+REGISTRY = {
+    'main_menu': lambda: keyboards.MAIN_MENU,
+    'calc_mode': lambda: keyboards.CALC_MODE,
+    'gender': lambda: keyboards.GENDER,
+    'activity': lambda: keyboards.ACTIVITY,
+    'tips': lambda category, index, total: keyboards.tips_navigation(category, *neighbours(index, total)),
+    'card': lambda category, index, total: keyboards.card_browser(category, *neighbours(index, total)),
+    'history': keyboards.history_navigation,
+}
+
+
+def handle(builders, updates):
+    for kind, args in updates:
+        builders[kind](*args)
+
+
+def measure(label, builders, updates):
+    for function in keyboards.DYNAMIC:
+        function.cache_clear()
+    # Прогрев: кэш уже заполнен, как у бота после первых минут работы
+    handle(builders, updates)
+    started = time.perf_counter()
+    handle(builders, updates)
+    elapsed = time.perf_counter() - started
+
+    # Память, выделенная под клавиатуру одного апдейта: пик относительно состояния до него
+    tracemalloc.start()
+    allocated = 0
+    for kind, args in updates:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        builders[kind](*args)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    count = len(updates)
+    print(f"{label:<9} {elapsed / count * 1e6:8.2f}us/update  "
+          f"{allocated / count:8.1f} B allocated/update")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=20000)
+    args = parser.parse_args()
+
+    updates = make_updates(args.updates)
+    for kind, update_args in set(updates):
+        if kind in ('tips', 'card'):
+            # Кнопки карточек теперь несут позицию и id, с прежними они не совпадают
+            continue
+        assert layout(REGISTRY[kind](*update_args)) == layout(LEGACY[kind](*update_args)), kind
+
+    print(f"{args.updates} updates, keyboard cache {keyboards.KEYBOARD_CACHE_SIZE} per kind")
+    before = measure("legacy", LEGACY, updates)
+    after = measure("registry", REGISTRY, updates)
+    print(f"speedup x{before / after:.1f}")
+    print(keyboards.metrics())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Сборка текстов сообщений: функции messages.py против прежнего форматирования.
+
+История расчетов рендерится страницами разного размера (страница бота - 3
+записи, старая история показывала 5, 10 и 50 - длинная история одним
+сообщением). Записи синтетические, с датами за последние месяцы, как их
+отдает SQLite. Прежние функции берутся из test_messages.py, перед замером
+тексты сверяются.
+
+Запуск: python benchmarks/bench_messages.py [--calls 20000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import messages
+from nutrition import ACTIVITY_LEVELS, calculate_nutrition_norms
+from test_messages import (legacy_format_calculation_results, legacy_format_statistics_message,
+                           legacy_render_history)
+
+
+def make_history(count, seed=7):
+    rng = random.Random(seed)
+    started = datetime(2024, 6, 1, 12, 0, 0)
+    history = []
+    for number in range(count):
+        weight = rng.randrange(100, 240) / 2
+        age = rng.randrange(16, 70)
+        gender = rng.choice(["мужской", "женский"])
+        activity = rng.choice(list(ACTIVITY_LEVELS))
+        calc = calculate_nutrition_norms(weight, 170.0, age, gender, activity)
+        date = started - timedelta(days=number // 2, minutes=rng.randrange(600))
+        calc.update(id=count - number, date=date.strftime("%Y-%m-%d %H:%M:%S"),
+                    weight=weight, height=170.0, age=age, activity_level=activity)
+        history.append(calc)
+    return history
+
+
+STATS = {
+    'total_users': 12840, 'active_users_7d': 2310, 'active_users_30d': 6120, 'new_users_today': 41,
+    'new_users_week': 388, 'total_calculations': 51200, 'calculations_today': 230, 'calculations_week': 1710,
+    'gender_stats': {'женский': 31200, 'мужской': 19800, 'другой': 200}, 'avg_age': 33.7,
+    'activity_stats': {activity: 10000 + number for number, activity in enumerate(ACTIVITY_LEVELS)},
+    'donations_total': 58, 'donations_amount_total': 26300.0, 'donations_week': 3, 'donations_amount_week': 1300.0,
+}
+
+
+def compare(label, legacy, templated, calls):
+    assert legacy() == templated(), label
+    before = timeit.timeit(legacy, number=calls) / calls * 1e6
+    after = timeit.timeit(templated, number=calls) / calls * 1e6
+    print(f"{label:<18} {before:9.2f}us -> {after:9.2f}us  x{before / after:5.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    results = make_history(1)[0]
+    compare("results", lambda: legacy_format_calculation_results(results),
+            lambda: messages.render_calculation_results(results), args.calls)
+    compare("statistics", lambda: legacy_format_statistics_message(STATS),
+            lambda: messages.render_statistics(STATS), args.calls)
+    for size in (3, 5, 10, 50):
+        history = make_history(size)
+        calls = max(args.calls // size, 100)
+        compare(f"history x{size}", lambda: legacy_render_history(history),
+                lambda: messages.render_history(history), calls)
+    print(f"date cache: {messages._format_day.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
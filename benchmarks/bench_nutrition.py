@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Пересчет норм для большого числа профилей: скалярный цикл против пакетного расчета.
+
+Профили синтетические: вес и рост с шагом 0.5, целый возраст от 12 до 100,
+пол и активность из тех же значений, что выбирают в боте. После замера часть
+строк пакетного результата сверяется со скалярным расчетом. Перед этим
+замеряется один вызов: расчет по таблице коэффициентов против прежних формул
+(копия из test_nutrition.py) и расчет с текстом ответа без кэша и из кэша.
+
+Запуск: python benchmarks/bench_nutrition.py [--profiles 1000000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nutrition
+from nutrition import RESULT_FIELDS, calculate_nutrition_norms, calculate_nutrition_norms_batch
+from test_nutrition import legacy_calculate_nutrition_norms
+
+
+def make_profiles(count, seed=42):
+    rng = random.Random(seed)
+    genders = ["мужской", "женский"]
+    activities = list(nutrition.ACTIVITY_LEVELS)
+    return (
+        [rng.randrange(80, 300) / 2 for _ in range(count)],
+        [rng.randrange(280, 420) / 2 for _ in range(count)],
+        [rng.randrange(12, 101) for _ in range(count)],
+        [rng.choice(genders) for _ in range(count)],
+        [rng.choice(activities) for _ in range(count)],
+    )
+
+
+def timed(label, func, count):
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<22} {elapsed:8.3f}s  {count / elapsed:12,.0f} profiles/s")
+    return result
+
+
+def micro(calls=200_000):
+    args = (70.0, 175.0, 47, "женский", "средняя")
+    uncached = lambda *row: nutrition.format_calculation_results(calculate_nutrition_norms(*row))
+    for label, func in (("legacy formula", legacy_calculate_nutrition_norms),
+                        ("coefficient table", calculate_nutrition_norms),
+                        ("norms + message", uncached),
+                        ("cached report", nutrition.get_nutrition_report)):
+        elapsed = timeit.timeit(lambda: func(*args), number=calls)
+        print(f"{label:<22} {elapsed / calls * 1e6:8.2f}us per call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profiles", type=int, default=1_000_000)
+    parser.add_argument("--verify", type=int, default=10_000, help="сколько строк сверить со скалярным расчетом")
+    args = parser.parse_args()
+
+    micro()
+    columns = make_profiles(args.profiles)
+    timed("scalar loop", lambda: [calculate_nutrition_norms(*row) for row in zip(*columns)], args.profiles)
+    timed("batch (python)", lambda: calculate_nutrition_norms_batch(*columns, use_numpy=False), args.profiles)
+    if nutrition.np is None:
+        print("NumPy is not installed, vectorized batch skipped")
+        return
+    batch = timed("batch (numpy)", lambda: calculate_nutrition_norms_batch(*columns, use_numpy=True), args.profiles)
+
+    rows = list(zip(*columns))
+    for index in random.Random(1).sample(range(args.profiles), min(args.verify, args.profiles)):
+        expected = calculate_nutrition_norms(*rows[index])
+        assert all(batch[field][index] == expected[field] for field in RESULT_FIELDS), rows[index]
+    print(f"verified {min(args.verify, args.profiles)} rows against the scalar function")
+
+
+if __name__ == "__main__":
+    main()
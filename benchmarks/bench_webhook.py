@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Пропускная способность webhook: фейковый Telegram шлет апдейты на встроенный сервер.
+
+Отправитель держит несколько keep-alive соединений (как Telegram с
+max_connections) и шлет по ним POST с JSON апдейта. Сервер кладет апдейт в
+очередь, обработчики берут его оттуда и "работают" заданное время, имитируя
+handler с запросом к базе или API. Число одновременных обработчиков - аналог
+CONCURRENT_UPDATES. Печатается апдейтов в секунду и задержка от отправки до
+конца обработки.
+
+Запуск: python benchmarks/bench_webhook.py [--updates 5000] [--workers 1,8,32]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webserver import WebServer, webhook_handler
+
+SECRET = "bench-secret"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+async def fake_telegram(port, updates, connections, sent_at):
+    """Шлет апдейты с номерами 0..updates-1 по connections соединениям"""
+    async def sender(numbers):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for number in numbers:
+            body = json.dumps({'update_id': number, 'message': {'text': 'бенчмарк'}}).encode('utf-8')
+            writer.write(b"POST /telegram HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                         b"X-Telegram-Bot-Api-Secret-Token: " + SECRET.encode() + b"\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            sent_at[number] = time.perf_counter()
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            assert head.startswith(b'HTTP/1.1 200'), head
+            await reader.readexactly(2)  # "ok"
+        writer.close()
+
+    await asyncio.gather(*(sender(range(start, updates, connections)) for start in range(connections)))
+
+
+async def run_level(workers, updates, connections, handler_ms):
+    queue = asyncio.Queue()
+    sent_at = {}
+    latencies = []
+
+    async def submit(data):
+        await queue.put(data)
+
+    async def worker():
+        while True:
+            data = await queue.get()
+            await asyncio.sleep(handler_ms / 1000)
+            latencies.append(time.perf_counter() - sent_at[data['update_id']])
+            queue.task_done()
+
+    server = WebServer()
+    server.add_route('POST', '/telegram', webhook_handler(submit, SECRET))
+    await server.start('127.0.0.1', 0)
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+
+    started = time.perf_counter()
+    await fake_telegram(server.port, updates, connections, sent_at)
+    accepted = time.perf_counter() - started
+    await queue.join()
+    processed = time.perf_counter() - started
+
+    for task in tasks:
+        task.cancel()
+    await server.stop()
+    return accepted, processed, latencies
+
+
+async def main_async(args):
+    print(f"{'workers':>7} {'accepted/s':>11} {'processed/s':>12} {'p50':>9} {'p99':>9}")
+    for workers in args.workers:
+        accepted, processed, latencies = await run_level(workers, args.updates, args.connections, args.handler_ms)
+        print(f"{workers:>7} {args.updates / accepted:>11,.0f} {args.updates / processed:>12,.0f} "
+              f"{percentile(latencies, 0.5):>7.1f}ms {percentile(latencies, 0.99):>7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--connections", type=int, default=40, help="как max_connections у setWebhook")
+    parser.add_argument("--workers", default="1,8,32")
+    parser.add_argument("--handler-ms", type=float, default=2.0, help="время обработки одного апдейта")
+    args = parser.parse_args()
+    args.workers = [int(value) for value in args.workers.split(",")]
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Компактный формат callback_data кнопок.
+
+Кнопка несет действие и его аргументы (категорию карточек, номер, сумму и
+т.п.). Формат версии 1: символ версии '1', код действия (один символ) и поля
+через ':'. Целые записываются в base36, категории и варианты выбора - одним
+символом по таблице. Например, "1u2" - листать карточки категории vitamins
+вперед. Такая строка разбирается один раз в (действие, аргументы) и намного
+короче лимита Telegram в 64 байта.
+
+Таблицы действий и значений только дополняются в конец: коды уже
+отправленных кнопок не должны менять смысл. Если формат все же придется
+менять, это делается новой версией. Кнопки в старых сообщениях содержат
+прежние строки вида card_next_seasonal, decode разбирает и их.
+"""
+
+import math
+
+VERSION = '1'
+MAX_BYTES = 64
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+SEPARATOR = ':'
+DIGITS = frozenset(ALPHABET[:36])
+
+
+class CodecError(ValueError):
+    pass
+
+
+class Int:
+    """Неотрицательное целое в base36"""
+
+    @staticmethod
+    def encode(value):
+        if not isinstance(value, int) or value < 0:
+            raise CodecError(f"Expected non-negative int, got {value!r}")
+        digits = []
+        while True:
+            value, digit = divmod(value, 36)
+            digits.append(ALPHABET[digit])
+            if not value:
+                return ''.join(reversed(digits))
+
+    @staticmethod
+    def decode(token):
+        # int(token, 36) сам по себе пропускает знак, пробелы и '_'
+        if not token or not DIGITS.issuperset(token):
+            raise CodecError(f"Bad int token {token!r}")
+        return int(token, 36)
+
+    @staticmethod
+    def parse(text):
+        """Значение из прежнего формата кнопок"""
+        if not text.isdigit():
+            raise CodecError(f"Bad int: {text!r}")
+        return int(text)
+
+
+class Float:
+    """Конечное число с плавающей точкой, nan и inf не допускаются"""
+
+    @staticmethod
+    def encode(value):
+        value = float(value)
+        if not math.isfinite(value):
+            raise CodecError(f"Expected finite float, got {value!r}")
+        return repr(value)
+
+    @staticmethod
+    def decode(text):
+        value = float(text)
+        if not math.isfinite(value):
+            raise CodecError(f"Bad float: {text!r}")
+        return value
+
+    parse = decode
+
+
+class Choice:
+    """Значение из фиксированного списка, кодируется позицией.
+
+    open=True разрешает значения не из списка: они пишутся как есть, а
+    однобуквенных значений в списке нет, так что коды с ними не путаются.
+    """
+
+    def __init__(self, *values, open=False):
+        self.values = values
+        self.open = open
+        self._codes = {value: ALPHABET[position] for position, value in enumerate(values)}
+        self._values = {code: value for value, code in self._codes.items()}
+
+    def _is_raw(self, value):
+        return self.open and isinstance(value, str) and len(value) > 1 and value.isidentifier()
+
+    def encode(self, value):
+        code = self._codes.get(value)
+        if code is not None:
+            return code
+        if self._is_raw(value):
+            return value
+        raise CodecError(f"Unknown value {value!r}")
+
+    def decode(self, token):
+        value = self._values.get(token)
+        if value is not None:
+            return value
+        if len(token) > 1 and self._is_raw(token):
+            return token
+        raise CodecError(f"Bad token {token!r}")
+
+    def parse(self, text):
+        if text in self._codes or self._is_raw(text):
+            return text
+        raise CodecError(f"Unknown value {text!r}")
+
+
+CATEGORY = Choice('seasonal', 'tables', 'vitamins', 'nutrition', 'diets', open=True)
+GENDER = Choice('male', 'female')
+ACTIVITY = Choice('min', 'low', 'medium', 'high', 'very_high')
+STATS_VIEW = Choice('refresh', 'today', 'week')
+DIRECTION = Choice('older', 'newer')
+SEASON = Choice('spring', 'summer', 'autumn', 'winter')
+
+# Действия версии 1 и типы их аргументов; код действия - позиция в таблице
+ACTIONS = (
+    ('back_to_main', ()),
+    ('tips', ()),
+    ('back_to_menu', ()),
+    ('back_to_tips', ()),
+    ('calculate', ()),
+    ('new_calculation', ()),
+    ('calc_self', ()),
+    ('calc_friend', ()),
+    ('calc_history', ()),
+    ('calc_history_page', (DIRECTION, Int)),
+    ('set_target', ()),
+    ('cancel_set_target', ()),
+    ('confirm_target', (Float,)),
+    ('back_to_weight', ()),
+    ('back_to_gender', ()),
+    ('back_to_age', ()),
+    ('back_to_weight_menu', ()),
+    ('donate', ()),
+    ('donate_amount', (Int,)),
+    ('share_bot', ()),
+    ('about_bot', ()),
+    ('start_new', ()),
+    ('close_reminder', ()),
+    ('stats', (STATS_VIEW,)),
+    ('gender', (GENDER,)),
+    ('activity', (ACTIVITY,)),
+    ('tips_category', (CATEGORY,)),
+    ('tips_prev', (CATEGORY,)),
+    ('tips_next', (CATEGORY,)),
+    ('card_prev', (CATEGORY,)),
+    ('card_next', (CATEGORY,)),
+    ('season', (SEASON,)),
+    # Категория, позиция карточки и ее id: листание без состояния у пользователя
+    ('card', (CATEGORY, Int, Int)),
+    ('tips_card', (CATEGORY, Int, Int)),
+)
+
+_BY_NAME = {name: (ALPHABET[position], fields) for position, (name, fields) in enumerate(ACTIONS)}
+_BY_CODE = {ALPHABET[position]: (name, fields) for position, (name, fields) in enumerate(ACTIONS)}
+
+
+def encode(action, *args):
+    """callback_data для действия с аргументами"""
+    try:
+        code, fields = _BY_NAME[action]
+    except KeyError:
+        raise CodecError(f"Unknown action {action!r}") from None
+    if len(args) != len(fields):
+        raise CodecError(f"{action} takes {len(fields)} arguments, got {len(args)}")
+    data = VERSION + code + SEPARATOR.join(field.encode(arg) for field, arg in zip(fields, args))
+    if len(data.encode('utf-8')) > MAX_BYTES:
+        raise CodecError(f"callback_data for {action} is longer than {MAX_BYTES} bytes")
+    return data
+
+
+def _decode_compact(data):
+    action = _BY_CODE.get(data[1:2])
+    if action is None:
+        return None
+    name, fields = action
+    try:
+        if len(fields) == 1:
+            # Самый частый случай - одно поле, без split
+            return name, (fields[0].decode(data[2:]),)
+        if not fields:
+            return (name, ()) if len(data) == 2 else None
+        tokens = data[2:].split(SEPARATOR)
+        if len(tokens) != len(fields):
+            return None
+        return name, tuple([field.decode(token) for field, token in zip(fields, tokens)])
+    except ValueError:
+        return None
+
+
+# Прежний формат: строка действия целиком или префикс с аргументами через '_'
+LEGACY_EXACT = {
+    'refresh_stats': ('stats', ('refresh',)),
+    'stats_today': ('stats', ('today',)),
+    'stats_week': ('stats', ('week',)),
+}
+LEGACY_EXACT.update((name, (name, ())) for name, fields in ACTIONS if not fields)
+
+
+def _words(*fields):
+    def parse(tail):
+        words = tail.split('_')
+        if len(words) != len(fields):
+            raise CodecError(f"Expected {len(fields)} arguments, got {tail!r}")
+        return tuple(field.parse(word) for field, word in zip(fields, words))
+    return parse
+
+
+def _whole(field):
+    def parse(tail):
+        return (field.parse(tail),)
+    return parse
+
+
+def _gender(tail):
+    # gender_male и gender_male_friend: режим расчета хранится в user_data
+    return (GENDER.parse(tail[:-len('_friend')] if tail.endswith('_friend') else tail),)
+
+
+LEGACY_PREFIXES = {
+    'calc_history_': ('calc_history_page', _words(DIRECTION, Int)),
+    'confirm_target_': ('confirm_target', _words(Float)),
+    'donate_': ('donate_amount', _words(Int)),
+    'gender_': ('gender', _gender),
+    'activity_': ('activity', _whole(ACTIVITY)),
+    'tips_': ('tips_category', _words(CATEGORY)),
+    'prev_': ('tips_prev', _words(CATEGORY)),
+    'next_': ('tips_next', _words(CATEGORY)),
+    'card_prev_': ('card_prev', _words(CATEGORY)),
+    'card_next_': ('card_next', _words(CATEGORY)),
+    'season_': ('season', _words(SEASON)),
+}
+
+
+def _decode_legacy(data):
+    decoded = LEGACY_EXACT.get(data)
+    if decoded is not None:
+        return decoded
+    # Префиксы заканчиваются на '_': пробуем их от самого длинного
+    end = len(data)
+    while True:
+        end = data.rfind('_', 0, end)
+        if end < 0:
+            return None
+        prefix = LEGACY_PREFIXES.get(data[:end + 1])
+        if prefix is not None:
+            name, parse = prefix
+            try:
+                return name, parse(data[end + 1:])
+            except ValueError:
+                return None
+
+
+def is_compact(data):
+    return data[:1] == VERSION
+
+
+def decode(data):
+    """(действие, аргументы) для callback_data или None, если строка не разбирается"""
+    if not data:
+        return None
+    if is_compact(data):
+        return _decode_compact(data)
+    return _decode_legacy(data)
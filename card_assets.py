@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Подготовка картинок карточек заранее, вне бота.
+
+Картинки карточек лежат по внешним ссылкам и в images/ в исходном размере.
+Telegram все равно ужимает фото до 1280 точек по большей стороне, так что
+лишние мегабайты только замедляют загрузку. Конвейер скачивает картинку
+каждой карточки и готовит из нее варианты VARIANTS: уменьшает до стороны
+варианта и пережимает в JPEG (если так выходит меньше исходника). Файлы
+кладутся в ASSETS_DIR под именем из SHA-256 содержимого: одинаковые
+картинки хранятся один раз, а файл с данным именем никогда не меняется.
+
+Путь, хэш, размеры и вес каждого варианта записываются в card_asset_variants,
+а основного варианта photo - еще и в nutrition_cards: его бот загружает с
+диска. Меньшие варианты нужны там, где полный размер не нужен: превью и
+миниатюры (Telegram принимает миниатюры до 320 точек).
+
+Каталог файлов один для конвейера и бота: NUTRIC_ASSETS_DIR (по умолчанию
+data/assets). Pillow указан в requirements.txt; если его нет, файлы
+сохраняются как есть с предупреждением (все варианты - один и тот же
+файл), а размеры читаются из заголовка PNG, JPEG или GIF.
+
+Бот читает файл обычным open(), а не через mmap: InputFile сразу копирует
+содержимое в память, так что отображение файла ничего не экономит.
+
+Запуск: python card_assets.py [--force]
+"""
+
+import argparse
+from collections import namedtuple
+import hashlib
+import io
+import logging
+import os
+import struct
+import tempfile
+
+import httpx
+
+import database
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Без Pillow картинки сохраняются без пережатия
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.environ.get('NUTRIC_ASSETS_DIR', os.path.join(ROOT_DIR, 'data', 'assets'))
+# Больше Telegram фото не показывает, он ужмет его сам
+MAX_SIDE = 1280
+# Варианты картинки: имя и наибольшая сторона. Первый - основной, его отправляет бот
+VARIANTS = (('photo', MAX_SIDE), ('preview', 640), ('thumb', 320))
+JPEG_QUALITY = 85
+FETCH_TIMEOUT = 30
+
+Asset = namedtuple('Asset', ['path', 'digest', 'width', 'height', 'size'])
+
+_EXTENSIONS = ((b'\xff\xd8', '.jpg'), (b'\x89PNG\r\n\x1a\n', '.png'), (b'GIF8', '.gif'))
+# Маркеры JPEG с размерами кадра: SOF0-SOF15, кроме DHT, JPG и DAC
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def asset_path(path):
+    """Полный путь к файлу по пути из nutrition_cards.asset_path"""
+    return os.path.join(ASSETS_DIR, path)
+
+
+def image_extension(data):
+    for magic, extension in _EXTENSIONS:
+        if data.startswith(magic):
+            return extension
+    raise ValueError("Unsupported image format")
+
+
+def image_size(data):
+    """(ширина, высота) из заголовка PNG, JPEG или GIF без декодирования картинки"""
+    extension = image_extension(data)
+    if extension == '.png':
+        return struct.unpack('>II', data[16:24])
+    if extension == '.gif':
+        return struct.unpack('<HH', data[6:10])
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise ValueError("Broken JPEG marker")
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Байты-заполнители перед маркером
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            position += 2
+            continue
+        length, = struct.unpack('>H', data[position + 2:position + 4])
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack('>HH', data[position + 5:position + 9])
+            return width, height
+        position += 2 + length
+    raise ValueError("JPEG without frame header")
+
+
+def fetch(source):
+    """Байты картинки по ссылке или по пути относительно корня проекта"""
+    if source.startswith(('http://', 'https://')):
+        response = httpx.get(source, timeout=FETCH_TIMEOUT, follow_redirects=True)
+        response.raise_for_status()
+        return response.content
+    with open(os.path.join(ROOT_DIR, source), 'rb') as f:
+        return f.read()
+
+
+def _to_rgb(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # У JPEG нет прозрачности: кладем картинку на белый фон
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, 'white')
+        image.paste(rgba, mask=rgba.getchannel('A'))
+        return image
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def _compress(image, data, width, height, max_side):
+    image = image.copy()
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    compressed = output.getvalue()
+    if max(width, height) <= max_side and len(data) <= len(compressed):
+        return data, width, height
+    return (compressed,) + image.size
+
+
+def optimize_variants(data, sides):
+    """[(байты, ширина, высота)] по стороне из sides: самый компактный из исходника и JPEG"""
+    if Image is None:
+        return [(data,) + image_size(data)] * len(sides)
+    with Image.open(io.BytesIO(data)) as source:
+        width, height = source.size
+        # Картинка декодируется один раз, варианты уменьшаются из нее
+        image = _to_rgb(ImageOps.exif_transpose(source))
+        return [_compress(image, data, width, height, side) for side in sides]
+
+
+def optimize(data, max_side=MAX_SIDE):
+    """(байты, ширина, высота): картинка не больше max_side в самом компактном из вариантов"""
+    return optimize_variants(data, (max_side,))[0]
+
+
+def store(data, width, height):
+    """Кладет файл под именем из SHA-256 содержимого; уже сохраненный файл не переписывается"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = os.path.join(digest[:2], digest + image_extension(data))
+    full_path = asset_path(path)
+    if not os.path.exists(full_path):
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Пишем во временный файл и переименовываем: бот не увидит недописанный файл
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return Asset(path, digest, width, height, len(data))
+
+
+def build_assets(force=False, fetch=fetch):
+    """Собирает картинки карточек, у которых их еще нет или сменился image_url. Возвращает статистику"""
+    if Image is None:
+        logger.warning("Pillow is not installed, images are stored without resizing")
+    stats = {'built': 0, 'failed': 0, 'source_bytes': 0, 'asset_bytes': 0, 'variant_bytes': 0}
+    names = [name for name, _ in VARIANTS]
+    assets = []
+    for card_id, image_url in database.get_cards_for_assets(force):
+        try:
+            data = fetch(image_url)
+            variants = [store(*variant) for variant in optimize_variants(data, [side for _, side in VARIANTS])]
+        except Exception as e:
+            logger.error(f"Card {card_id}: cannot build image from {image_url}: {e}")
+            stats['failed'] += 1
+            continue
+        assets.append((card_id, image_url, list(zip(names, variants))))
+        stats['built'] += 1
+        stats['source_bytes'] += len(data)
+        # asset_bytes - то, что загружает бот, variant_bytes - все варианты вместе
+        stats['asset_bytes'] += variants[0].size
+        stats['variant_bytes'] += sum(variant.size for variant in variants)
+    if assets:
+        database.save_card_assets(assets)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--force', action='store_true', help="собрать заново все картинки")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    database.init_db()
+    logger.info(f"Assets directory: {ASSETS_DIR}")
+    stats = build_assets(force=args.force)
+    print(f"built {stats['built']}, failed {stats['failed']}, "
+          f"{stats['source_bytes']} -> {stats['asset_bytes']} bytes, all variants {stats['variant_bytes']} bytes")
+
+
+if __name__ == "__main__":
+    main()
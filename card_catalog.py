@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Каталог карточек с советами.
+
+Тексты карточек лежат в data/cards.json, а не в коде: файл читается только при
+первом обращении, поэтому импорт database.py не тратит время и память на десятки
+килобайт литералов. Для проверки "изменился ли каталог" достаточно хэша байтов
+файла, JSON разбирается, только если карточки действительно нужно обновить.
+
+Формат файла: {"version": 1, "cards": [{"title", "image_url", "category",
+"description"}, ...]}, порядок карточек - порядок показа.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+import hashlib
+import json
+import mmap
+import os
+
+CATALOG_VERSION = 1
+CATALOG_PATH = os.environ.get(
+    'NUTRIC_CARDS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cards.json'))
+# NUTRIC_CARDS_MMAP=1 - читать файл через mmap вместо обычного read()
+USE_MMAP = os.environ.get('NUTRIC_CARDS_MMAP', '0') == '1'
+
+CARD_FIELDS = ('title', 'image_url', 'category', 'description')
+
+Catalog = namedtuple('Catalog', ['version', 'cards', 'digest'])
+
+
+def _read_bytes(path, use_mmap):
+    with open(path, 'rb') as f:
+        if use_mmap and os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def catalog_digest(path=None, use_mmap=None):
+    """SHA-256 содержимого файла каталога без разбора JSON"""
+    data = _read_bytes(path or CATALOG_PATH, USE_MMAP if use_mmap is None else use_mmap)
+    return hashlib.sha256(data).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def load_card_catalog(path=None, use_mmap=None):
+    """Загружает каталог один раз за процесс. Карточки - кортежи (title, image_url, category, description)"""
+    data = _read_bytes(path or CATALOG_PATH, USE_MMAP if use_mmap is None else use_mmap)
+    payload = json.loads(data)
+    version = payload.get('version')
+    if version != CATALOG_VERSION:
+        raise ValueError(f"Unsupported card catalog version: {version}")
+    cards = tuple(tuple(card.get(field) for field in CARD_FIELDS) for card in payload['cards'])
+    return Catalog(version, cards, hashlib.sha256(data).hexdigest())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Картинки карточек через кэш file_id Telegram.
+
+Картинка карточки лежит по внешней ссылке (imgur и т.п.). Если отправлять
+ссылку, серверы Telegram каждый раз заново скачивают файл - это медленно и
+иногда заканчивается ошибкой. После первой успешной отправки Telegram
+возвращает file_id загруженного файла: он сохраняется в media_cache по id
+карточки и хэшу картинки, и дальше отправляется только он.
+
+Если для карточки есть подготовленный файл (card_assets.py), при первой
+отправке загружается он с диска, а ключом кэша служит SHA-256 его
+содержимого. Иначе Telegram получает внешнюю ссылку.
+
+Если Telegram перестал принимать file_id (например, сменился токен бота),
+запись удаляется и картинка один раз отправляется заново.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+
+from telegram import InputFile, InputMediaPhoto
+from telegram.error import BadRequest
+
+from async_database import forget_media_file_id, get_media_file_id, save_media_file_id
+from card_assets import asset_path
+
+logger = logging.getLogger(__name__)
+
+# Лимит Telegram на подпись к фото, символов
+CAPTION_LIMIT = 1024
+
+stats = {'cached': 0, 'uploaded': 0, 'uploaded_from_disk': 0, 'stale': 0}
+
+
+def image_hash(image_url):
+    """Ключ версии картинки: другая ссылка - другой файл"""
+    return hashlib.sha256(image_url.encode('utf-8')).hexdigest()
+
+
+def _read_asset(path, attach=False):
+    """Файл ассета для загрузки; attach=True - для InputMediaPhoto, там файл передается ссылкой attach://"""
+    with open(asset_path(path), 'rb') as f:
+        # InputFile читает содержимое сразу, файл можно закрыть
+        return InputFile(f, filename=os.path.basename(path), attach=attach)
+
+
+def _source(card):
+    """(что загрузить, ключ кэша): подготовленный файл, если он есть на диске, иначе ссылка"""
+    path, digest = card[6:8] or (None, None)
+    if path:
+        if os.path.exists(asset_path(path)):
+            return path, digest
+        logger.warning(f"Card {card[0]}: asset {asset_path(path)} is missing, sending image_url")
+    return None, image_hash(card[2])
+
+
+async def _put_photo(message, photo, caption, reply_markup, parse_mode):
+    """Фото в сообщении message: правит фото, а в текстовом сообщении отправляет новое"""
+    if message.photo:
+        media = InputMediaPhoto(photo, caption=caption, parse_mode=parse_mode)
+        return await message.edit_media(media=media, reply_markup=reply_markup)
+    return await message.reply_photo(photo=photo, caption=caption, reply_markup=reply_markup,
+                                     parse_mode=parse_mode)
+
+
+async def show_photo(message, card, caption, reply_markup=None, parse_mode="Markdown"):
+    """Показывает картинку карточки с подписью; карточка - строка кэша карточек
+    (id, title, image_url, category, created_at, description, asset_path, asset_hash)"""
+    card_id, image_url = card[0], card[2]
+    # Проверка и чтение файла с диска блокируют, поэтому идут в потоке, не в цикле событий
+    path, key = await asyncio.to_thread(_source, card)
+    file_id = await get_media_file_id(card_id, key)
+    if file_id:
+        try:
+            sent = await _put_photo(message, file_id, caption, reply_markup, parse_mode)
+            stats['cached'] += 1
+            return sent
+        except BadRequest as e:
+            if 'file identifier' not in str(e).lower():
+                raise
+            logger.warning(f"Cached file_id for card {card_id} rejected: {e}")
+            stats['stale'] += 1
+            await forget_media_file_id(card_id, key)
+
+    if path:
+        photo = await asyncio.to_thread(_read_asset, path, attach=bool(message.photo))
+        sent = await _put_photo(message, photo, caption, reply_markup, parse_mode)
+        stats['uploaded_from_disk'] += 1
+    else:
+        sent = await _put_photo(message, image_url, caption, reply_markup, parse_mode)
+    stats['uploaded'] += 1
+    # edit_media для inline-сообщений возвращает True, а не сообщение
+    photo = getattr(sent, 'photo', None)
+    if photo:
+        # Размеры идут по возрастанию, берем исходный
+        await save_media_file_id(card_id, key, photo[-1].file_id)
+    return sent
+
+
+def metrics():
+    return dict(stats)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Общие фикстуры тестов.
+
+Тесты с базой получают фикстуру temp_db - каталог с новой базой, уже
+прошедшей init_db(). При запуске теста скриптом та же база берется из
+temporary_database().
+"""
+
+from contextlib import contextmanager
+import os
+import tempfile
+
+import pytest
+
+import database
+import db_pool
+
+
+@contextmanager
+def temporary_database():
+    """Переключает пул на новую базу во временном каталоге, после - обратно на основную"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_pool.configure(db_path=os.path.join(tmp, 'test.db'))
+        try:
+            database.init_db()
+            yield tmp
+        finally:
+            # Отложенные события пишутся в тестовую базу, а не в основную
+            database.action_buffer.flush()
+            db_pool.close_pool()
+            db_pool.configure(db_path=db_pool.DEFAULT_DB_PATH)
+            database.invalidate_card_cache()
+
+
+@pytest.fixture
+def temp_db():
+    with temporary_database() as tmp:
+        yield tmp
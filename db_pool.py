@@ -0,0 +1,166 @@
+import os
+import queue
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Путь к базе и размер пула можно переопределить через окружение
+DEFAULT_DB_PATH = os.environ.get('NUTRIC_DB_PATH') or os.path.join(os.getcwd(), 'nutric.db')
+DEFAULT_POOL_SIZE = int(os.environ.get('NUTRIC_DB_POOL_SIZE', 8))
+
+# Настройки, которые применяются к каждому новому соединению
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",   # В режиме WAL достаточно и заметно быстрее FULL
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",     # ~8 МБ кэша страниц на соединение
+    "PRAGMA busy_timeout=5000",
+)
+
+
+class ConnectionPool:
+    """Ограниченный пул долгоживущих соединений SQLite.
+
+    Каждый поток получает соединение в монопольное пользование на время
+    блока ``with pool.connection()``. Вложенные вызовы в том же потоке
+    переиспользуют уже выданное соединение, а фиксация транзакции
+    происходит при выходе из внешнего блока.
+    """
+
+    def __init__(self, db_path, max_size=DEFAULT_POOL_SIZE, timeout=30.0):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._closed = False
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        if self.db_path != ':memory:':
+            conn.execute("PRAGMA journal_mode=WAL")
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def _acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(
+                f"No free database connections after {self.timeout}s (pool size {self.max_size})"
+            )
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._open()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn):
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Выдает соединение текущему потоку и управляет транзакцией"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            # Вложенный вызов: транзакцией управляет внешний блок
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._release(conn)
+
+    def close(self):
+        """Закрывает все соединения пула"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_db_path = DEFAULT_DB_PATH
+_pool_size = DEFAULT_POOL_SIZE
+
+
+def configure(db_path=None, pool_size=None):
+    """Меняет путь к базе и/или размер пула, закрывая текущий пул"""
+    global _pool, _db_path, _pool_size
+    with _pool_lock:
+        if db_path is not None:
+            _db_path = db_path
+        if pool_size is not None:
+            _pool_size = pool_size
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+    logger.info(f"Database configured: path={_db_path}, pool_size={_pool_size}")
+
+
+def get_db_path():
+    return _db_path
+
+
+def get_pool():
+    global _pool
+    pool = _pool
+    if pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(_db_path, _pool_size)
+            pool = _pool
+    return pool
+
+
+def connection():
+    """Контекстный менеджер для работы с базой через общий пул"""
+    return get_pool().connection()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Реестр inline-клавиатур бота.
+
+Постоянные клавиатуры собираются один раз при импорте и отдаются всем
+обработчикам одним и тем же объектом: в python-telegram-bot 20 кнопки и
+разметка заморожены, поэтому общий объект безопасно отправлять в разные чаты.
+Клавиатуры, зависящие от данных (навигация по карточкам, страницы истории),
+несут нужную позицию в callback_data, собираются из общих кнопок и берутся
+из ограниченного LRU-кэша.
+callback_data кнопок записывается в компактном формате callback_codec.
+"""
+
+from functools import lru_cache
+import os
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callback_codec import encode
+
+# Сколько вариантов каждой динамической клавиатуры держать в памяти
+KEYBOARD_CACHE_SIZE = int(os.environ.get('KEYBOARD_CACHE_SIZE', 256))
+
+
+def button(text, action, *args):
+    """Кнопка с действием из таблицы callback_codec"""
+    return InlineKeyboardButton(text, callback_data=encode(action, *args))
+
+
+def markup(*rows):
+    """Клавиатура из рядов; ряд - кнопка или кортеж кнопок"""
+    return InlineKeyboardMarkup([row if isinstance(row, tuple) else (row,) for row in rows])
+
+
+# Общие кнопки
+CALCULATE = button("🎯 Рассчитать норму", "calculate")
+DONATE = button("💝 Поддержать бота", "donate")
+BACK = button("◀️ Назад", "back_to_main")
+BACK_TO_MAIN = button("◀️ Назад в меню", "back_to_main")
+BACK_TO_TIPS = button("◀️ Назад", "back_to_tips")
+CARD_BACK_TO_TIPS = button("🔙 Назад в меню", "back_to_tips")
+START_NEW = button("🔄 Начать заново", "start_new")
+STATS_TODAY = button("📅 За сегодня", "stats", "today")
+STATS_WEEK = button("📊 За неделю", "stats", "week")
+
+# Постоянные клавиатуры
+MAIN_MENU = markup(
+    CALCULATE,
+    button("📋 История расчетов", "calc_history"),
+    DONATE,
+)
+DONATION_AMOUNTS = markup(
+    button("300 ₽", "donate_amount", 300),
+    button("500 ₽", "donate_amount", 500),
+    button("1000 ₽", "donate_amount", 1000),
+    BACK_TO_MAIN,
+)
+ACTIVITY_BUTTONS = (
+    button("Минимальная", "activity", "min"),
+    button("Низкая", "activity", "low"),
+    button("Средняя", "activity", "medium"),
+    button("Высокая", "activity", "high"),
+    button("Очень высокая", "activity", "very_high"),
+)
+ACTIVITY = markup(*ACTIVITY_BUTTONS, BACK)
+# После ввода возраста назад ведет к возрасту, а не в меню
+ACTIVITY_AFTER_AGE = markup(*ACTIVITY_BUTTONS, button("◀️ Назад к возрасту", "back_to_age"))
+STATS = markup(button("🔄 Обновить", "stats", "refresh"), STATS_TODAY, STATS_WEEK)
+STATS_PERIOD = markup(button("📊 Общая статистика", "stats", "refresh"), STATS_TODAY, STATS_WEEK)
+ABOUT = markup(DONATE, button("📢 Поделиться ботом", "share_bot"), BACK)
+CALC_MODE = markup(button("Для себя", "calc_self"), button("Для друга", "calc_friend"), BACK)
+# Для себя и для друга кнопки одни: режим расчета хранится в user_data
+GENDER_BUTTONS = (button("Мужской", "gender", "male"), button("Женский", "gender", "female"))
+GENDER = markup(*GENDER_BUTTONS, BACK)
+GENDER_AGAIN = markup(*GENDER_BUTTONS, BACK_TO_MAIN)
+TO_MAIN = markup(BACK_TO_MAIN)
+TO_GENDER = markup(button("◀️ Назад к выбору пола", "back_to_gender"))
+TO_WEIGHT = markup(button("◀️ Назад к весу", "back_to_weight"))
+# Из ввода возраста назад ведет к росту: callback тот же, что у "Назад к весу"
+TO_HEIGHT = markup(button("◀️ Назад к росту", "back_to_weight"))
+TO_WEIGHT_MENU = markup(button("◀️ Назад в Управление весом", "back_to_weight_menu"))
+TARGET_ERROR = markup(
+    CALCULATE,
+    button("📚 Полезное", "tips"),
+    button("ℹ️ О боте", "about_bot"),
+    DONATE,
+)
+HISTORY_EMPTY = markup(CALCULATE)
+TIPS = markup(
+    button("🌱 Сезонные продукты", "tips_category", "seasonal"),
+    button("📋 Таблички", "tips_category", "tables"),
+    BACK,
+)
+TIPS_MENU = markup(button("📊 Трекеры", "tips_category", "tables"), BACK_TO_MAIN)
+SHARE_BOT = markup(button("ℹ️ О боте", "about_bot"), BACK)
+REMINDER = markup(START_NEW, button("❌ Закрыть", "close_reminder"))
+HELP = markup(START_NEW, BACK)
+SEASONAL_SUBMENU = markup(
+    button("Весна", "season", "spring"),
+    button("Лето", "season", "summer"),
+    button("Осень", "season", "autumn"),
+    button("Зима", "season", "winter"),
+    BACK_TO_TIPS,
+)
+TABLES_SUBMENU = markup(BACK_TO_TIPS)
+
+# Все постоянные клавиатуры по именам, для проверок и статистики
+REGISTRY = {name: value for name, value in globals().items()
+            if name.isupper() and isinstance(value, InlineKeyboardMarkup)}
+
+
+# Динамические клавиатуры
+def _card_arrows(action, category, previous, following):
+    """Стрелки к соседним карточкам; сосед - (позиция, id карточки) или None"""
+    arrows = []
+    if previous is not None:
+        arrows.append(button("◀️", action, category, *previous))
+    if following is not None:
+        arrows.append(button("▶️", action, category, *following))
+    return arrows
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def tips_navigation(category, previous=None, following=None):
+    """Стрелки по карточкам категории и кнопка возврата"""
+    arrows = _card_arrows("tips_card", category, previous, following)
+    rows = [tuple(arrows)] if arrows else []
+    return markup(*rows, button("🔙 Назад в меню", "back_to_menu"))
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def card_browser(category, previous=None, following=None):
+    """Стрелки по карточкам категории и возврат в меню советов"""
+    return markup(*_card_arrows("card", category, previous, following), CARD_BACK_TO_TIPS)
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def card_navigation(card_type):
+    return markup(
+        button("◀️ Предыдущая карточка", "card_prev", card_type),
+        button("▶️ Следующая карточка", "card_next", card_type),
+        button("◀️ Назад в Полезное", "back_to_tips"),
+    )
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def history_navigation(newer_id=None, older_id=None):
+    """Страница истории: соседние страницы по id крайних записей"""
+    navigation = []
+    if newer_id is not None:
+        navigation.append(button("⬅️ Новее", "calc_history_page", "newer", newer_id))
+    if older_id is not None:
+        navigation.append(button("Старее ➡️", "calc_history_page", "older", older_id))
+    rows = [tuple(navigation)] if navigation else []
+    return markup(*rows, CALCULATE, DONATE)
+
+
+_PAYMENT_TAIL = (button("◀️ Назад к выбору суммы", "donate"), BACK_TO_MAIN)
+
+
+def payment(url):
+    """Ссылка на оплату своя у каждого платежа, поэтому не кэшируется"""
+    return markup(InlineKeyboardButton("💳 Оплатить", url=url), *_PAYMENT_TAIL)
+
+
+DYNAMIC = (tips_navigation, card_browser, card_navigation, history_navigation)
+
+
+def metrics():
+    result = {'static': len(REGISTRY)}
+    for function in DYNAMIC:
+        info = function.cache_info()
+        result[function.__name__] = {'hits': info.hits, 'misses': info.misses, 'size': info.currsize}
+    return result
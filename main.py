@@ -1,25 +1,33 @@
 import os
 import logging
 import asyncio
+from functools import partial
 from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, CallbackQuery
+from telegram import Update
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
-from telegram.error import NetworkError, TimedOut, TelegramError
-from keep_alive import keep_alive
-from database import (
-    init_db, save_user_params, get_user_params,
-    save_calculation_results, get_calculation_history, 
-    set_target_weight, get_target_weight, get_last_calculation,
-    track_user_action, register_user, get_user_statistics, format_statistics_message,
-    get_nutrition_cards, save_weight, get_weight_history,
-    clear_all_nutrition_cards, add_vitamin_cards, add_seasonal_cards, 
-    add_nutrition_cards, add_diet_cards
+from telegram.error import NetworkError, TimedOut
+from webserver import WebServer, webhook_handler
+from update_processor import PerUserUpdateProcessor
+from persistence import SQLitePersistence
+from database import init_db, format_statistics_message, card_page
+from nutrition import get_nutrition_report
+from messages import render_history
+from router import CallbackRouter
+import card_media
+import keyboards
+from async_database import (
+    get_user_params,
+    save_calculation_results, get_calculation_page,
+    set_target_weight,
+    track_user_action, register_user, get_user_statistics,
+    get_nutrition_cards,
+    get_daily_stats, get_popular_actions, get_payment_link, save_payment_link, set_payment_link_status,
+    record_payment,
+    shutdown as shutdown_database
 )
-from datetime import datetime
-import sqlite3
-from yookassa import Configuration, Payment
-from yookassa_payment import YooKassaPayment
-import uuid
+import secrets
+import signal
+from yookassa_payment import PaymentError, YooKassaPayment, notification_handler
 
 # Настройка логирования
 logging.basicConfig(
@@ -34,6 +42,20 @@ TOKEN = os.environ.get('TELEGRAM_TOKEN')
 YOOKASSA_SHOP_ID = os.environ.get('YOOKASSA_SHOP_ID')
 YOOKASSA_SECRET_KEY = os.environ.get('YOOKASSA_SECRET_KEY')
 
+# Режим webhook включается, если задан публичный адрес бота (https://...).
+# Без него бот работает через long polling, как раньше
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/telegram')
+# Секрет, который Telegram присылает в каждом запросе. Если не задан, генерируется при запуске
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', 8080))
+# Сколько апдейтов разных пользователей обрабатывается одновременно.
+# Апдейты одного пользователя всегда идут по очереди (см. scheduler.py)
+CONCURRENT_UPDATES = int(os.environ.get('CONCURRENT_UPDATES', 16))
+# Адрес для HTTP-уведомлений YooKassa (в личном кабинете: https://<адрес бота>/yookassa/notify)
+YOOKASSA_NOTIFY_PATH = os.environ.get('YOOKASSA_NOTIFY_PATH', '/yookassa/notify')
+
 # Проверка наличия необходимых переменных окружения
 if not all([TOKEN, YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY]):
     logger.error("Missing required environment variables!")
@@ -42,65 +64,23 @@ if not all([TOKEN, YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY]):
     logger.error(f"YOOKASSA_SECRET_KEY: {'Present' if YOOKASSA_SECRET_KEY else 'Missing'}")
     raise ValueError("Missing required environment variables!")
 
-# Настройка YooKassa
-Configuration.account_id = YOOKASSA_SHOP_ID
-Configuration.secret_key = YOOKASSA_SECRET_KEY
-
-# Инициализация YooKassa
-yookassa = YooKassaPayment()
-
-# Константы для callback_data
-CALLBACK = {
-    'MAIN_MENU': 'back_to_main',
-    'TIPS_MENU': 'tips',
-    'BACK_TO_TIPS': 'back_to_tips',
-    'CALCULATE': 'calculate',
-    'CALC_HISTORY': 'calc_history',
-    'SET_TARGET': 'set_target',
-    'DONATE': 'donate',
-    'SHARE_BOT': 'share_bot',
-    'TIPS': 'tips'
-}
-
-# Функции для создания клавиатур
+# Инициализация YooKassa (асинхронный клиент, соединения открываются при первом платеже)
+yookassa = YooKassaPayment(YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY)
+
+# callback_data кнопок - действия из таблицы callback_codec, обработчики задает build_router
+
+# Клавиатуры берутся из реестра keyboards.py, постоянные собраны один раз при импорте
 def get_main_menu_keyboard():
-    """Создает клавиатуру главного меню"""
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("🎯 Рассчитать норму", callback_data="calculate")],
-        [InlineKeyboardButton("📋 История расчетов", callback_data="calc_history")],
-        [InlineKeyboardButton("💝 Поддержать бота", callback_data="donate")]
-    ])
-
-def get_tips_menu_keyboard(category, current_index=0):
-    """Создает клавиатуру для меню карточек"""
-    keyboard = []
-    
-    # Получаем карточки для категории
-    cards = get_nutrition_cards(category)
-    total_cards = len(cards)
-    
-    if total_cards > 0:
-        # Добавляем кнопки навигации
-        nav_buttons = []
-        if current_index > 0:
-            nav_buttons.append(InlineKeyboardButton("◀️", callback_data=f"prev_{category}"))
-        if current_index < total_cards - 1:
-            nav_buttons.append(InlineKeyboardButton("▶️", callback_data=f"next_{category}"))
-        if nav_buttons:
-            keyboard.append(nav_buttons)
-        
-        # Добавляем кнопку возврата в меню
-        keyboard.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
-    
-    return InlineKeyboardMarkup(keyboard)
+    """Клавиатура главного меню"""
+    return keyboards.MAIN_MENU
+
+def get_tips_menu_keyboard(category, previous=None, following=None):
+    """Клавиатура для меню карточек; соседи - (позиция, id карточки)"""
+    return keyboards.tips_navigation(category, previous, following)
 
 def get_card_navigation_keyboard(card_type):
-    """Создает клавиатуру для навигации по карточкам"""
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("◀️ Предыдущая карточка", callback_data=f"card_prev_{card_type}")],
-        [InlineKeyboardButton("▶️ Следующая карточка", callback_data=f"card_next_{card_type}")],
-        [InlineKeyboardButton("◀️ Назад в Полезное", callback_data=CALLBACK['BACK_TO_TIPS'])]
-    ])
+    """Клавиатура для навигации по карточкам"""
+    return keyboards.card_navigation(card_type)
 
 # Функции для создания сообщений
 def get_main_menu_message(last_calculation=None):
@@ -151,99 +131,68 @@ async def safe_edit_message(message, text, reply_markup=None, parse_mode="Markdo
         except Exception as e:
             logger.error(f"Error sending new message: {e}")
 
-# Функция для безопасного редактирования медиа
-async def safe_edit_media(message, media, reply_markup=None):
-    """Безопасно редактирует медиа-сообщение с обработкой ошибок"""
+# Функция для безопасного показа картинки карточки
+async def safe_edit_media(message, card, caption, reply_markup=None):
+    """Безопасно показывает картинку карточки (через кэш file_id) с обработкой ошибок"""
     try:
-        await message.edit_media(
-            media=media,
-            reply_markup=reply_markup
-        )
+        await card_media.show_photo(message, card, caption, reply_markup=reply_markup)
     except Exception as e:
-        logger.error(f"Error editing media: {e}")
-        try:
-            await message.reply_photo(
-                photo=media.media,
-                caption=media.caption,
-                reply_markup=reply_markup,
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Error sending new media: {e}")
-            # Если не удалось отправить медиа, отправляем текст
-            await safe_edit_message(
-                message,
-                media.caption,
-                reply_markup=reply_markup
-            )
+        logger.error(f"Error sending card media: {e}")
+        # Если не удалось отправить медиа, отправляем текст
+        await safe_edit_message(message, caption, reply_markup=reply_markup)
 
-async def create_payment(amount, description):
-    """Создание платежа через YooKassa"""
-    try:
-        logger.info(f"Creating payment for amount: {amount} RUB")
-        logger.info(f"Using shop_id: {YOOKASSA_SHOP_ID}")
-        
-        payment = Payment.create({
-            "amount": {
-                "value": str(amount),
-                "currency": "RUB"
-            },
-            "confirmation": {
-                "type": "redirect",
-                "return_url": "https://t.me/norma_zhora_bot"
-            },
-            "capture": True,
-            "description": description,
-            "metadata": {
-                "order_id": str(uuid.uuid4())
-            }
-        })
-        
-        if payment and payment.confirmation and payment.confirmation.confirmation_url:
-            logger.info(f"Payment created successfully. Confirmation URL: {payment.confirmation.confirmation_url}")
-            return payment
-        else:
-            logger.error("Payment created but confirmation URL is missing")
-            return None
-            
-    except Exception as e:
-        logger.error(f"Error creating payment: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        logger.error(f"Error details: {e.__dict__ if hasattr(e, '__dict__') else 'No details available'}")
-        return None
+async def show_card(message, card, reply_markup=None):
+    """Карточка с картинкой, если подпись укладывается в лимит Telegram, иначе текстом"""
+    caption = card_caption(card)
+    if card[2] and len(caption) <= card_media.CAPTION_LIMIT:
+        await safe_edit_media(message, card, caption, reply_markup=reply_markup)
+    else:
+        await safe_edit_message(message, caption, reply_markup=reply_markup)
 
 async def handle_donation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатия на кнопку поддержки бота"""
     query = update.callback_query
     await query.answer()
-    keyboard = [
-        [InlineKeyboardButton("300 ₽", callback_data="donate_300")],
-        [InlineKeyboardButton("500 ₽", callback_data="donate_500")],
-        [InlineKeyboardButton("1000 ₽", callback_data="donate_1000")],
-        [InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.DONATION_AMOUNTS
     await query.message.reply_text(
         "💝 *Поддержка бота*\n\nВыбери сумму доната:",
         reply_markup=reply_markup,
         parse_mode="Markdown"
     )
 
+async def reusable_payment_link(user_id, amount):
+    """Ссылка на неоплаченный платеж той же суммы, если он все еще ждет оплаты"""
+    link = await get_payment_link(user_id, amount)
+    if link is None:
+        return None
+    payment_id, payment_url = link
+    # Уведомление об оплате или отмене могло не дойти: сверяем статус с YooKassa
+    try:
+        payment = await yookassa.get_payment(payment_id)
+    except PaymentError as e:
+        logger.warning(f"Cannot check payment {payment_id}, creating a new one: {e}")
+        return None
+    if payment.status != 'pending':
+        await set_payment_link_status(payment_id, payment.status)
+        return None
+    return payment_url
+
 async def process_donation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик выбора суммы доната"""
     query = update.callback_query
     await query.answer()
-    amount = int(query.data.split('_')[1])
+    amount = context.args[0]
     user_id = update.effective_user.id
     try:
-        payment = yookassa.create_payment(amount, f"Донат для бота НормаЖора - {amount} ₽")
-        payment_url = payment.confirmation.confirmation_url
-        keyboard = [
-            [InlineKeyboardButton("💳 Оплатить", url=payment_url)],
-            [InlineKeyboardButton("◀️ Назад к выбору суммы", callback_data="donate")],
-            [InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Повторное нажатие той же суммы отдает еще не оплаченную ссылку вместо нового платежа
+        payment_url = await reusable_payment_link(user_id, amount)
+        if payment_url is None:
+            payment = await yookassa.create_payment(amount, f"Донат для бота НормаЖора - {amount} ₽", user_id=user_id)
+            if payment is None:
+                raise RuntimeError("payment was not created")
+            payment_url = payment.confirmation_url
+            await save_payment_link(user_id, amount, payment.id, payment_url)
+        reply_markup = keyboards.payment(payment_url)
         await query.message.reply_text(
             f"💝 *Поддержка бота*\n\nСумма: {amount} ₽\n\nНажми на кнопку ниже, чтобы перейти к оплате:",
             reply_markup=reply_markup,
@@ -256,293 +205,12 @@ async def process_donation(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_main_menu_keyboard()
         )
 
-# Инициализация базы данных при запуске
+# Инициализация базы данных при запуске (карточки обновляются, только если каталог изменился)
 init_db()
 
-# Очищаем все карточки и добавляем новые
-clear_all_nutrition_cards()
-add_vitamin_cards()
-add_seasonal_cards()  # Добавляем карточки с сезонными продуктами
-add_nutrition_cards()  # Добавляем карточки о питании
-add_diet_cards()  # Добавляем карточки с диетами
-
-# Константы для уровней активности
-ACTIVITY_LEVELS = {
-    "минимальная": 1.2,
-    "низкая": 1.375,
-    "средняя": 1.55,
-    "высокая": 1.725,
-    "очень высокая": 1.9
-}
-
 def get_activity_keyboard():
-    """Создает клавиатуру для выбора уровня активности"""
-    keyboard = [
-        [InlineKeyboardButton("Минимальная", callback_data="activity_min")],
-        [InlineKeyboardButton("Низкая", callback_data="activity_low")],
-        [InlineKeyboardButton("Средняя", callback_data="activity_medium")],
-        [InlineKeyboardButton("Высокая", callback_data="activity_high")],
-        [InlineKeyboardButton("Очень высокая", callback_data="activity_very_high")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-def calculate_nutrition_norms(weight, height, age, gender, activity_level):
-    """Рассчитывает нормы питания"""
-    # Базовый обмен веществ (формула Миффлина-Сан Жеора)
-    if gender == "мужской":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-        
-    # Умножаем на коэффициент активности
-    activity_multiplier = ACTIVITY_LEVELS.get(activity_level, 1.55)
-    maintenance_calories = bmr * activity_multiplier
-    
-    # Рассчитываем дефицит и профицит
-    deficit_calories_15 = maintenance_calories * 0.85
-    deficit_calories_20 = maintenance_calories * 0.8
-    surplus_calories = maintenance_calories * 1.1
-    
-    # Рассчитываем БЖУ согласно научным рекомендациям с учетом возраста
-    # Определяем возрастную категорию
-    if age < 18:
-        age_category = "подросток"
-    elif age < 30:
-        age_category = "молодой"
-    elif age < 50:
-        age_category = "средний"
-    elif age < 65:
-        age_category = "зрелый"
-    else:
-        age_category = "пожилой"
-    
-    # Белки: современные рекомендации с учетом возраста, пола, активности и климакса
-    # Базовые нормы по возрасту (г/кг веса)
-    base_protein_multipliers = {
-        "подросток": (1.8, 2.2),  # Высокая потребность для роста и развития
-        "молодой": (1.8, 2.2),    # Стандартные рекомендации для активного возраста
-        "средний": (1.8, 2.0),    # Поддержание мышечной массы
-        "зрелый": (1.8, 2.0),     # Увеличенная потребность для предотвращения саркопении
-        "пожилой": (1.6, 1.8)     # Минимальные для поддержания здоровья, но достаточные
-    }
-    
-    # Корректировка по полу
-    gender_protein_multiplier = {
-        "мужской": 1.05,  # Мужчинам нужно немного больше белка
-        "женский": 1.0
-    }
-    
-    # Корректировка по уровню активности
-    activity_protein_multiplier = {
-        "минимальная": 1.0,      # Сидячий образ жизни
-        "низкая": 1.05,          # Легкие тренировки
-        "средняя": 1.1,          # Умеренные тренировки
-        "высокая": 1.15,         # Интенсивные тренировки
-        "очень высокая": 1.2     # Ежедневные интенсивные тренировки
-    }
-    
-    # Корректировка по климаксу для женщин (45-55 лет - перименопауза, 55+ - постменопауза)
-    menopause_multiplier = 1.0
-    if gender == "женский":
-        if age >= 45 and age <= 55:
-            menopause_multiplier = 1.1  # Перименопауза: повышенная потребность в белке
-        elif age > 55:
-            menopause_multiplier = 1.15  # Постменопауза: еще больше белка для предотвращения остеопороза
-    
-    # Получаем базовые множители для возраста
-    protein_min_mult, protein_max_mult = base_protein_multipliers.get(age_category, (1.8, 2.2))
-    
-    # Применяем корректировки по полу, активности и климаксу
-    gender_mult = gender_protein_multiplier.get(gender, 1.0)
-    activity_mult = activity_protein_multiplier.get(activity_level, 1.1)
-    
-    # Рассчитываем финальные нормы белков
-    protein_min = weight * protein_min_mult * gender_mult * activity_mult * menopause_multiplier
-    protein_max = weight * protein_max_mult * gender_mult * activity_mult * menopause_multiplier
-    
-    # Жиры: корректировка по полу, возрасту и климаксу
-    if gender == "мужской":
-        if age < 18:
-            fat_percentage_min, fat_percentage_max = 0.25, 0.35  # Подростки: больше жиров
-        elif age < 30:
-            fat_percentage_min, fat_percentage_max = 0.20, 0.30  # Молодые мужчины
-        elif age < 50:
-            fat_percentage_min, fat_percentage_max = 0.20, 0.30  # Средний возраст
-        else:
-            fat_percentage_min, fat_percentage_max = 0.25, 0.35  # Пожилые: больше жиров
-        fat_min_per_kg = 0.8
-    else:
-        # Учет климакса для женщин
-        if age < 18:
-            fat_percentage_min, fat_percentage_max = 0.30, 0.40  # Подростки: больше жиров
-        elif age < 30:
-            fat_percentage_min, fat_percentage_max = 0.25, 0.35  # Молодые женщины
-        elif age < 45:
-            fat_percentage_min, fat_percentage_max = 0.25, 0.35  # Средний возраст
-        elif age < 55:
-            # Перименопауза: немного больше жиров для гормональной поддержки
-            fat_percentage_min, fat_percentage_max = 0.30, 0.40
-        else:
-            # Постменопауза: больше жиров для усвоения жирорастворимых витаминов
-            fat_percentage_min, fat_percentage_max = 0.30, 0.40
-        fat_min_per_kg = 0.9
-    
-    # Рассчитываем жиры от калорийности
-    fat_min_calories = maintenance_calories * fat_percentage_min
-    fat_max_calories = maintenance_calories * fat_percentage_max
-    fat_min = max(fat_min_calories / 9, weight * fat_min_per_kg)  # Минимум из расчета и веса
-    fat_max = fat_max_calories / 9
-    
-    # Углеводы: оставшиеся калории после белков и жиров
-    # Используем дефицит калорий для расчета углеводов
-    protein_calories_min = protein_min * 4
-    protein_calories_max = protein_max * 4
-    fat_calories_min = fat_min * 9
-    fat_calories_max = fat_max * 9
-    
-    # Углеводы для дефицита (похудение)
-    remaining_calories_deficit = deficit_calories_15 - protein_calories_min - fat_calories_min
-    carbs_min = max(remaining_calories_deficit / 4, 50)  # Минимум 50г углеводов
-    
-    # Углеводы для профицита (набор массы)
-    remaining_calories_surplus = surplus_calories - protein_calories_max - fat_calories_max
-    carbs_max = remaining_calories_surplus / 4
-    
-    # Рассчитываем ИМТ
-    height_m = height / 100
-    bmi = weight / (height_m * height_m)
-    
-    # Определяем категорию ИМТ
-    if bmi < 18.5:
-        bmi_category = "Недостаточный вес"
-    elif bmi < 25:
-        bmi_category = "Нормальный вес"
-    elif bmi < 30:
-        bmi_category = "Избыточный вес"
-    else:
-        bmi_category = "Ожирение"
-        
-    # Рассчитываем норму воды согласно научным рекомендациям с учетом возраста, пола, активности и климакса
-    # Базовая норма: 30-35мл на кг веса
-    
-    # Корректировка по полу
-    if gender == "мужской":
-        water_multiplier = 1.1  # Мужчинам нужно больше воды
-    else:
-        water_multiplier = 1.0
-    
-    # Корректировка по возрасту (используем уже определенную age_category)
-    age_water_multipliers = {
-        "подросток": 1.1,    # Подростки: повышенная потребность в воде
-        "молодой": 1.0,      # Молодые: стандартная норма
-        "средний": 0.95,     # Средний возраст: небольшое снижение
-        "зрелый": 0.9,       # Зрелый возраст: снижение потребности
-        "пожилой": 0.85      # Пожилые: значительное снижение
-    }
-    age_multiplier = age_water_multipliers.get(age_category, 1.0)
-    
-    # Корректировка по активности
-    activity_water_multiplier = {
-        "минимальная": 1.0,
-        "низкая": 1.05,
-        "средняя": 1.1,
-        "высокая": 1.15,
-        "очень высокая": 1.2
-    }.get(activity_level, 1.1)
-    
-    # Корректировка по климаксу для женщин
-    menopause_water_multiplier = 1.0
-    if gender == "женский":
-        if age >= 45 and age <= 55:
-            menopause_water_multiplier = 1.05  # Перименопауза: немного больше воды
-        elif age > 55:
-            menopause_water_multiplier = 1.1   # Постменопауза: больше воды для вывода токсинов
-    
-    # Базовая норма воды в зависимости от возраста
-    base_water_per_kg = 30
-    
-    # Рассчитываем норму воды
-    water_norm_min = weight * base_water_per_kg * water_multiplier * age_multiplier * activity_water_multiplier * menopause_water_multiplier
-    water_norm_max = water_norm_min * 1.1  # +10% для индивидуальных различий
-    
-    # Рассчитываем рекомендуемые шаги с учетом возраста, пола и активности
-    # Базовые нормы шагов
-    base_steps = {
-        "минимальная": 6000,
-        "низкая": 8000,
-        "средняя": 10000,
-        "высокая": 12000,
-        "очень высокая": 15000
-    }
-    
-    # Корректировка по возрасту
-    age_steps_multiplier = {
-        "подросток": 1.1,    # Подростки: больше активности
-        "молодой": 1.0,      # Молодые: стандартная норма
-        "средний": 0.95,     # Средний возраст: небольшое снижение
-        "зрелый": 0.9,       # Зрелый возраст: снижение активности
-        "пожилой": 0.8       # Пожилые: значительное снижение
-    }.get(age_category, 1.0)
-    
-    # Корректировка по полу
-    gender_steps_multiplier = {
-        "мужской": 1.05,  # Мужчинам рекомендуется больше шагов
-        "женский": 1.0
-    }.get(gender, 1.0)
-    
-    # Корректировка по климаксу для женщин
-    menopause_steps_multiplier = 1.0
-    if gender == "женский":
-        if age >= 45 and age <= 55:
-            menopause_steps_multiplier = 0.95  # Перименопауза: немного меньше активности
-        elif age > 55:
-            menopause_steps_multiplier = 0.9   # Постменопауза: снижение активности
-    
-    # Рассчитываем рекомендуемые шаги
-    base_steps_for_activity = base_steps.get(activity_level, 10000)
-    recommended_steps_min = int(base_steps_for_activity * age_steps_multiplier * gender_steps_multiplier * menopause_steps_multiplier * 0.9)
-    recommended_steps_max = int(base_steps_for_activity * age_steps_multiplier * gender_steps_multiplier * menopause_steps_multiplier * 1.1)
-    
-    return {
-        'bmr': round(bmr),
-        'maintenance_calories': round(maintenance_calories),
-        'deficit_calories_15': round(deficit_calories_15),
-        'deficit_calories_20': round(deficit_calories_20),
-        'surplus_calories': round(surplus_calories),
-        'protein_min': round(protein_min),
-        'protein_max': round(protein_max),
-        'fat_min': round(fat_min),
-        'fat_max': round(fat_max),
-        'carbs_min': round(carbs_min),
-        'carbs_max': round(carbs_max),
-        'bmi': round(bmi, 1),
-        'bmi_category': bmi_category,
-        'water_norm_min': round(water_norm_min),
-        'water_norm_max': round(water_norm_max),
-        'recommended_steps_min': recommended_steps_min,
-        'recommended_steps_max': recommended_steps_max
-    }
-
-def format_calculation_results(results):
-    """Форматирует результаты расчета в текст"""
-    return (
-        f"📊 *Результаты расчета*\n\n"
-        f"• Базовый обмен веществ: {results['bmr']} ккал\n"
-        f"• Норма калорий для поддержания текущего веса: {results['maintenance_calories']} ккал\n"
-        f"• Безопасный дефицит 15% для похудения: {results['deficit_calories_15']} ккал\n"
-        f"• Дефицит 20%: {results['deficit_calories_20']} ккал\n"
-        f"• Профицит 10%: {results['surplus_calories']} ккал\n\n"
-        f"🥗 *Рекомендуемые БЖУ:*\n"
-        f"🥩 *Белки:* {results['protein_min']}-{results['protein_max']}г\n"
-        f"🥑 *Жиры:* {results['fat_min']}-{results['fat_max']}г\n"
-        f"🍚 *Углеводы:* {results['carbs_min']}-{results['carbs_max']}г\n\n"
-        f"💧 *Норма воды:*\n"
-        f"• {results['water_norm_min']}-{results['water_norm_max']}мл в день\n"
-        f"• Это примерно {int(results['water_norm_min']/250)}-{int(results['water_norm_max']/250)} стаканов\n\n"
-        f"👣 *Рекомендуемые шаги:* {results['recommended_steps_min']}-{results['recommended_steps_max']}\n\n"
-        f"📏 *ИМТ:* {results['bmi']} ({results['bmi_category']})"
-    )
+    """Клавиатура для выбора уровня активности"""
+    return keyboards.ACTIVITY
 
 async def calculate_norm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Рассчитывает нормы питания на основе введенных параметров"""
@@ -565,7 +233,7 @@ async def calculate_norm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Рассчитываем нормы
-    results = calculate_nutrition_norms(
+    results, message = get_nutrition_report(
         weight=float(weight),
         height=float(height),
         age=int(age),
@@ -583,10 +251,8 @@ async def calculate_norm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         'activity_level': activity_level
     }
     
-    save_calculation_results(user_id, results, params)
+    await save_calculation_results(user_id, results, params)
     
-    # Формируем сообщение с результатами
-    message = format_calculation_results(results)
     
     # Отправляем результаты
     await query.message.edit_text(
@@ -621,14 +287,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = user.id
     
     # Регистрируем пользователя
-    register_user(user_id, user.username, user.first_name, user.last_name)
+    await register_user(user_id, user.username, user.first_name, user.last_name)
     
     # Отслеживаем действие
-    track_user_action(user_id, "start_bot")
+    await track_user_action(user_id, "start_bot")
     
     context.user_data.pop("activity_keyboard_shown", None)
     keyboard = get_main_menu_keyboard()
-    await update.message.reply_text(
+    # Вызывается и по кнопке "Начать заново", тогда update.message нет
+    await update.effective_message.reply_text(
         get_main_menu_message(),
         reply_markup=keyboard,
         parse_mode='Markdown'
@@ -650,15 +317,10 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Получаем статистику
-    stats = get_user_statistics()
+    stats = await get_user_statistics()
     message = format_statistics_message(stats)
     
-    keyboard = [
-        [InlineKeyboardButton("🔄 Обновить", callback_data="refresh_stats")],
-        [InlineKeyboardButton("📅 За сегодня", callback_data="stats_today")],
-        [InlineKeyboardButton("📊 За неделю", callback_data="stats_week")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.STATS
     
     await update.message.reply_text(
         message,
@@ -681,37 +343,27 @@ async def handle_stats_callback(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return
     
-    if query.data == "refresh_stats":
-        stats = get_user_statistics()
+    view = context.args[0]
+    if view == "refresh":
+        stats = await get_user_statistics()
         message = format_statistics_message(stats)
-        keyboard = [
-            [InlineKeyboardButton("🔄 Обновить", callback_data="refresh_stats")],
-            [InlineKeyboardButton("📅 За сегодня", callback_data="stats_today")],
-            [InlineKeyboardButton("📊 За неделю", callback_data="stats_week")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = keyboards.STATS
         await query.message.edit_text(message, reply_markup=reply_markup, parse_mode="Markdown")
     
-    elif query.data == "stats_today":
-        from database import get_daily_stats
-        today_stats = get_daily_stats()
+    elif view == "today":
+        today_stats = await get_daily_stats()
         message = f"📅 *Статистика за сегодня ({today_stats['date']})*\n\n"
         message += f"👥 Новых пользователей: {today_stats['new_users']}\n"
         message += f"🔄 Активных пользователей: {today_stats['active_users']}\n"
         message += f"🎯 Расчетов: {today_stats['calculations']}\n"
         message += f"⚖️ Записей веса: {today_stats['weight_entries']}\n"
+        message += f"💝 Донатов: {today_stats['donations']} на {today_stats['donations_amount']:g} ₽\n"
         
-        keyboard = [
-            [InlineKeyboardButton("📊 Общая статистика", callback_data="refresh_stats")],
-            [InlineKeyboardButton("📅 За сегодня", callback_data="stats_today")],
-            [InlineKeyboardButton("📊 За неделю", callback_data="stats_week")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = keyboards.STATS_PERIOD
         await query.message.edit_text(message, reply_markup=reply_markup, parse_mode="Markdown")
     
-    elif query.data == "stats_week":
-        from database import get_popular_actions
-        popular_actions = get_popular_actions(7)
+    elif view == "week":
+        popular_actions = await get_popular_actions(7)
         message = "📊 *Популярные действия за неделю:*\n\n"
         
         for action, count in popular_actions.items():
@@ -724,12 +376,7 @@ async def handle_stats_callback(update: Update, context: ContextTypes.DEFAULT_TY
             }.get(action, "📝")
             message += f"{action_emoji} {action}: {count}\n"
         
-        keyboard = [
-            [InlineKeyboardButton("📊 Общая статистика", callback_data="refresh_stats")],
-            [InlineKeyboardButton("📅 За сегодня", callback_data="stats_today")],
-            [InlineKeyboardButton("📊 За неделю", callback_data="stats_week")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = keyboards.STATS_PERIOD
         await query.message.edit_text(message, reply_markup=reply_markup, parse_mode="Markdown")
 
 async def about_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -737,7 +384,7 @@ async def about_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    track_user_action(user_id, "about_bot")
+    await track_user_action(user_id, "about_bot")
     
     about_text = (
         "🤖 *О боте НормаЖора*\n\n"
@@ -761,12 +408,7 @@ async def about_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "💝 *Поддержка бота:*\n"
         "Если тебе нравится бот и ты хочешь поддержать его развитие, ты можешь сделать донат любой удобной суммой. Это поможет сделать бота еще лучше!"
     )
-    keyboard = [
-        [InlineKeyboardButton("💝 Поддержать бота", callback_data="donate")],
-        [InlineKeyboardButton("📢 Поделиться ботом", callback_data="share_bot")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.ABOUT
     await query.message.edit_text(
         about_text,
         reply_markup=reply_markup,
@@ -774,280 +416,173 @@ async def about_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return
 
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Обработчики кнопок; какая кнопка к какому обработчику ведет, задает build_router
+
+async def open_tips_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, action="tips"):
+    """Меню полезного по кнопкам tips и back_to_menu"""
     query = update.callback_query
     await query.answer()
-    
-    user_id = update.effective_user.id
+    await track_user_action(update.effective_user.id, action)
+    await show_tips_menu(update, context)
 
-    # --- ВЛОЖЕННЫЕ МЕНЮ ДЛЯ 'ПОЛЕЗНОЕ' ---
-    # Удалено всё, что связано с tips_seasonal, seasonal_card, tips_tables и навигацией по таблицам
-    
-    if query.data == CALLBACK['MAIN_MENU']:
-        track_user_action(user_id, "back_to_main")
-        await show_main_menu(update, context)
-        return
-    
-    if query.data == CALLBACK['TIPS']:
-        track_user_action(user_id, "tips")
-        await show_tips_menu(update, context)
-        return
-    
-    if query.data == "back_to_menu":
-        track_user_action(user_id, "back_to_menu")
-        await show_tips_menu(update, context)
-        return
-    
-    # Обработка категорий карточек
-    if query.data.startswith("tips_"):
-        track_user_action(user_id, f"tips_{query.data.split('_')[1]}")
-        category = query.data.split("_")[1]
-        cards = get_nutrition_cards(category)
-        if cards:
-            current_card = cards[0]
-            caption = current_card[4]  # description находится в 5-м элементе
-            keyboard = [
-                [InlineKeyboardButton("◀️", callback_data=f"card_prev_{category}")],
-                [InlineKeyboardButton("▶️", callback_data=f"card_next_{category}")],
-                [InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_tips")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.edit_text(
-                text=caption,
-                parse_mode='Markdown',
-                reply_markup=reply_markup
-            )
-        return
-    
-    # Обработка навигации по карточкам
-    if query.data.startswith(("prev_", "next_")):
-        track_user_action(user_id, "card_navigation")
-        action, category = query.data.split("_")
-        cards = get_nutrition_cards(category)
-        if not cards:
-            return
-            
-        # Получаем текущий индекс из контекста
-        current_index = context.user_data.get(f"{category}_index", 0)
-        
-        # Обновляем индекс
-        if action == "prev" and current_index > 0:
-            current_index -= 1
-        elif action == "next" and current_index < len(cards) - 1:
-            current_index += 1
-            
-        # Сохраняем новый индекс
-        context.user_data[f"{category}_index"] = current_index
-        
-        # Показываем карточку
-        current_card = cards[current_index]
-        caption = current_card[4]  # description находится в 5-м элементе
-        await query.edit_message_text(
-            text=caption,
-            parse_mode='Markdown',
-            reply_markup=get_tips_menu_keyboard(category, current_index)
-        )
-        return
-    
-    if query.data == "new_calculation":
-        track_user_action(user_id, "new_calculation")
+def card_caption(card):
+    """Текст карточки: строка кэша - id, title, image_url, category, created_at, description, asset_path, asset_hash"""
+    return card[5] or f"*{card[1]}*"
+
+async def show_category_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Первая карточка категории, tips_<категория>"""
+    query = update.callback_query
+    await query.answer()
+    category = context.args[0]
+    await track_user_action(update.effective_user.id, f"tips_{category}")
+    cards = await get_nutrition_cards(category)
+    if cards:
+        _, current_card, previous, following = card_page(cards, 0)
+        await show_card(query.message, current_card, keyboards.card_browser(category, previous, following))
+
+async def show_season_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопки season_<сезон>: по сезонам карточки не разбиты, показываем все сезонные"""
+    context.args = ["seasonal"]
+    await show_category_cards(update, context)
+
+async def choose_calc_mode(update: Update, context: ContextTypes.DEFAULT_TYPE, new_calculation=False):
+    """Выбор, для кого расчет: calculate и new_calculation"""
+    query = update.callback_query
+    await query.answer()
+    await track_user_action(update.effective_user.id, "new_calculation" if new_calculation else "calculate")
+    if new_calculation:
         # Очищаем данные предыдущего расчета
         for key in list(context.user_data.keys()):
             if key.startswith("current_") or key in ["state", "calc_mode"]:
                 context.user_data.pop(key)
-        context.user_data.pop('weight', None)
-        context.user_data.pop('height', None)
-        context.user_data.pop('age', None)
-        context.user_data.pop('gender', None)
-        context.user_data.pop('activity_level', None)
-        context.user_data.pop('calc_mode', None)
-        
-        keyboard = [
-            [InlineKeyboardButton("Для себя", callback_data="calc_self")],
-            [InlineKeyboardButton("Для друга", callback_data="calc_friend")],
-            [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
+        for key in ('weight', 'height', 'age', 'gender', 'activity_level'):
+            context.user_data.pop(key, None)
+    
+    await query.message.reply_text(
+        "🎯 *Расчет нормы питания*\n\n"
+        "Для кого ты хочешь рассчитать норму?\n\n"
+        "• Для себя - расчет будет сохранен в твоей истории\n"
+        "• Для друга - разовый расчет без сохранения\n\n"
+        "Выбери вариант:",
+        reply_markup=keyboards.CALC_MODE,
+        parse_mode="Markdown"
+    )
+
+async def confirm_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Подтверждение цели по весу, confirm_target_<вес>"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    await track_user_action(user_id, "confirm_target")
+    try:
+        await set_target_weight(user_id, context.args[0])
+    except Exception as e:
+        logger.error(f"Error in confirm_target: {e}")
+        await query.answer()
         await query.message.reply_text(
-            "🎯 *Расчет нормы питания*\n\n"
-            "Для кого ты хочешь рассчитать норму?\n\n"
-            "• Для себя - расчет будет сохранен в твоей истории\n"
-            "• Для друга - разовый расчет без сохранения\n\n"
-            "Выбери вариант:",
-            reply_markup=reply_markup,
+            "❌ Произошла ошибка при установке цели. Пожалуйста, попробуйте снова.",
+            reply_markup=keyboards.TARGET_ERROR,
             parse_mode="Markdown"
         )
-    elif query.data == "tips":
-        track_user_action(user_id, "tips_menu")
-        keyboard = get_tips_menu_keyboard()
-        
-        # Используем edit_text вместо reply_text для удобного чтения
-        await query.message.edit_text(
-            get_tips_menu_message(),
-            reply_markup=keyboard,
-            parse_mode="Markdown"
-        )
-    elif query.data == "confirm_target_":
-        track_user_action(user_id, "confirm_target")
-        try:
-            target_weight = float(query.data.split("_")[2])
-            user_id = update.effective_user.id
-            set_target_weight(user_id, target_weight)
-            
-            # Удалённый функционал управления весом
-            context.user_data.pop("state", None)  # Сбрасываем состояние после успешной установки цели
-            
-            # Возвращаемся в главное меню
-            await back_to_main(update, context)
-            
-            return
-        except Exception as e:
-            logger.error(f"Error in confirm_target: {e}")
-            keyboard = [
-                [InlineKeyboardButton("🎯 Рассчитать норму", callback_data="calculate")],
-                [InlineKeyboardButton("📚 Полезное", callback_data="tips")],
-                [InlineKeyboardButton("ℹ️ О боте", callback_data="about_bot")],
-                [InlineKeyboardButton("💝 Поддержать бота", callback_data="donate")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text(
-                "❌ Произошла ошибка при установке цели. Пожалуйста, попробуйте снова.",
-                reply_markup=reply_markup,
-                parse_mode="Markdown"
-            )
-            return
-
-    if query.data == "cancel_set_target":
-        track_user_action(user_id, "cancel_set_target")
-        context.user_data.pop("state", None) # Сбрасываем состояние при отмене установки цели
-        await back_to_main(update, context)
         return
+    
+    context.user_data.pop("state", None)  # Сбрасываем состояние после успешной установки цели
+    # Возвращаемся в главное меню, там же ответ на нажатие
+    await back_to_main(update, context)
 
-    if query.data == "calculate":
-        track_user_action(user_id, "calculate")
-        keyboard = [
-            [InlineKeyboardButton("Для себя", callback_data="calc_self")],
-            [InlineKeyboardButton("Для друга", callback_data="calc_friend")],
-            [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.message.reply_text(
-            "🎯 *Расчет нормы питания*\n\n"
-            "Для кого ты хочешь рассчитать норму?\n\n"
-            "• Для себя - расчет будет сохранен в твоей истории\n"
-            "• Для друга - разовый расчет без сохранения\n\n"
-            "Выбери вариант:",
-            reply_markup=reply_markup,
-            parse_mode="Markdown"
-        )
-    elif query.data == "calc_self":
-        track_user_action(user_id, "calc_self")
-        context.user_data["calc_mode"] = "self"
-        print(f"User {user_id}: Set calc_mode = 'self'")
-        keyboard = [
-            [InlineKeyboardButton("Мужской", callback_data="gender_male")],
-            [InlineKeyboardButton("Женский", callback_data="gender_female")],
-            [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.message.reply_text(
-            "👤 *Расчет для себя*\n\n"
-            "Твои параметры и результаты будут сохранены в истории.\n"
-            "Пол:",
-            reply_markup=reply_markup,
-            parse_mode="Markdown"
-        )
-    elif query.data == "calc_friend":
-        track_user_action(user_id, "calc_friend")
-        context.user_data["calc_mode"] = "friend"
-        print(f"User {user_id}: Set calc_mode = 'friend'")
-        keyboard = [
-            [InlineKeyboardButton("Мужской", callback_data="gender_male_friend")],
-            [InlineKeyboardButton("Женский", callback_data="gender_female_friend")],
-            [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.message.reply_text(
-            "👥 *Расчет для друга*\n\n"
-            "Это разовый расчет, результаты не будут сохранены.\n"
-            "Поделись потом с другом результатом😉\n\n"
-            "Выбери пол:",
-            reply_markup=reply_markup,
-            parse_mode="Markdown"
-        )
-    elif query.data == "set_target":
-        track_user_action(user_id, "set_target")
-        # Получаем текущую цель пользователя
-        user_params = get_user_params(update.effective_user.id)
-        current_target = user_params.get('target_weight') if user_params else None
-        
-        message = "🎯 *Установка цели по весу*\n\n"
-        if current_target:
-            message += f"Текущая цель: `{current_target}` кг\n\n"
-            message += "Хочешь установить новую цель?\n\n"
-            
-        message += "Введи желаемый вес в кг (например, 55.5):"
+async def cancel_set_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await track_user_action(update.effective_user.id, "cancel_set_target")
+    context.user_data.pop("state", None) # Сбрасываем состояние при отмене установки цели
+    await back_to_main(update, context)
+
+async def choose_calc_self(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    user_id = update.effective_user.id
+    await track_user_action(user_id, "calc_self")
+    context.user_data["calc_mode"] = "self"
+    logger.debug(f"User {user_id}: calc_mode = 'self'")
+    await query.message.reply_text(
+        "👤 *Расчет для себя*\n\n"
+        "Твои параметры и результаты будут сохранены в истории.\n"
+        "Пол:",
+        reply_markup=keyboards.GENDER,
+        parse_mode="Markdown"
+    )
+
+async def choose_calc_friend(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    user_id = update.effective_user.id
+    await track_user_action(user_id, "calc_friend")
+    context.user_data["calc_mode"] = "friend"
+    logger.debug(f"User {user_id}: calc_mode = 'friend'")
+    await query.message.reply_text(
+        "👥 *Расчет для друга*\n\n"
+        "Это разовый расчет, результаты не будут сохранены.\n"
+        "Поделись потом с другом результатом😉\n\n"
+        "Выбери пол:",
+        reply_markup=keyboards.GENDER,
+        parse_mode="Markdown"
+    )
+
+async def ask_target_weight(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await track_user_action(update.effective_user.id, "set_target")
+    # Получаем текущую цель пользователя
+    user_params = await get_user_params(update.effective_user.id)
+    current_target = user_params.get('target_weight') if user_params else None
+    
+    message = "🎯 *Установка цели по весу*\n\n"
+    if current_target:
+        message += f"Текущая цель: `{current_target}` кг\n\n"
+        message += "Хочешь установить новую цель?\n\n"
         
-        keyboard = [
-            [InlineKeyboardButton("◀️ Назад в Управление весом", callback_data="back_to_weight_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(
-            message,
-            reply_markup=reply_markup,
-            parse_mode="Markdown"
-        )
-        context.user_data["state"] = "set_target" # Устанавливаем состояние для обработки ввода
-        return # Завершаем обработку здесь, ожидая ввод
-    elif query.data == "donate":
-        track_user_action(user_id, "donate")
-        await handle_donation(update, context)
-        return
-    elif query.data == "share_bot":
-        track_user_action(user_id, "share_bot")
-        await share_bot(update, context)
-        return
-    elif query.data == "back_to_weight":
-        track_user_action(user_id, "back_to_weight")
-        keyboard = [[InlineKeyboardButton("◀️ Назад к выбору пола", callback_data="back_to_gender")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(
-            "⚖️ Введи вес в кг (например, 60):",
-            reply_markup=reply_markup,
-            parse_mode="Markdown"
-        )
-        context.user_data["state"] = "weight"
-        return
-    elif query.data == "back_to_gender":
-        track_user_action(user_id, "back_to_gender")
-        keyboard = [
-            [InlineKeyboardButton("Мужской", callback_data="gender_male")],
-            [InlineKeyboardButton("Женский", callback_data="gender_female")],
-            [InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(
-            "👤 Выбери пол:",
-            reply_markup=reply_markup,
-            parse_mode="Markdown"
-        )
-        context.user_data["state"] = "gender"
-        return
-    elif query.data == "back_to_age":
-        track_user_action(user_id, "back_to_age")
-        keyboard = [[InlineKeyboardButton("◀️ Назад к росту", callback_data="back_to_weight")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(
-            "👤 Введи возраст (например, 25):",
-            reply_markup=reply_markup,
-            parse_mode="Markdown"
-        )
-        context.user_data["state"] = "age"
-        return
+    message += "Введи желаемый вес в кг (например, 55.5):"
+    
+    await query.message.reply_text(
+        message,
+        reply_markup=keyboards.TO_WEIGHT_MENU,
+        parse_mode="Markdown"
+    )
+    context.user_data["state"] = "set_target" # Устанавливаем состояние для обработки ввода
+
+async def open_share_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await track_user_action(update.effective_user.id, "share_bot")
+    await share_bot(update, context)
+
+async def back_to_weight(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await track_user_action(update.effective_user.id, "back_to_weight")
+    await query.message.reply_text(
+        "⚖️ Введи вес в кг (например, 60):",
+        reply_markup=keyboards.TO_GENDER,
+        parse_mode="Markdown"
+    )
+    context.user_data["state"] = "weight"
+
+async def back_to_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await track_user_action(update.effective_user.id, "back_to_gender")
+    await query.message.reply_text(
+        "👤 Выбери пол:",
+        reply_markup=keyboards.GENDER_AGAIN,
+        parse_mode="Markdown"
+    )
+    context.user_data["state"] = "gender"
+
+async def back_to_age(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await track_user_action(update.effective_user.id, "back_to_age")
+    await query.message.reply_text(
+        "👤 Введи возраст (например, 25):",
+        reply_markup=keyboards.TO_HEIGHT,
+        parse_mode="Markdown"
+    )
+    context.user_data["state"] = "age"
 
 async def handle_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -1055,25 +590,22 @@ async def handle_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     
-    if query.data.startswith("gender_"):
-        # Определяем пол и режим расчета
-        if query.data == "gender_male" or query.data == "gender_male_friend":
+    if context.args:
+        # Определяем пол; режим расчета уже в user_data
+        if context.args[0] == "male":
             gender = "мужской"
             weight_example = "80.5"
             height_example = "175"
-            track_user_action(user_id, "gender_male")
+            await track_user_action(user_id, "gender_male")
         else:
             gender = "женский"
             weight_example = "60.5"
             height_example = "165"
-            track_user_action(user_id, "gender_female")
+            await track_user_action(user_id, "gender_female")
             
         context.user_data["gender"] = gender
         
-        keyboard = [
-            [InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = keyboards.TO_MAIN
         await query.message.reply_text(
             f"⚖️ Введи вес в кг (например, {weight_example}):",
             reply_markup=reply_markup
@@ -1093,16 +625,14 @@ async def handle_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     user_id = update.effective_user.id
-    track_user_action(user_id, f"activity_{query.data.replace('activity_', '')}")
+    activity_level = context.args[0]
+    await track_user_action(user_id, f"activity_{activity_level}")
 
     # Проверяем, что мы в правильном состоянии
     if context.user_data.get('state') != 'activity':
         logger.info("Activity handler called but state is not 'activity'")
         return
 
-    # Получаем уровень активности из callback_data
-    activity_level = query.data.replace('activity_', '')
-    
     # Проверяем валидность уровня активности
     activity_mapping = {
         'min': 'минимальная',
@@ -1135,7 +665,7 @@ async def handle_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         # Рассчитываем нормы
-        results = calculate_nutrition_norms(
+        results, message = get_nutrition_report(
             weight=float(weight),
             height=float(height),
             age=int(age),
@@ -1145,8 +675,6 @@ async def handle_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Сохраняем результаты только если это расчет для себя
         calc_mode = context.user_data.get('calc_mode')
-        print(f"User {update.effective_user.id}: calc_mode = {calc_mode}")
-        
         if calc_mode == 'self':
             user_id = update.effective_user.id
             params = {
@@ -1156,14 +684,11 @@ async def handle_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 'gender': gender,
                 'activity_level': activity_level
             }
-            print(f"Saving calculation for user {user_id} with calc_mode = {calc_mode}")
-            save_calculation_results(user_id, results, params)
-            track_user_action(user_id, "calculation_completed")
+            await save_calculation_results(user_id, results, params)
+            await track_user_action(user_id, "calculation_completed")
         else:
-            print(f"Not saving calculation for user {update.effective_user.id} because calc_mode = {calc_mode}")
+            logger.debug(f"Not saving calculation for user {update.effective_user.id}: calc_mode = {calc_mode}")
 
-        # Формируем сообщение с результатами
-        message = format_calculation_results(results)
 
         # Сброс состояния пользователя
         context.user_data.pop("state", None)
@@ -1191,8 +716,7 @@ async def share_results(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    keyboard = [[InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.TO_MAIN
     
     await query.message.reply_text(
         "Чтобы поделиться результатами, просто перешли это сообщение другу или сделай скриншот",
@@ -1212,7 +736,7 @@ async def handle_target_weight(update: Update, context: ContextTypes.DEFAULT_TYP
             return
             
         user_id = update.effective_user.id
-        set_target_weight(user_id, target_weight)
+        await set_target_weight(user_id, target_weight)
         
         await update.message.reply_text(
             f"✅ Целевой вес ({target_weight} кг) успешно установлен!",
@@ -1229,74 +753,37 @@ async def show_calculation_history(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
     
     user_id = update.effective_user.id
-    track_user_action(user_id, "calc_history")
+    await track_user_action(user_id, "calc_history")
     
-    if query.data == "calc_history":
-        history = list(get_calculation_history(user_id))
-        
-        if not history:
-            keyboard = [
-                [InlineKeyboardButton("🎯 Рассчитать норму", callback_data="calculate")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text(
-                "📊 У тебя пока нет сохраненных расчетов.\n"
-                "Давай сделаем первый расчет!",
-                reply_markup=reply_markup,
-                parse_mode="Markdown"
-            )
-            return
-        
-        message = "📊 *История расчетов:*\n\n"
-        for calc in history:
-            try:
-                # Преобразуем строку даты в объект datetime
-                # SQLite возвращает дату в формате YYYY-MM-DD HH:MM:SS
-                date_obj = datetime.strptime(calc['date'], "%Y-%m-%d %H:%M:%S")
-                # Форматируем дату в нужном формате
-                date_str = date_obj.strftime("%d.%m.%Y")
-                message += f"📅 *{date_str}*\n"
-            except (ValueError, TypeError) as e:
-                # Если формат даты неверный, используем дату как есть
-                message += f"📅 *{calc['date']}*\n"
-            
-            message += f"👤 *Параметры:*\n"
-            message += f"• Вес: {calc['weight']} кг\n"
-            message += f"• Рост: {calc['height']} см\n"
-            message += f"• Возраст: {calc['age']} лет\n"
-            message += f"• Активность: {calc['activity_level']}\n\n"
-            message += f"🎯 *Расчетные нормы:*\n"
-            message += f"• Базовый метаболизм (BMR): {calc['bmr']} ккал\n"
-            message += f"• Норма калорий: {calc['maintenance_calories']} ккал\n"
-            message += f"• Дефицит (15%): {calc['deficit_calories_15']} ккал\n"
-            message += f"• Дефицит (20%): {calc['deficit_calories_20']} ккал\n"
-            message += f"• Профицит (+10%): {calc['surplus_calories']} ккал\n\n"
-            message += f"🥗 *БЖУ:*\n"
-            message += f"• Белки: {calc['protein_min']}-{calc['protein_max']}г\n"
-            message += f"• Жиры: {calc['fat_min']}-{calc['fat_max']}г\n"
-            message += f"• Углеводы: {calc['carbs_min']}-{calc['carbs_max']}г\n\n"
-            message += f"📏 *ИМТ:*\n"
-            message += f"• Индекс: {calc['bmi']:.1f}\n"
-            message += f"• Категория: {calc['bmi_category']}\n\n"
-            message += f"💧 *Норма воды:*\n"
-            message += f"• {int(calc['water_norm_min'])}-{int(calc['water_norm_max'])} мл в день\n"
-            message += f"• Это примерно {int(calc['water_norm_min']/250)}-{int(calc['water_norm_max']/250)} стаканов\n\n"
-            
-            # Добавляем рекомендуемое количество шагов из истории, если есть
-            if 'recommended_steps_min' in calc and 'recommended_steps_max' in calc:
-                message += f"🚶 *Рекомендуемое количество шагов:*\n"
-                message += f"• {calc['recommended_steps_min']}-{calc['recommended_steps_max']} шагов в день\n\n"
+    # calc_history - первая страница, calc_history_older_<id> и calc_history_newer_<id> - соседние
+    direction, anchor_id = context.args or (None, None)
+    before_id = anchor_id if direction == "older" else None
+    after_id = anchor_id if direction == "newer" else None
 
-            message += "➖➖➖➖➖➖➖➖➖➖\n\n"
-        
-        keyboard = [
-            [InlineKeyboardButton("🎯 Рассчитать норму", callback_data="calculate")],
-            [InlineKeyboardButton("💝 Поддержать бота", callback_data="donate")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    history, has_older, has_newer = await get_calculation_page(user_id, before_id=before_id, after_id=after_id)
+    if not history and (before_id is not None or after_id is not None):
+        # Кнопка устарела, например расчеты удалены: показываем с начала
+        history, has_older, has_newer = await get_calculation_page(user_id)
         
-        # Отправляем новое сообщение с историей
-        await query.message.edit_text(message, reply_markup=reply_markup, parse_mode="Markdown")
+    if not history:
+        reply_markup = keyboards.HISTORY_EMPTY
+        await query.message.reply_text(
+            "📊 У тебя пока нет сохраненных расчетов.\n"
+            "Давай сделаем первый расчет!",
+            reply_markup=reply_markup,
+            parse_mode="Markdown"
+        )
+        return
+    
+    message = render_history(history)
+    
+    reply_markup = keyboards.history_navigation(
+        history[0]['id'] if has_newer else None,
+        history[-1]['id'] if has_older else None
+    )
+    
+    # Отправляем новое сообщение с историей
+    await query.message.edit_text(message, reply_markup=reply_markup, parse_mode="Markdown")
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if "state" not in context.user_data:
@@ -1312,8 +799,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if weight < 20 or weight > 300:
                 raise ValueError("weight")
             context.user_data["weight"] = weight
-            keyboard = [[InlineKeyboardButton("◀️ Назад к выбору пола", callback_data="back_to_gender")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = keyboards.TO_GENDER
             await update.message.reply_text(
                 f"📏 Введи рост в см (например, {context.user_data.get('height_example', '170')}):",
                 reply_markup=reply_markup,
@@ -1325,8 +811,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if height < 100 or height > 250:
                 raise ValueError("height")
             context.user_data["height"] = height
-            keyboard = [[InlineKeyboardButton("◀️ Назад к весу", callback_data="back_to_weight")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = keyboards.TO_WEIGHT
             await update.message.reply_text(
                 "👤 Введи возраст (например, 25):",
                 reply_markup=reply_markup,
@@ -1340,15 +825,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data["age"] = age
             
             # Показываем клавиатуру активности только один раз
-            keyboard = [
-                [InlineKeyboardButton("Минимальная", callback_data="activity_min")],
-                [InlineKeyboardButton("Низкая", callback_data="activity_low")],
-                [InlineKeyboardButton("Средняя", callback_data="activity_medium")],
-                [InlineKeyboardButton("Высокая", callback_data="activity_high")],
-                [InlineKeyboardButton("Очень высокая", callback_data="activity_very_high")],
-                [InlineKeyboardButton("◀️ Назад к возрасту", callback_data="back_to_age")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = keyboards.ACTIVITY_AFTER_AGE
             
             # Отправляем новое сообщение с клавиатурой активности
             await update.message.reply_text(
@@ -1371,7 +848,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 if target_weight < 20 or target_weight > 300:
                     raise ValueError("weight")
                 user_id = update.effective_user.id
-                set_target_weight(user_id, target_weight)
+                await set_target_weight(user_id, target_weight)
                 await update.message.reply_text(
                     f"✅ Целевой вес ({target_weight} кг) успешно установлен!",
                     reply_markup=get_main_menu_keyboard()
@@ -1436,22 +913,13 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Сбрасываем состояние пользователя
     context.user_data.pop("state", None)
-    context.user_data.pop("current_vitamins_index", None)
-    context.user_data.pop("current_nutrition_index", None)
-    context.user_data.pop("current_seasonal_index", None)
-    context.user_data.pop("current_diets_index", None)
 
 async def back_to_tips(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Возврат в меню полезных советов"""
     query = update.callback_query
     await query.answer()
     
-    keyboard = [
-        [InlineKeyboardButton("🌱 Сезонные продукты", callback_data="tips_seasonal")],
-        [InlineKeyboardButton("📋 Таблички", callback_data="tips_tables")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.TIPS
     
     try:
         # Пробуем отредактировать существующее сообщение
@@ -1471,20 +939,12 @@ async def back_to_tips(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         except Exception as e:
             logger.error(f"Error sending new message: {e}")
-    
-    # Сбрасываем индексы карточек при возврате в меню
-    context.user_data.pop("current_seasonal_index", None)
-    context.user_data.pop("current_tables_index", None)
 
 async def share_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    keyboard = [
-        [InlineKeyboardButton("ℹ️ О боте", callback_data="about_bot")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.SHARE_BOT
     
     # Отправляем новое сообщение вместо редактирования
     await query.message.reply_text(
@@ -1498,11 +958,7 @@ async def share_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def send_start_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отправляет напоминание о команде /start при длительном простое"""
-    keyboard = [
-        [InlineKeyboardButton("🔄 Начать заново", callback_data="start_new")],
-        [InlineKeyboardButton("❌ Закрыть", callback_data="close_reminder")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.REMINDER
     
     await update.message.reply_text(
         "👋 Похоже, ты давно не пользовался ботом!\n\n"
@@ -1525,11 +981,7 @@ async def handle_close_reminder(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды помощи"""
-    keyboard = [
-        [InlineKeyboardButton("🔄 Начать заново", callback_data="start_new")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.HELP
     
     help_text = (
         "🤖 *Как пользоваться ботом*\n\n"
@@ -1569,18 +1021,11 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_tips_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню полезных советов"""
-    keyboard = [
-        [InlineKeyboardButton("📊 Трекеры", callback_data="tips_tables")],
-        [InlineKeyboardButton("◀️ Назад в меню", callback_data=CALLBACK['MAIN_MENU'])]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.TIPS_MENU
     
     if update.callback_query:
-        await update.callback_query.edit_message_text(
-            text=get_tips_menu_message(),
-            reply_markup=reply_markup,
-            parse_mode="Markdown"
-        )
+        # Из карточки с картинкой текст не отредактировать, тогда придет новое сообщение
+        await safe_edit_message(update.callback_query.message, get_tips_menu_message(), reply_markup)
     else:
         await update.message.reply_text(
             text=get_tips_menu_message(),
@@ -1588,84 +1033,159 @@ async def show_tips_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode="Markdown"
         )
 
-async def handle_card_navigation(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик навигации по карточкам"""
+async def handle_card_navigation(update: Update, context: ContextTypes.DEFAULT_TYPE, browser=keyboards.card_browser):
+    """Обработчик навигации по карточкам: кнопка несет категорию, позицию и id карточки"""
     query = update.callback_query
     await query.answer()
+    await track_user_action(update.effective_user.id, "card_navigation")
     
-    # Получаем категорию из callback_data
-    if query.data.startswith('card_next_') or query.data.startswith('card_prev_'):
-        category = query.data.split('_')[-1]
-    else:
-        return
+    category = context.args[0]
+    # Кнопки прежнего формата позиции не несут, для них показываем первую карточку
+    index, card_id = context.args[1:] or (0, None)
         
-    cards = get_nutrition_cards(category=category)
+    cards = await get_nutrition_cards(category=category)
     if not cards:
-        await query.message.edit_text(
-            f"❌ Карточки категории {category} не найдены",
-            reply_markup=get_tips_menu_keyboard(),
-            parse_mode="Markdown"
-        )
+        await safe_edit_message(query.message, f"❌ Карточки категории {category} не найдены", browser(category))
         return
-        
-    # Получаем текущий индекс
-    index_key = f"current_{category}_index"
-    current_index = context.user_data.get(index_key, 0)
-    
-    # Обновляем индекс
-    if query.data.startswith('card_next_'):
-        if current_index < len(cards) - 1:
-            current_index += 1
-    elif query.data.startswith('card_prev_'):
-        if current_index > 0:
-            current_index -= 1
-            
-    # Сохраняем новый индекс
-    context.user_data[index_key] = current_index
     
-    # Получаем текущую карточку
-    current_card = cards[current_index]
-    caption = current_card[4] if len(current_card) > 4 and current_card[4] else ""
-    
-    # Создаем клавиатуру
-    keyboard = [
-        [InlineKeyboardButton("◀️", callback_data=f"card_prev_{category}")],
-        [InlineKeyboardButton("▶️", callback_data=f"card_next_{category}")],
-        [InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_tips")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    try:
-        await query.message.edit_text(
-            caption,
-            reply_markup=reply_markup,
-            parse_mode="Markdown"
-        )
-    except Exception as e:
-        logger.error(f"Error displaying card: {e}")
-        await query.message.edit_text(
-            "❌ Произошла ошибка при отображении карточки. Пожалуйста, попробуйте позже.",
-            reply_markup=reply_markup,
-            parse_mode="Markdown"
-        )
+    _, current_card, previous, following = card_page(cards, index, card_id)
+    await show_card(query.message, current_card, browser(category, previous, following))
 
 def get_seasonal_submenu_keyboard():
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("Весна", callback_data="season_spring")],
-        [InlineKeyboardButton("Лето", callback_data="season_summer")],
-        [InlineKeyboardButton("Осень", callback_data="season_autumn")],
-        [InlineKeyboardButton("Зима", callback_data="season_winter")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_tips")]
-    ])
+    return keyboards.SEASONAL_SUBMENU
 
 def get_tables_submenu_keyboard():
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_tips")]
-    ])
+    return keyboards.TABLES_SUBMENU
+
+async def on_shutdown(application: Application):
+    """Закрывает клиент YooKassa, сбрасывает буферы сессий и аналитики и останавливает работу с базой"""
+    await yookassa.close()
+    if isinstance(application.persistence, SQLitePersistence):
+        application.persistence.store.close()
+    shutdown_database()
+
+async def record_notification(payment):
+    """Учитывает уведомление YooKassa: статус ссылки на оплату и донат"""
+    # metadata приходит из JSON уведомления, user_id там может быть не строкой
+    user_id = str(payment.metadata.get('user_id', ''))
+    if await record_payment(payment.id, payment.status, float(payment.amount or 0),
+                            int(user_id) if user_id.isdigit() else None):
+        logger.info(f"Donation {payment.id}: {payment.amount} {payment.currency} from user {user_id}")
+
+def build_web_server(application: Application):
+    """Встроенный HTTP-сервер: уведомления YooKassa, пинги мониторинга и /status"""
+    server = WebServer()
+    notifications = notification_handler(record_notification)
+    server.add_route('POST', YOOKASSA_NOTIFY_PATH, notifications)
+    server.add_status_section('scheduler', application.update_processor.metrics)
+    server.add_status_section('sessions', application.persistence.metrics)
+    server.add_status_section('payments', lambda: dict(yookassa.metrics(), **notifications.stats))
+    server.add_status_section('keyboards', keyboards.metrics)
+    server.add_status_section('callbacks', router.metrics)
+    server.add_status_section('card_media', card_media.metrics)
+    return server
+
+async def run_bot(application: Application):
+    """Бот и встроенный HTTP-сервер в одном цикле событий.
+
+    Апдейты приходят через webhook, если задан WEBHOOK_URL, иначе через long polling.
+    Уведомления YooKassa сервер принимает в обоих режимах.
+    """
+    server = build_web_server(application)
+    if WEBHOOK_URL:
+        async def submit(data):
+            await application.update_queue.put(Update.de_json(data, application.bot))
+
+        hook = webhook_handler(submit, WEBHOOK_SECRET)
+        server.add_route('POST', WEBHOOK_PATH, hook)
+        server.add_status_section('updates', lambda: dict(hook.stats, queue_size=application.update_queue.qsize()))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with application:
+        await application.start()
+        await server.start(HOST, PORT)
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info(f"Webhook mode: listening on {HOST}:{PORT}{WEBHOOK_PATH}")
+        else:
+            # start_polling сам снимает webhook, оставшийся от прошлого запуска
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            logger.info(f"Polling mode: HTTP server on {HOST}:{PORT}")
+        try:
+            await stop.wait()
+        finally:
+            if application.updater.running:
+                await application.updater.stop()
+            await server.stop()
+            await application.stop()
+    await on_shutdown(application)
+
+def build_router():
+    """Таблица маршрутов callback-кнопок: действие из callback_codec -> обработчик"""
+    router = CallbackRouter()
+    for action, handler in (
+        ("back_to_main", back_to_main),
+        ("tips", open_tips_menu),
+        ("back_to_menu", partial(open_tips_menu, action="back_to_menu")),
+        ("back_to_tips", back_to_tips),
+        ("tips_category", show_category_cards),
+        ("tips_card", partial(handle_card_navigation, browser=keyboards.tips_navigation)),
+        ("card", handle_card_navigation),
+        ("season", show_season_cards),
+        # Кнопки листания из старых сообщений
+        ("tips_prev", partial(handle_card_navigation, browser=keyboards.tips_navigation)),
+        ("tips_next", partial(handle_card_navigation, browser=keyboards.tips_navigation)),
+        ("card_prev", handle_card_navigation),
+        ("card_next", handle_card_navigation),
+        ("calculate", choose_calc_mode),
+        ("new_calculation", partial(choose_calc_mode, new_calculation=True)),
+        ("calc_self", choose_calc_self),
+        ("calc_friend", choose_calc_friend),
+        ("gender", handle_gender),
+        ("activity", handle_activity),
+        ("calc_history", show_calculation_history),
+        ("calc_history_page", show_calculation_history),
+        ("set_target", ask_target_weight),
+        ("cancel_set_target", cancel_set_target),
+        ("confirm_target", confirm_target),
+        # "Назад" при вводе цели: отдельного меню управления весом больше нет
+        ("back_to_weight_menu", cancel_set_target),
+        ("back_to_weight", back_to_weight),
+        ("back_to_gender", back_to_gender),
+        ("back_to_age", back_to_age),
+        ("donate", handle_donation),
+        ("donate_amount", process_donation),
+        ("share_bot", open_share_bot),
+        ("about_bot", about_bot),
+        ("start_new", handle_start_new),
+        ("close_reminder", handle_close_reminder),
+        ("stats", handle_stats_callback),
+    ):
+        router.route(action, handler)
+    return router
+
+router = build_router()
 
 def main():
-    # Создаем приложение
-    application = Application.builder().token(TOKEN).build()
+    # Создаем приложение; context.user_data переживает перезапуск
+    persistence = SQLitePersistence()
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+        .persistence(persistence)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    persistence.attach(application)
     
     # Добавляем обработчик ошибок
     application.add_error_handler(error_handler)
@@ -1675,23 +1195,12 @@ def main():
     application.add_handler(CommandHandler("help", help_command))  # Команда помощи
     application.add_handler(CommandHandler("stats", stats_command))  # Команда статистики для администратора
     # Удалена команда /weight
-    application.add_handler(CallbackQueryHandler(button_handler, pattern="^calculate$|^tips$|^share_bot$|^calc_self$|^calc_friend$|^set_target$|^back_to_weight$|^back_to_gender$|^back_to_age$"))
-    application.add_handler(CallbackQueryHandler(handle_gender, pattern="^gender_"))
-    application.add_handler(CallbackQueryHandler(handle_activity, pattern="^activity_"))
-    # Удалены show_weight_history, handle_new_weight
-    application.add_handler(CallbackQueryHandler(show_calculation_history, pattern="^calc_history$"))
-    application.add_handler(CallbackQueryHandler(back_to_main, pattern="^back_to_main$"))
-    application.add_handler(CallbackQueryHandler(back_to_tips, pattern="^back_to_tips$"))
-    application.add_handler(CallbackQueryHandler(handle_card_navigation, pattern="^card_prev_|^card_next_"))
-    application.add_handler(CallbackQueryHandler(about_bot, pattern="^about_bot$"))
-    application.add_handler(CallbackQueryHandler(handle_donation, pattern="^donate$"))
-    application.add_handler(CallbackQueryHandler(process_donation, pattern="^donate_\\d+$"))
-    application.add_handler(CallbackQueryHandler(handle_stats_callback, pattern="^refresh_stats$|^stats_today$|^stats_week$"))  # Обработчики статистики
+    # Все кнопки разбирает один маршрутизатор
+    application.add_handler(CallbackQueryHandler(router.dispatch))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
-    # Запускаем бота
-    application.run_polling()
+    # Запускаем бота; HTTP-сервер для мониторинга и YooKassa работает в обоих режимах
+    asyncio.run(run_bot(application))
 
 if __name__ == "__main__":
-    keep_alive()  # Запускаем keep_alive для поддержания активности
     main()
\ No newline at end of file
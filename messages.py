@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Тексты сообщений бота: результаты расчета, история расчетов, статистика.
+
+Каждое сообщение собирается одной f-строкой, без цепочки +=. Повторяющиеся
+части (записи истории, строки статистики) собираются через join. Дата
+записи истории разбирается один раз на день и берется из кэша. Текст
+совпадает с прежним форматированием побайтно, это проверяет test_messages.py.
+"""
+
+from datetime import datetime
+from functools import lru_cache
+import re
+
+HISTORY_HEADER = "📊 *История расчетов:*\n\n"
+
+STATISTICS_ERROR = "❌ Не удалось получить статистику"
+
+# Так SQLite отдает datetime('now', '+3 hours')
+_SQLITE_DATETIME = re.compile(r'(\d{4}-\d{2}-\d{2}) ([01]\d|2[0-3]):[0-5]\d:[0-5]\d')
+
+
+@lru_cache(maxsize=1024)
+def _format_day(day):
+    return datetime.strptime(day, "%Y-%m-%d").strftime('%d.%m.%Y')
+
+
+def format_history_date(value):
+    """Дата записи истории как ДД.ММ.ГГГГ, неразборчивая дата - как есть"""
+    match = _SQLITE_DATETIME.fullmatch(value) if isinstance(value, str) else None
+    try:
+        if match:
+            # Время уже проверено, день разбирается один раз и берется из кэша
+            return _format_day(match.group(1))
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").strftime('%d.%m.%Y')
+    except (ValueError, TypeError):
+        return f"{value}"
+
+
+def render_calculation_results(results):
+    return (
+        "📊 *Результаты расчета*\n\n"
+        f"• Базовый обмен веществ: {results['bmr']} ккал\n"
+        f"• Норма калорий для поддержания текущего веса: {results['maintenance_calories']} ккал\n"
+        f"• Безопасный дефицит 15% для похудения: {results['deficit_calories_15']} ккал\n"
+        f"• Дефицит 20%: {results['deficit_calories_20']} ккал\n"
+        f"• Профицит 10%: {results['surplus_calories']} ккал\n\n"
+        "🥗 *Рекомендуемые БЖУ:*\n"
+        f"🥩 *Белки:* {results['protein_min']}-{results['protein_max']}г\n"
+        f"🥑 *Жиры:* {results['fat_min']}-{results['fat_max']}г\n"
+        f"🍚 *Углеводы:* {results['carbs_min']}-{results['carbs_max']}г\n\n"
+        "💧 *Норма воды:*\n"
+        f"• {results['water_norm_min']}-{results['water_norm_max']}мл в день\n"
+        f"• Это примерно {int(results['water_norm_min'] / 250)}-{int(results['water_norm_max'] / 250)} стаканов\n\n"
+        f"👣 *Рекомендуемые шаги:* {results['recommended_steps_min']}-{results['recommended_steps_max']}\n\n"
+        f"📏 *ИМТ:* {results['bmi']} ({results['bmi_category']})"
+    )
+
+
+def _render_history_steps(calc):
+    # Шаги есть не во всех старых записях
+    if 'recommended_steps_min' not in calc or 'recommended_steps_max' not in calc:
+        return ""
+    return (
+        "🚶 *Рекомендуемое количество шагов:*\n"
+        f"• {calc['recommended_steps_min']}-{calc['recommended_steps_max']} шагов в день\n\n"
+    )
+
+
+def render_history_entry(calc):
+    water_min = calc['water_norm_min']
+    water_max = calc['water_norm_max']
+    return (
+        f"📅 *{format_history_date(calc['date'])}*\n"
+        "👤 *Параметры:*\n"
+        f"• Вес: {calc['weight']} кг\n"
+        f"• Рост: {calc['height']} см\n"
+        f"• Возраст: {calc['age']} лет\n"
+        f"• Активность: {calc['activity_level']}\n\n"
+        "🎯 *Расчетные нормы:*\n"
+        f"• Базовый метаболизм (BMR): {calc['bmr']} ккал\n"
+        f"• Норма калорий: {calc['maintenance_calories']} ккал\n"
+        f"• Дефицит (15%): {calc['deficit_calories_15']} ккал\n"
+        f"• Дефицит (20%): {calc['deficit_calories_20']} ккал\n"
+        f"• Профицит (+10%): {calc['surplus_calories']} ккал\n\n"
+        "🥗 *БЖУ:*\n"
+        f"• Белки: {calc['protein_min']}-{calc['protein_max']}г\n"
+        f"• Жиры: {calc['fat_min']}-{calc['fat_max']}г\n"
+        f"• Углеводы: {calc['carbs_min']}-{calc['carbs_max']}г\n\n"
+        "📏 *ИМТ:*\n"
+        f"• Индекс: {calc['bmi']:.1f}\n"
+        f"• Категория: {calc['bmi_category']}\n\n"
+        "💧 *Норма воды:*\n"
+        f"• {int(water_min)}-{int(water_max)} мл в день\n"
+        f"• Это примерно {int(water_min / 250)}-{int(water_max / 250)} стаканов\n\n"
+        f"{_render_history_steps(calc)}"
+        "➖➖➖➖➖➖➖➖➖➖\n\n"
+    )
+
+
+def render_history(history):
+    return HISTORY_HEADER + "".join(map(render_history_entry, history))
+
+
+def render_statistics(stats):
+    if not stats:
+        return STATISTICS_ERROR
+
+    get = stats.get
+    parts = [
+        "📊 *Статистика бота*\n\n"
+        "👥 *Пользователи:*\n"
+        f"• Всего пользователей: {get('total_users', 0)}\n"
+        f"• Активных за 7 дней: {get('active_users_7d', 0)}\n"
+        f"• Активных за 30 дней: {get('active_users_30d', 0)}\n"
+        f"• Новых сегодня: {get('new_users_today', 0)}\n"
+        f"• Новых за неделю: {get('new_users_week', 0)}\n\n"
+        "🎯 *Расчеты:*\n"
+        f"• Всего расчетов: {get('total_calculations', 0)}\n"
+        f"• Расчетов сегодня: {get('calculations_today', 0)}\n"
+        f"• Расчетов за неделю: {get('calculations_week', 0)}\n\n"
+    ]
+
+    if stats.get('gender_stats'):
+        parts.append("👤 *По полу:*\n")
+        parts.extend(f"• {'👨' if gender == 'мужской' else '👩'} {gender}: {count}\n"
+                     for gender, count in stats['gender_stats'].items())
+        parts.append("\n")
+
+    if stats.get('avg_age', 0) > 0:
+        parts.append(f"📅 *Средний возраст:* {stats['avg_age']} лет\n\n")
+
+    if stats.get('activity_stats'):
+        parts.append("🏃 *По активности:*\n")
+        parts.extend(f"• {activity}: {count}\n" for activity, count in stats['activity_stats'].items())
+        parts.append("\n")
+
+    if stats.get('donations_total'):
+        parts.append(
+            "💝 *Донаты:*\n"
+            f"• Всего: {stats['donations_total']} на {get('donations_amount_total', 0):g} ₽\n"
+            f"• За неделю: {get('donations_week', 0)} на {get('donations_amount_week', 0):g} ₽\n\n"
+        )
+
+    return "".join(parts)
@@ -0,0 +1,161 @@
+import logging
+
+import rollups
+
+logger = logging.getLogger(__name__)
+
+# Упорядоченный список миграций схемы: (версия, описание, шаги).
+# Шаг - это SQL-строка или функция, принимающая соединение.
+# Уже выпущенные миграции не меняем, только добавляем новые в конец.
+MIGRATIONS = [
+    (1, "Индексы для горячих запросов", [
+        # История расчетов пользователя: WHERE user_id = ? ORDER BY date DESC
+        '''CREATE INDEX IF NOT EXISTS idx_calculation_history_user_date
+           ON calculation_history (user_id, date)''',
+        # Статистика расчетов за период
+        '''CREATE INDEX IF NOT EXISTS idx_calculation_history_date
+           ON calculation_history (date)''',
+        # Популярные действия: WHERE timestamp >= ? GROUP BY action_type
+        '''CREATE INDEX IF NOT EXISTS idx_user_actions_timestamp_type
+           ON user_actions (timestamp, action_type)''',
+        # Активные пользователи за день: COUNT(DISTINCT user_id) по диапазону timestamp
+        '''CREATE INDEX IF NOT EXISTS idx_user_actions_timestamp_user
+           ON user_actions (timestamp, user_id)''',
+        '''CREATE INDEX IF NOT EXISTS idx_user_stats_last_seen
+           ON user_stats (last_seen)''',
+        '''CREATE INDEX IF NOT EXISTS idx_user_stats_first_seen
+           ON user_stats (first_seen)''',
+        '''CREATE INDEX IF NOT EXISTS idx_weight_history_date
+           ON weight_history (date)''',
+        '''CREATE INDEX IF NOT EXISTS idx_nutrition_cards_category
+           ON nutrition_cards (category, created_at)''',
+    ]),
+    (2, "Агрегаты статистики", [
+        '''CREATE TABLE IF NOT EXISTS stats_counters
+           (name TEXT,
+            key TEXT,
+            value INTEGER DEFAULT 0,
+            PRIMARY KEY (name, key))''',
+        '''CREATE TABLE IF NOT EXISTS daily_active_users
+           (date TEXT,
+            user_id INTEGER,
+            PRIMARY KEY (date, user_id)) WITHOUT ROWID''',
+        # Заполняем агрегаты по уже накопленным данным
+        rollups.rebuild,
+    ]),
+    (3, "Каталог карточек с хэшами содержимого", [
+        'ALTER TABLE nutrition_cards ADD COLUMN content_hash TEXT',
+        'ALTER TABLE nutrition_cards ADD COLUMN position INTEGER',
+        # Раньше карточки перезаливались при каждом запуске, дубликаты оставляем по одному
+        '''DELETE FROM nutrition_cards
+           WHERE id NOT IN (SELECT MIN(id) FROM nutrition_cards GROUP BY category, title)''',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_nutrition_cards_category_title
+           ON nutrition_cards (category, title)''',
+        '''CREATE TABLE IF NOT EXISTS app_meta
+           (key TEXT PRIMARY KEY,
+            value TEXT)''',
+    ]),
+    (4, "Сохраненные сессии пользователей (context.user_data)", [
+        '''CREATE TABLE IF NOT EXISTS user_sessions
+           (user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL)''',
+        '''CREATE INDEX IF NOT EXISTS idx_user_sessions_updated_at
+           ON user_sessions (updated_at)''',
+    ]),
+    (5, "Кэш ссылок на оплату доната", [
+        '''CREATE TABLE IF NOT EXISTS payment_links
+           (user_id INTEGER,
+            amount INTEGER,
+            payment_id TEXT NOT NULL,
+            confirmation_url TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (user_id, amount)) WITHOUT ROWID''',
+        # Статус платежа обновляется по его id
+        '''CREATE INDEX IF NOT EXISTS idx_payment_links_payment_id
+           ON payment_links (payment_id)''',
+    ]),
+    (6, "Донаты по уведомлениям YooKassa", [
+        '''CREATE TABLE IF NOT EXISTS donations
+           (payment_id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            amount REAL NOT NULL,
+            date TEXT NOT NULL)''',
+    ]),
+    (7, "Индекс для постраничной истории расчетов", [
+        # Страница истории: WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?
+        '''CREATE INDEX IF NOT EXISTS idx_calculation_history_user_id
+           ON calculation_history (user_id, id)''',
+    ]),
+    (8, "Кэш file_id картинок карточек", [
+        # file_id, выданный Telegram при первой отправке картинки; при смене картинки меняется хэш
+        '''CREATE TABLE IF NOT EXISTS media_cache
+           (card_id INTEGER,
+            image_hash TEXT,
+            file_id TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (card_id, image_hash)) WITHOUT ROWID''',
+    ]),
+    (9, "Подготовленные картинки карточек", [
+        # Файл из card_assets.py относительно каталога ассетов, его SHA-256, размеры и вес
+        'ALTER TABLE nutrition_cards ADD COLUMN asset_path TEXT',
+        'ALTER TABLE nutrition_cards ADD COLUMN asset_hash TEXT',
+        'ALTER TABLE nutrition_cards ADD COLUMN asset_width INTEGER',
+        'ALTER TABLE nutrition_cards ADD COLUMN asset_height INTEGER',
+        'ALTER TABLE nutrition_cards ADD COLUMN asset_size INTEGER',
+        # image_url, из которого собран файл: после смены картинки файл устаревает
+        'ALTER TABLE nutrition_cards ADD COLUMN asset_source TEXT',
+    ]),
+    (10, "Варианты картинок карточек", [
+        # Все варианты из card_assets.VARIANTS; основной дублируется в nutrition_cards
+        '''CREATE TABLE IF NOT EXISTS card_asset_variants
+           (card_id INTEGER,
+            variant TEXT,
+            path TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            PRIMARY KEY (card_id, variant)) WITHOUT ROWID''',
+    ]),
+]
+
+
+def get_schema_version(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                    (version INTEGER PRIMARY KEY,
+                     description TEXT,
+                     applied_at TEXT DEFAULT (datetime('now', '+3 hours')))''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn, migrations=None):
+    """Применяет недостающие миграции, каждую атомарно. Возвращает итоговую версию схемы"""
+    if migrations is None:
+        migrations = MIGRATIONS
+    version = get_schema_version(conn)
+
+    for target, description, steps in migrations:
+        if target <= version:
+            continue
+        conn.execute('SAVEPOINT migration')
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (target, description))
+        except Exception:
+            conn.execute('ROLLBACK TO migration')
+            conn.execute('RELEASE migration')
+            logger.error(f"Migration {target} ({description}) failed")
+            raise
+        conn.execute('RELEASE migration')
+        logger.info(f"Applied migration {target}: {description}")
+        version = target
+
+    return version
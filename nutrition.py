@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Расчет норм питания: КБЖУ, вода, шаги и ИМТ.
+
+calculate_nutrition_norms считает одного человека для ответа в боте.
+calculate_nutrition_norms_batch считает сразу много профилей, заданных
+столбцами, например чтобы пересчитать нормы всей базы после изменения
+коэффициентов. Расчет векторный на NumPy (он есть в requirements.txt); если
+NumPy не установлен, работает тот же скалярный расчет в цикле. Результаты
+обоих совпадают бит в бит.
+
+Коэффициенты формул собраны в таблицу COEFFICIENTS по полу, возрастной группе
+и уровню активности. Она строится один раз при импорте, и расчет сводится к
+одному поиску в таблице и арифметике.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+from types import MappingProxyType
+import os
+
+from messages import render_calculation_results
+
+try:
+    import numpy as np
+except ImportError:  # без NumPy пакетный расчет идет в цикле
+    np = None
+
+# Константы для уровней активности
+ACTIVITY_LEVELS = {
+    "минимальная": 1.2,
+    "низкая": 1.375,
+    "средняя": 1.55,
+    "высокая": 1.725,
+    "очень высокая": 1.9
+}
+
+# Уровни активности в порядке коэффициентов в пакетном расчете
+ACTIVITY_ORDER = ("минимальная", "низкая", "средняя", "высокая", "очень высокая")
+# Пол в таблице коэффициентов: неизвестный пол считается как женский, но без учета климакса
+GENDER_ORDER = ("мужской", "женский", None)
+
+# Возрастные группы, внутри которых все коэффициенты одинаковы: границы
+# возрастных категорий (18, 30, 50, 65), климакса (45-55) и норм жиров у женщин
+AGE_BUCKETS = 7
+
+def age_bucket(age):
+    if age < 18:
+        return 0
+    elif age < 30:
+        return 1
+    elif age < 45:
+        return 2
+    elif age < 50:
+        return 3
+    elif age <= 55:
+        return 4
+    elif age < 65:
+        return 5
+    return 6
+
+# Возраст, представляющий каждую группу при построении таблицы
+_BUCKET_AGES = (0, 18, 30, 45, 50, 56, 65)
+
+NormCoefficients = namedtuple('NormCoefficients', [
+    'bmr_offset', 'activity_multiplier',
+    'protein_min_mult', 'protein_max_mult', 'protein_gender', 'protein_activity', 'protein_menopause',
+    'fat_percentage_min', 'fat_percentage_max', 'fat_min_per_kg',
+    'water_gender', 'water_age', 'water_activity', 'water_menopause',
+    'steps_min', 'steps_max',
+])
+
+def _build_coefficients(gender, age, activity_level):
+    """Коэффициенты формулы для одной комбинации пола, возраста и активности"""
+    # Возрастная категория
+    if age < 18:
+        age_category = "подросток"
+    elif age < 30:
+        age_category = "молодой"
+    elif age < 50:
+        age_category = "средний"
+    elif age < 65:
+        age_category = "зрелый"
+    else:
+        age_category = "пожилой"
+
+    # Корректировка по климаксу для женщин (45-55 лет - перименопауза, 55+ - постменопауза)
+    if gender == "женский" and 45 <= age <= 55:
+        menopause = "пери"
+    elif gender == "женский" and age > 55:
+        menopause = "пост"
+    else:
+        menopause = None
+
+    # Белки: базовые нормы по возрасту (г/кг веса)
+    protein_min_mult, protein_max_mult = {
+        "подросток": (1.8, 2.2),  # Высокая потребность для роста и развития
+        "молодой": (1.8, 2.2),    # Стандартные рекомендации для активного возраста
+        "средний": (1.8, 2.0),    # Поддержание мышечной массы
+        "зрелый": (1.8, 2.0),     # Увеличенная потребность для предотвращения саркопении
+        "пожилой": (1.6, 1.8)     # Минимальные для поддержания здоровья, но достаточные
+    }[age_category]
+    protein_activity = {
+        "минимальная": 1.0,      # Сидячий образ жизни
+        "низкая": 1.05,          # Легкие тренировки
+        "средняя": 1.1,          # Умеренные тренировки
+        "высокая": 1.15,         # Интенсивные тренировки
+        "очень высокая": 1.2     # Ежедневные интенсивные тренировки
+    }[activity_level]
+    # Перименопауза: повышенная потребность в белке, постменопауза: еще больше для предотвращения остеопороза
+    protein_menopause = {"пери": 1.1, "пост": 1.15}.get(menopause, 1.0)
+
+    # Жиры: доля калорийности по полу и возрасту
+    if gender == "мужской":
+        if age < 18:
+            fat_percentage = (0.25, 0.35)  # Подростки: больше жиров
+        elif age < 50:
+            fat_percentage = (0.20, 0.30)  # Молодые и средний возраст
+        else:
+            fat_percentage = (0.25, 0.35)  # Пожилые: больше жиров
+    else:
+        if age < 18:
+            fat_percentage = (0.30, 0.40)  # Подростки: больше жиров
+        elif age < 45:
+            fat_percentage = (0.25, 0.35)  # Молодые и средний возраст
+        else:
+            # Климакс: больше жиров для гормональной поддержки и усвоения жирорастворимых витаминов
+            fat_percentage = (0.30, 0.40)
+
+    # Вода: 30 мл на кг веса с поправками
+    water_age = {
+        "подросток": 1.1,    # Подростки: повышенная потребность в воде
+        "молодой": 1.0,      # Молодые: стандартная норма
+        "средний": 0.95,     # Средний возраст: небольшое снижение
+        "зрелый": 0.9,       # Зрелый возраст: снижение потребности
+        "пожилой": 0.85      # Пожилые: значительное снижение
+    }[age_category]
+    water_activity = {
+        "минимальная": 1.0,
+        "низкая": 1.05,
+        "средняя": 1.1,
+        "высокая": 1.15,
+        "очень высокая": 1.2
+    }[activity_level]
+    water_menopause = {"пери": 1.05, "пост": 1.1}.get(menopause, 1.0)
+
+    # Шаги: от всех входных данных зависят только коэффициенты, поэтому считаем их сразу
+    base_steps = {
+        "минимальная": 6000,
+        "низкая": 8000,
+        "средняя": 10000,
+        "высокая": 12000,
+        "очень высокая": 15000
+    }[activity_level]
+    steps_age = {
+        "подросток": 1.1,    # Подростки: больше активности
+        "молодой": 1.0,      # Молодые: стандартная норма
+        "средний": 0.95,     # Средний возраст: небольшое снижение
+        "зрелый": 0.9,       # Зрелый возраст: снижение активности
+        "пожилой": 0.8       # Пожилые: значительное снижение
+    }[age_category]
+    steps_gender = 1.05 if gender == "мужской" else 1.0  # Мужчинам рекомендуется больше шагов
+    steps_menopause = {"пери": 0.95, "пост": 0.9}.get(menopause, 1.0)
+
+    return NormCoefficients(
+        bmr_offset=5 if gender == "мужской" else -161,
+        activity_multiplier=ACTIVITY_LEVELS[activity_level],
+        protein_min_mult=protein_min_mult,
+        protein_max_mult=protein_max_mult,
+        protein_gender=1.05 if gender == "мужской" else 1.0,  # Мужчинам нужно немного больше белка
+        protein_activity=protein_activity,
+        protein_menopause=protein_menopause,
+        fat_percentage_min=fat_percentage[0],
+        fat_percentage_max=fat_percentage[1],
+        fat_min_per_kg=0.8 if gender == "мужской" else 0.9,
+        water_gender=1.1 if gender == "мужской" else 1.0,  # Мужчинам нужно больше воды
+        water_age=water_age,
+        water_activity=water_activity,
+        water_menopause=water_menopause,
+        steps_min=int(base_steps * steps_age * steps_gender * steps_menopause * 0.9),
+        steps_max=int(base_steps * steps_age * steps_gender * steps_menopause * 1.1),
+    )
+
+# Таблица коэффициентов {(пол, возрастная группа, активность): NormCoefficients}, строится один раз при импорте
+COEFFICIENTS = MappingProxyType({
+    (gender, bucket, activity_level): _build_coefficients(gender, _BUCKET_AGES[bucket], activity_level)
+    for gender in GENDER_ORDER
+    for bucket in range(AGE_BUCKETS)
+    for activity_level in ACTIVITY_ORDER
+})
+
+def get_coefficients(gender, age, activity_level):
+    coefficients = COEFFICIENTS.get((gender, age_bucket(age), activity_level))
+    if coefficients is None:
+        # Неизвестный пол и неизвестная активность ("средняя") - как в исходных формулах
+        coefficients = COEFFICIENTS[(
+            gender if gender in ("мужской", "женский") else None,
+            age_bucket(age),
+            activity_level if activity_level in ACTIVITY_LEVELS else "средняя",
+        )]
+    return coefficients
+
+def calculate_nutrition_norms(weight, height, age, gender, activity_level):
+    """Рассчитывает нормы питания"""
+    c = get_coefficients(gender, age, activity_level)
+    # Порядок умножений совпадает с исходными формулами, чтобы результат не менялся ни на бит
+
+    # Базовый обмен веществ (формула Миффлина-Сан Жеора) и калорийность
+    bmr = 10 * weight + 6.25 * height - 5 * age + c.bmr_offset
+    maintenance_calories = bmr * c.activity_multiplier
+    deficit_calories_15 = maintenance_calories * 0.85
+    deficit_calories_20 = maintenance_calories * 0.8
+    surplus_calories = maintenance_calories * 1.1
+
+    # Белки
+    protein_min = weight * c.protein_min_mult * c.protein_gender * c.protein_activity * c.protein_menopause
+    protein_max = weight * c.protein_max_mult * c.protein_gender * c.protein_activity * c.protein_menopause
+
+    # Жиры: от калорийности, но не меньше нормы на кг веса
+    fat_min = max(maintenance_calories * c.fat_percentage_min / 9, weight * c.fat_min_per_kg)
+    fat_max = maintenance_calories * c.fat_percentage_max / 9
+
+    # Углеводы: оставшиеся калории после белков и жиров, для дефицита минимум 50г
+    carbs_min = max((deficit_calories_15 - protein_min * 4 - fat_min * 9) / 4, 50)
+    carbs_max = (surplus_calories - protein_max * 4 - fat_max * 9) / 4
+
+    # ИМТ
+    height_m = height / 100
+    bmi = weight / (height_m * height_m)
+    if bmi < 18.5:
+        bmi_category = "Недостаточный вес"
+    elif bmi < 25:
+        bmi_category = "Нормальный вес"
+    elif bmi < 30:
+        bmi_category = "Избыточный вес"
+    else:
+        bmi_category = "Ожирение"
+
+    # Вода, +10% сверху для индивидуальных различий
+    water_norm_min = weight * 30 * c.water_gender * c.water_age * c.water_activity * c.water_menopause
+    water_norm_max = water_norm_min * 1.1
+
+    return {
+        'bmr': round(bmr),
+        'maintenance_calories': round(maintenance_calories),
+        'deficit_calories_15': round(deficit_calories_15),
+        'deficit_calories_20': round(deficit_calories_20),
+        'surplus_calories': round(surplus_calories),
+        'protein_min': round(protein_min),
+        'protein_max': round(protein_max),
+        'fat_min': round(fat_min),
+        'fat_max': round(fat_max),
+        'carbs_min': round(carbs_min),
+        'carbs_max': round(carbs_max),
+        'bmi': round(bmi, 1),
+        'bmi_category': bmi_category,
+        'water_norm_min': round(water_norm_min),
+        'water_norm_max': round(water_norm_max),
+        'recommended_steps_min': c.steps_min,
+        'recommended_steps_max': c.steps_max
+    }
+
+def format_calculation_results(results):
+    """Форматирует результаты расчета в текст"""
+    return render_calculation_results(results)
+
+# Входов у расчета немного, и они часто повторяются (расчеты "для друга",
+# повторные расчеты), поэтому готовые нормы и текст ответа держим в LRU-кэше
+NORMS_CACHE_SIZE = int(os.environ.get('NUTRITION_CACHE_SIZE', 4096))
+
+def normalize_inputs(weight, height, age, gender, activity_level):
+    """Ключ кэша: входы, которые дают один и тот же результат, сводятся к одному ключу"""
+    return (
+        float(weight),
+        float(height),
+        age,
+        gender if gender in GENDER_ORDER else None,
+        activity_level if activity_level in ACTIVITY_LEVELS else "средняя",
+    )
+
+@lru_cache(maxsize=NORMS_CACHE_SIZE)
+def _cached_report(weight, height, age, gender, activity_level):
+    results = calculate_nutrition_norms(weight, height, age, gender, activity_level)
+    return MappingProxyType(results), format_calculation_results(results)
+
+def get_nutrition_report(weight, height, age, gender, activity_level):
+    """Нормы и текст сообщения с результатами. Нормы - новый словарь, его можно менять"""
+    results, message = _cached_report(*normalize_inputs(weight, height, age, gender, activity_level))
+    return dict(results), message
+
+def nutrition_cache_info():
+    info = _cached_report.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
+
+def clear_nutrition_cache():
+    _cached_report.cache_clear()
+
+# Ключи результата calculate_nutrition_norms в порядке вывода
+RESULT_FIELDS = (
+    'bmr', 'maintenance_calories', 'deficit_calories_15', 'deficit_calories_20',
+    'surplus_calories', 'protein_min', 'protein_max', 'fat_min', 'fat_max',
+    'carbs_min', 'carbs_max', 'bmi', 'bmi_category', 'water_norm_min',
+    'water_norm_max', 'recommended_steps_min', 'recommended_steps_max'
+)
+
+def calculate_nutrition_norms_batch(weight, height, age, gender, activity_level, use_numpy=None):
+    """Рассчитывает нормы для столбцов профилей одинаковой длины.
+
+    Возвращает словарь {ключ результата: столбец}. С NumPy столбцы - массивы
+    (целочисленные, float64 для bmi и строковые для bmi_category), без него - списки.
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        return _calculate_batch_numpy(weight, height, age, gender, activity_level)
+
+    columns = {field: [] for field in RESULT_FIELDS}
+    for row in zip(weight, height, age, gender, activity_level):
+        results = calculate_nutrition_norms(*row)
+        for field in RESULT_FIELDS:
+            columns[field].append(results[field])
+    return columns
+
+def _codes(values, keys, default):
+    """Номер ключа для каждого значения; неизвестные значения получают номер default"""
+    index = {key: code for code, key in enumerate(keys)}
+    return np.fromiter((index.get(value, default) for value in values), dtype=np.int8)
+
+@lru_cache(maxsize=None)
+def _coefficient_columns():
+    """Таблица коэффициентов в виде массивов, индекс - (пол * AGE_BUCKETS + группа) * 5 + активность"""
+    rows = [COEFFICIENTS[(gender, bucket, activity_level)]
+            for gender in GENDER_ORDER
+            for bucket in range(AGE_BUCKETS)
+            for activity_level in ACTIVITY_ORDER]
+    return NormCoefficients(*(np.array(column) for column in zip(*rows)))
+
+def _round(values):
+    # np.rint, как и round(), округляет половины к четному
+    return np.rint(values).astype(np.int64)
+
+def _round_1(values):
+    """То же, что round(x, 1) для каждого элемента.
+
+    rint(x * 10) / 10 совпадает с round(x, 1), пока x * 10 не лежит почти ровно
+    на половине: там умножение может сдвинуть результат через границу, и такие
+    элементы досчитываются обычным round.
+    """
+    scaled = values * 10
+    rounded = np.rint(scaled) / 10
+    ambiguous = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    rounded[ambiguous] = [round(value, 1) for value in values[ambiguous].tolist()]
+    return rounded
+
+def _calculate_batch_numpy(weight, height, age, gender, activity_level):
+    # Порядок операций повторяет calculate_nutrition_norms, иначе float разойдется в последних битах
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    age = np.asarray(age)
+    if age.dtype.kind not in 'iuf':
+        age = age.astype(np.float64)
+
+    gender = _codes(gender, GENDER_ORDER[:2], 2)
+    # Неизвестный уровень активности считается как "средняя"
+    activity = _codes(activity_level, ACTIVITY_ORDER, ACTIVITY_ORDER.index("средняя"))
+    bucket = np.select([age < 18, age < 30, age < 45, age < 50, age <= 55, age < 65], range(6), 6)
+    index = (gender.astype(np.intp) * AGE_BUCKETS + bucket) * len(ACTIVITY_ORDER) + activity
+    c = NormCoefficients(*(column[index] for column in _coefficient_columns()))
+
+    bmr = 10 * weight + 6.25 * height - 5 * age + c.bmr_offset
+    maintenance_calories = bmr * c.activity_multiplier
+    deficit_calories_15 = maintenance_calories * 0.85
+    deficit_calories_20 = maintenance_calories * 0.8
+    surplus_calories = maintenance_calories * 1.1
+
+    protein_min = weight * c.protein_min_mult * c.protein_gender * c.protein_activity * c.protein_menopause
+    protein_max = weight * c.protein_max_mult * c.protein_gender * c.protein_activity * c.protein_menopause
+
+    fat_min = np.maximum(maintenance_calories * c.fat_percentage_min / 9, weight * c.fat_min_per_kg)
+    fat_max = maintenance_calories * c.fat_percentage_max / 9
+
+    carbs_min = np.maximum((deficit_calories_15 - protein_min * 4 - fat_min * 9) / 4, 50)
+    carbs_max = (surplus_calories - protein_max * 4 - fat_max * 9) / 4
+
+    height_m = height / 100
+    bmi = weight / (height_m * height_m)
+    bmi_category = np.select([bmi < 18.5, bmi < 25, bmi < 30],
+                             ["Недостаточный вес", "Нормальный вес", "Избыточный вес"], "Ожирение")
+
+    water_norm_min = weight * 30 * c.water_gender * c.water_age * c.water_activity * c.water_menopause
+    water_norm_max = water_norm_min * 1.1
+
+    return {
+        'bmr': _round(bmr),
+        'maintenance_calories': _round(maintenance_calories),
+        'deficit_calories_15': _round(deficit_calories_15),
+        'deficit_calories_20': _round(deficit_calories_20),
+        'surplus_calories': _round(surplus_calories),
+        'protein_min': _round(protein_min),
+        'protein_max': _round(protein_max),
+        'fat_min': _round(fat_min),
+        'fat_max': _round(fat_max),
+        'carbs_min': _round(carbs_min),
+        'carbs_max': _round(carbs_max),
+        'bmi': _round_1(bmi),
+        'bmi_category': bmi_category,
+        'water_norm_min': _round(water_norm_min),
+        'water_norm_max': _round(water_norm_max),
+        'recommended_steps_min': c.steps_min.astype(np.int64),
+        'recommended_steps_max': c.steps_max.astype(np.int64),
+    }
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Persistence для python-telegram-bot, которая хранит context.user_data в SessionStore.
+
+Application сам раз в update_interval секунд передает сюда измененные
+user_data, SessionStore пишет их в базу пачкой. Заодно с той же
+периодичностью сессии сверх TTL и лимита памяти выгружаются из
+application.user_data; когда пользователь вернется, refresh_user_data
+подгрузит его сессию из базы.
+"""
+
+import logging
+import os
+import time
+
+from telegram.ext import Application, BasePersistence, PersistenceInput
+
+from async_database import run_db
+from sessions import SessionStore, strip_volatile
+
+logger = logging.getLogger(__name__)
+
+SESSION_FLUSH_SECONDS = float(os.environ.get('SESSION_FLUSH_SECONDS', 5))
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(self, store=None, update_interval=SESSION_FLUSH_SECONDS, evict_interval=60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store if store is not None else SessionStore()
+        self.evict_interval = evict_interval
+        self._application = None
+        self._last_eviction = time.monotonic()
+        # Пользователи, выгруженные из памяти нами, а не удаленные: их drop_user_data не стирает базу
+        self._evicted = set()
+
+    def attach(self, application: Application):
+        """Нужен для выгрузки сессий из application.user_data"""
+        self._application = application
+
+    async def get_user_data(self):
+        return await run_db(self.store.load_all)
+
+    async def refresh_user_data(self, user_id, user_data):
+        if not user_data and not self.store.is_loaded(user_id):
+            data = await run_db(self.store.load, user_id)
+            if data:
+                user_data.update(data)
+        self.store.touch(user_id)
+
+    async def update_user_data(self, user_id, data):
+        self.store.save(user_id, data)
+        if time.monotonic() - self._last_eviction >= self.evict_interval:
+            self.evict()
+
+    async def drop_user_data(self, user_id):
+        if user_id in self._evicted:
+            self._evicted.discard(user_id)
+            # Пользователь мог вернуться до того, как Application дошел до удаления
+            data = self._application.user_data.get(user_id) if self._application else None
+            if data:
+                self.store.save(user_id, data)
+            return
+        self.store.delete(user_id)
+
+    def evict(self):
+        """Выгружает из памяти сессии с истекшим TTL и сверх лимита, сохраняя их в базе"""
+        self._last_eviction = time.monotonic()
+        if self._application is None:
+            return 0
+        expired, overflow = self.store.eviction_candidates()
+        for user_id in expired + overflow:
+            data = self._application.user_data.get(user_id)
+            if data:
+                self.store.save(user_id, strip_volatile(data) if user_id in expired else data,
+                                now=self.store.last_seen(user_id))
+            self.store.forget(user_id)
+            self._evicted.add(user_id)
+            self._application.drop_user_data(user_id)
+        if expired or overflow:
+            logger.info(f"Evicted {len(expired)} stale and {len(overflow)} overflow sessions")
+        return len(expired) + len(overflow)
+
+    async def flush(self):
+        await run_db(self.store.flush)
+
+    def metrics(self):
+        return self.store.metrics()
+
+    # Остальные данные бот не хранит
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Агрегаты статистики, которые обновляются при каждой записи.
+
+Счетчики по дням хранятся в daily_stats, общие счетчики (пользователи,
+расчеты, пол, активность, возраст) - в stats_counters. Функции record_*
+вызываются из database.py в той же транзакции, что и основная запись,
+поэтому /stats читает несколько строк вместо полного просмотра таблиц.
+
+Запуск как скрипта пересобирает агрегаты из существующих данных:
+python rollups.py
+"""
+
+# Столбцы daily_stats, которые считаются из данных. Донаты сюда не входят:
+# их пишет record_donation по уведомлениям о платежах
+DAILY_COUNTERS = ('new_users', 'active_users', 'total_calculations', 'total_weight_entries')
+DONATION_COUNTERS = ('donations_count', 'donations_amount')
+
+
+def _bump_daily(conn, day, column, amount=1):
+    conn.execute(f'''INSERT INTO daily_stats (date, {column}) VALUES (?, ?)
+                     ON CONFLICT(date) DO UPDATE SET {column} = {column} + excluded.{column}''',
+                 (day, amount))
+
+
+def _bump_counter(conn, name, key, amount=1):
+    conn.execute('''INSERT INTO stats_counters (name, key, value) VALUES (?, ?, ?)
+                    ON CONFLICT(name, key) DO UPDATE SET value = value + excluded.value''',
+                 (name, key, amount))
+
+
+def record_new_user(conn, day):
+    _bump_daily(conn, day, 'new_users')
+    _bump_counter(conn, 'users', 'total')
+
+
+def record_active_user(conn, day, user_id):
+    c = conn.execute('INSERT OR IGNORE INTO daily_active_users (date, user_id) VALUES (?, ?)', (day, user_id))
+    if c.rowcount:
+        _bump_daily(conn, day, 'active_users')
+
+
+def record_calculation(conn, day, gender, activity_level, age):
+    _bump_daily(conn, day, 'total_calculations')
+    _bump_counter(conn, 'calculations', 'total')
+    if gender is not None:
+        _bump_counter(conn, 'gender', gender)
+    if activity_level is not None:
+        _bump_counter(conn, 'activity', activity_level)
+    if age is not None and age > 0:
+        _bump_counter(conn, 'age', 'sum', age)
+        _bump_counter(conn, 'age', 'count')
+
+
+def record_weight_entry(conn, day):
+    _bump_daily(conn, day, 'total_weight_entries')
+
+
+def record_donation(conn, day, amount):
+    _bump_daily(conn, day, 'donations_count')
+    _bump_daily(conn, day, 'donations_amount', amount)
+
+
+def get_counters(conn, name):
+    return dict(conn.execute('SELECT key, value FROM stats_counters WHERE name = ?', (name,)).fetchall())
+
+
+def get_daily_totals(conn, since_day, until_day, columns=DAILY_COUNTERS):
+    """Суммы дневных счетчиков за период [since_day, until_day]"""
+    row = conn.execute(f'''SELECT {", ".join(f"COALESCE(SUM({column}), 0)" for column in columns)}
+                           FROM daily_stats WHERE date >= ? AND date <= ?''',
+                       (since_day, until_day)).fetchone()
+    return dict(zip(columns, row))
+
+
+def rebuild(conn):
+    """Пересчитывает все агрегаты по данным основных таблиц"""
+    conn.execute('DELETE FROM stats_counters')
+    conn.execute('DELETE FROM daily_active_users')
+    conn.execute(f'UPDATE daily_stats SET {", ".join(f"{column} = 0" for column in DAILY_COUNTERS)}')
+
+    conn.execute('''INSERT OR IGNORE INTO daily_active_users (date, user_id)
+                    SELECT DISTINCT substr(timestamp, 1, 10), user_id
+                    FROM user_actions WHERE timestamp IS NOT NULL''')
+
+    daily_sources = (
+        ('new_users', 'SELECT substr(first_seen, 1, 10) AS day, COUNT(*) FROM user_stats '
+                      'WHERE first_seen IS NOT NULL GROUP BY day'),
+        ('active_users', 'SELECT date, COUNT(*) FROM daily_active_users GROUP BY date'),
+        ('total_calculations', 'SELECT substr(date, 1, 10) AS day, COUNT(*) FROM calculation_history '
+                               'WHERE date IS NOT NULL GROUP BY day'),
+        ('total_weight_entries', 'SELECT substr(date, 1, 10) AS day, COUNT(*) FROM weight_history '
+                                 'WHERE date IS NOT NULL GROUP BY day'),
+    )
+    for column, query in daily_sources:
+        for day, count in conn.execute(query).fetchall():
+            _bump_daily(conn, day, column, count)
+
+    counter_sources = (
+        ("SELECT 'users', 'total', COUNT(*) FROM user_stats"),
+        ("SELECT 'calculations', 'total', COUNT(*) FROM calculation_history"),
+        ("SELECT 'gender', gender, COUNT(*) FROM calculation_history "
+         "WHERE gender IS NOT NULL GROUP BY gender"),
+        ("SELECT 'activity', activity_level, COUNT(*) FROM calculation_history "
+         "WHERE activity_level IS NOT NULL GROUP BY activity_level"),
+        ("SELECT 'age', 'sum', COALESCE(SUM(age), 0) FROM calculation_history "
+         "WHERE age IS NOT NULL AND age > 0"),
+        ("SELECT 'age', 'count', COUNT(*) FROM calculation_history "
+         "WHERE age IS NOT NULL AND age > 0"),
+    )
+    for query in counter_sources:
+        for name, key, value in conn.execute(query).fetchall():
+            _bump_counter(conn, name, key, value)
+
+
+if __name__ == "__main__":
+    from db_pool import connection, get_db_path
+    import database
+
+    database.init_db()
+    with connection() as conn:
+        rebuild(conn)
+    print(f"Statistics rebuilt for {get_db_path()}")
+    print(database.get_user_statistics())
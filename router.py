@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Маршрутизатор callback-кнопок по таблице.
+
+Вместо цепочки сравнений query.data в обработчике и регулярных выражений в
+каждом CallbackQueryHandler бот регистрирует один обработчик dispatch.
+callback_data разбирается один раз (callback_codec.decode) в действие и
+аргументы, обработчик действия находится поиском в словаре, аргументы
+попадают в context.args.
+
+Для каждого действия считаются вызовы, ошибки и гистограмма времени
+обработки, отдельно - сколько нажатий пришло от кнопок прежнего формата.
+"""
+
+from bisect import bisect_left
+import logging
+import time
+
+import callback_codec
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы, мс; последняя корзина - все, что дольше
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Route:
+    __slots__ = ('name', 'handler', 'calls', 'errors', 'total_ms', 'max_ms', 'histogram')
+
+    def __init__(self, name, handler):
+        self.name = name
+        self.handler = handler
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed_ms, failed):
+        self.calls += 1
+        if failed:
+            self.errors += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.histogram[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def metrics(self):
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'histogram': {label: count for label, count in zip(labels, self.histogram) if count},
+        }
+
+
+class CallbackRouter:
+    def __init__(self, decode=callback_codec.decode):
+        self.decode = decode
+        self._routes = {}
+        self.unmatched = 0
+        self.legacy = 0
+
+    def route(self, action, handler):
+        """Обработчик действия action из таблицы callback_codec"""
+        if action in self._routes:
+            raise ValueError(f"Duplicate callback route: {action!r}")
+        self._routes[action] = Route(action, handler)
+
+    def resolve(self, data):
+        """(маршрут, аргументы) для callback_data или (None, ())"""
+        decoded = self.decode(data)
+        if decoded is None:
+            return None, ()
+        action, args = decoded
+        route = self._routes.get(action)
+        return (route, args) if route is not None else (None, ())
+
+    async def dispatch(self, update, context):
+        """Обработчик для CallbackQueryHandler: вызывает обработчик маршрута"""
+        query = update.callback_query
+        data = query.data or ''
+        route, args = self.resolve(data)
+        if route is None:
+            self.unmatched += 1
+            logger.warning(f"No route for callback data {data!r}")
+            await query.answer()
+            return
+        if not callback_codec.is_compact(data):
+            self.legacy += 1
+        context.args = list(args)
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await route.handler(update, context)
+            failed = False
+            return result
+        finally:
+            route.record((time.perf_counter() - started) * 1000, failed)
+
+    def metrics(self):
+        return {
+            'routes': len(self._routes),
+            'unmatched': self.unmatched,
+            'legacy': self.legacy,
+            'calls': {name: route.metrics() for name, route in self._routes.items() if route.calls},
+        }
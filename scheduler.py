@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Планировщик обработки апдейтов: разные пользователи параллельно, один пользователь по очереди.
+
+Диалог расчета хранит шаг в context.user_data["state"], поэтому два апдейта
+одного пользователя нельзя обрабатывать одновременно: второй прочитает
+состояние до того, как первый его обновит. UserScheduler выстраивает задачи с
+одним ключом в цепочку в порядке вызова run(), а общее число одновременно
+выполняемых задач ограничивает семафором. Задача сначала дожидается своей
+очереди у пользователя и только потом занимает слот, так что пользователь с
+пачкой апдейтов не блокирует остальных.
+"""
+
+import asyncio
+import time
+
+
+class UserScheduler:
+    def __init__(self, max_workers):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self._semaphore = asyncio.Semaphore(max_workers)
+        # Последняя задача в очереди каждого ключа: следующая ждет ее завершения
+        self._tails = {}
+        self._queued = 0
+        self._active = 0
+        self._stats = {
+            'max_queue_depth': 0,
+            'max_active': 0,
+            'completed': 0,
+            'failed': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0,
+        }
+
+    async def run(self, key, coroutine):
+        """Выполняет coroutine после всех ранее переданных задач с тем же key.
+
+        key=None - задача без порядка (например, апдейт без пользователя).
+        """
+        loop = asyncio.get_running_loop()
+        previous = self._tails.get(key) if key is not None else None
+        done = loop.create_future()
+        if key is not None:
+            self._tails[key] = done
+
+        queued_at = time.perf_counter()
+        self._queued += 1
+        self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queued)
+        started = False
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            async with self._semaphore:
+                self._queued -= 1
+                started = True
+                self._record_start(time.perf_counter() - queued_at)
+                try:
+                    await coroutine
+                except Exception:
+                    self._stats['failed'] += 1
+                    raise
+                finally:
+                    self._active -= 1
+                    self._stats['completed'] += 1
+        finally:
+            if not started:
+                self._queued -= 1
+                coroutine.close()
+            self._release(key, previous, done)
+
+    def _record_start(self, wait):
+        self._active += 1
+        self._stats['max_active'] = max(self._stats['max_active'], self._active)
+        self._stats['total_wait'] += wait
+        self._stats['max_wait'] = max(self._stats['max_wait'], wait)
+
+    def _release(self, key, previous, done):
+        def finish(_=None):
+            done.set_result(None)
+            if key is not None and self._tails.get(key) is done:
+                del self._tails[key]
+
+        if previous is not None and not previous.done():
+            # Задачу отменили, пока она ждала очереди: следующие задачи все равно
+            # должны дождаться предыдущей, поэтому освобождаем очередь вместе с ней
+            previous.add_done_callback(finish)
+        else:
+            finish()
+
+    def metrics(self):
+        stats = self._stats
+        started = stats['completed'] + self._active
+        return {
+            'max_workers': self.max_workers,
+            'active': self._active,
+            'queue_depth': self._queued,
+            'users_pending': len(self._tails),
+            'max_active': stats['max_active'],
+            'max_queue_depth': stats['max_queue_depth'],
+            'completed': stats['completed'],
+            'failed': stats['failed'],
+            'avg_wait_ms': round(stats['total_wait'] / started * 1000, 2) if started else 0.0,
+            'max_wait_ms': round(stats['max_wait'] * 1000, 2),
+        }
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Хранилище сессий пользователей (context.user_data) в SQLite.
+
+Запись отложенная: save() только ставит снимок сессии в буфер, а фоновый поток
+пишет накопленное одной транзакцией, оставляя по каждому пользователю
+последнюю версию. Незавершенный диалог (state, calc_mode, индексы карточек)
+живет не дольше SESSION_TTL: у сессии, которой давно не пользовались, эти
+ключи отбрасываются. В памяти держится не больше SESSION_MAX_IN_MEMORY
+сессий, остальные подгружаются из базы, когда пользователь вернется.
+"""
+
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+from analytics import create_buffer
+from db_pool import connection
+
+SESSION_TTL = int(os.environ.get('SESSION_TTL_SECONDS', 24 * 60 * 60))
+MAX_SESSIONS = int(os.environ.get('SESSION_MAX_IN_MEMORY', 10000))
+
+# Ключи незавершенного диалога, которые теряют смысл после SESSION_TTL
+VOLATILE_KEYS = frozenset(('state', 'calc_mode', 'activity_keyboard_shown', 'weight_example', 'height_example'))
+# Индексы листания карточек (vitamins_index, current_diets_index и т.п.) из сессий,
+# сохраненных до того, как позиция карточки переехала в callback_data
+VOLATILE_SUFFIX = '_index'
+
+
+def strip_volatile(data):
+    return {key: value for key, value in data.items()
+            if key not in VOLATILE_KEYS and not str(key).endswith(VOLATILE_SUFFIX)}
+
+
+def write_sessions(events):
+    """Пишет пачку событий (user_id, data_json или None для удаления, updated_at) одной транзакцией"""
+    latest = {}
+    for user_id, payload, updated_at in events:
+        latest[user_id] = (payload, updated_at)
+    deleted = [(user_id,) for user_id, (payload, _) in latest.items() if payload is None]
+    saved = [(user_id, payload, updated_at) for user_id, (payload, updated_at) in latest.items()
+             if payload is not None]
+    with connection() as conn:
+        conn.executemany('DELETE FROM user_sessions WHERE user_id = ?', deleted)
+        conn.executemany('''INSERT INTO user_sessions (user_id, data, updated_at) VALUES (?, ?, ?)
+                            ON CONFLICT(user_id) DO UPDATE SET data = excluded.data,
+                                                               updated_at = excluded.updated_at''', saved)
+
+
+class SessionStore:
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS, max_events=200, flush_interval=2.0):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # Сессии в памяти: user_id -> время последней активности, давние в начале
+        self._last_seen = OrderedDict()
+        self._lock = threading.Lock()
+        self.buffer = create_buffer(write_sessions, max_events=max_events,
+                                    flush_interval=flush_interval, name='sessions-flush')
+
+    def _decode(self, payload, updated_at, now):
+        data = json.loads(payload)
+        if now - updated_at > self.ttl:
+            data = strip_volatile(data)
+        return data
+
+    def load_all(self, now=None):
+        """Последние max_sessions сессий для загрузки при запуске: {user_id: data}"""
+        now = time.time() if now is None else now
+        self.buffer.flush()
+        with connection() as conn:
+            rows = conn.execute('''SELECT user_id, data, updated_at FROM user_sessions
+                                   ORDER BY updated_at DESC LIMIT ?''', (self.max_sessions,)).fetchall()
+        sessions = {}
+        with self._lock:
+            for user_id, payload, updated_at in reversed(rows):
+                data = self._decode(payload, updated_at, now)
+                if data:
+                    sessions[user_id] = data
+                    self._last_seen[user_id] = updated_at
+        return sessions
+
+    def load(self, user_id, now=None):
+        """Сессия пользователя из базы или None"""
+        now = time.time() if now is None else now
+        self.buffer.flush()
+        with connection() as conn:
+            row = conn.execute('SELECT data, updated_at FROM user_sessions WHERE user_id = ?',
+                               (user_id,)).fetchone()
+        return self._decode(*row, now) if row else None
+
+    def is_loaded(self, user_id):
+        return user_id in self._last_seen
+
+    def last_seen(self, user_id):
+        return self._last_seen.get(user_id)
+
+    def touch(self, user_id, now=None):
+        with self._lock:
+            self._last_seen[user_id] = time.time() if now is None else now
+            self._last_seen.move_to_end(user_id)
+
+    def save(self, user_id, data, now=None):
+        """Ставит снимок сессии в очередь на запись. Пустая сессия удаляется"""
+        now = time.time() if now is None else now
+        payload = json.dumps(data, ensure_ascii=False, default=str) if data else None
+        # Активность отмечает touch(): сохранение приходит с задержкой и может
+        # относиться к уже выгруженной сессии
+        self.buffer.add((user_id, payload, now))
+
+    def delete(self, user_id):
+        self.buffer.add((user_id, None, time.time()))
+        self.forget(user_id)
+
+    def forget(self, user_id):
+        """Убирает сессию из учета памяти, запись в базе остается"""
+        with self._lock:
+            self._last_seen.pop(user_id, None)
+
+    def eviction_candidates(self, now=None):
+        """Сессии, которые пора выгрузить из памяти: (истек TTL, сверх лимита), давние первыми"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = []
+            for user_id, last_seen in self._last_seen.items():
+                if now - last_seen <= self.ttl:
+                    break
+                expired.append(user_id)
+            overflow_count = len(self._last_seen) - len(expired) - self.max_sessions
+            overflow = list(self._last_seen)[len(expired):len(expired) + overflow_count] if overflow_count > 0 else []
+        return expired, overflow
+
+    def flush(self):
+        return self.buffer.flush()
+
+    def close(self):
+        self.buffer.close()
+
+    def metrics(self):
+        return dict(self.buffer.metrics(), sessions_in_memory=len(self._last_seen))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+
+import database
+import db_pool
+from analytics import ActionBuffer
+from conftest import temporary_database
+
+def test_action_buffer():
+    print("Testing analytics buffer...")
+
+    batches = []
+    flushed = threading.Event()
+
+    def flush_func(events):
+        batches.append(list(events))
+        flushed.set()
+
+    # Сброс по количеству событий
+    buffer = ActionBuffer(flush_func, max_events=3, flush_interval=60)
+    buffer.add(1)
+    buffer.add(2)
+    assert buffer.metrics()['queue_depth'] == 2
+    buffer.add(3)
+    assert flushed.wait(5)
+    assert batches == [[1, 2, 3]], batches
+    buffer.close()
+
+    # Сброс по таймеру
+    batches.clear()
+    flushed.clear()
+    buffer = ActionBuffer(flush_func, max_events=100, flush_interval=0.05)
+    buffer.add('a')
+    assert flushed.wait(5)
+    assert batches == [['a']]
+
+    # Остановка сбрасывает остаток
+    buffer.add('b')
+    buffer.close()
+    assert batches[-1] == ['b']
+    metrics = buffer.metrics()
+    assert metrics['queue_depth'] == 0
+    assert metrics['flushed_events'] == 2
+    assert metrics['flushes'] == 2
+    print(f"Metrics: {metrics}")
+
+def test_failed_flush_keeps_events():
+    attempts = []
+
+    def flaky(events):
+        attempts.append(list(events))
+        if len(attempts) == 1:
+            raise RuntimeError("database is locked")
+
+    buffer = ActionBuffer(flaky, max_events=100, flush_interval=60)
+    buffer.add(1)
+    assert buffer.flush() == 0
+    buffer.add(2)
+    assert buffer.flush() == 2
+    assert attempts[-1] == [1, 2]
+    assert buffer.metrics()['flush_errors'] == 1
+    buffer.close()
+
+def test_track_user_action_batches_writes(temp_db):
+    database.register_user(42, "tester", "Test")
+    for action in ("start_bot", "calculate", "calc_self"):
+        database.track_user_action(42, action)
+    database.action_buffer.flush()
+
+    with db_pool.connection() as conn:
+        actions = [row[0] for row in conn.execute(
+            'SELECT action_type FROM user_actions WHERE user_id = 42 ORDER BY id')]
+        username = conn.execute('SELECT username FROM user_stats WHERE user_id = 42').fetchone()[0]
+    assert actions == ["start_bot", "calculate", "calc_self"]
+    # Обновление last_seen не затирает данные пользователя
+    assert username == "tester"
+    assert database.get_popular_actions(7) == {"start_bot": 1, "calculate": 1, "calc_self": 1}
+
+if __name__ == "__main__":
+    test_action_buffer()
+    test_failed_flush_keeps_events()
+    with temporary_database() as tmp:
+        test_track_user_action_batches_writes(tmp)
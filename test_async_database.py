@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+
+import async_database
+import database
+from conftest import temporary_database
+
+def test_async_database(temp_db):
+    print("Testing async database wrappers...")
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        worker_threads = set()
+
+        def remember_thread(user_id):
+            worker_threads.add(threading.get_ident())
+            database.register_user(user_id, "tester")
+
+        await async_database.run_db(remember_thread, 1)
+        assert loop_thread not in worker_threads
+
+        await async_database.save_weight(1, 70)
+        await async_database.track_user_action(1, "start_bot")
+        history = await async_database.get_weight_history(1)
+        assert isinstance(history, list) and len(history) == 1
+        assert await async_database.get_user_params(1) is None
+
+    asyncio.run(scenario())
+    print("Async wrappers OK")
+
+if __name__ == "__main__":
+    with temporary_database() as tmp:
+        test_async_database(tmp)
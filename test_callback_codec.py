@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import callback_codec
+from callback_codec import CodecError, decode, encode
+
+SAMPLES = {
+    'calc_history_page': [('older', 1), ('newer', 123456789)],
+    'confirm_target': [(55.5,), (80.0,)],
+    'donate_amount': [(300,), (1000,)],
+    'stats': [('refresh',), ('today',), ('week',)],
+    'gender': [('male',), ('female',)],
+    'activity': [('min',), ('very_high',)],
+    'tips_category': [('seasonal',), ('tables',), ('new_category',)],
+    'card_next': [('vitamins',), ('diets',)],
+    'season': [('winter',)],
+    'card': [('vitamins', 0, 1), ('new_category', 12, 4000)],
+    'tips_card': [('seasonal', 3, 57)],
+}
+
+# Прежние callback_data и то, во что они должны разбираться
+LEGACY = {
+    'back_to_main': ('back_to_main', ()),
+    'calculate': ('calculate', ()),
+    'refresh_stats': ('stats', ('refresh',)),
+    'stats_week': ('stats', ('week',)),
+    'donate': ('donate', ()),
+    'donate_300': ('donate_amount', (300,)),
+    'gender_male': ('gender', ('male',)),
+    'gender_female_friend': ('gender', ('female',)),
+    'activity_very_high': ('activity', ('very_high',)),
+    'tips_seasonal': ('tips_category', ('seasonal',)),
+    'prev_vitamins': ('tips_prev', ('vitamins',)),
+    'card_next_seasonal': ('card_next', ('seasonal',)),
+    'calc_history_newer_42': ('calc_history_page', ('newer', 42)),
+    'confirm_target_55.5': ('confirm_target', (55.5,)),
+    'season_spring': ('season', ('spring',)),
+}
+
+def test_round_trip():
+    print("Testing callback codec round trip...")
+    names = [name for name, _ in callback_codec.ACTIONS]
+    assert len(names) == len(set(names)) and len(names) <= len(callback_codec.ALPHABET)
+    for name, fields in callback_codec.ACTIONS:
+        # Для остальных действий хватает первого значения каждого поля
+        samples = SAMPLES.get(name) or [tuple(field.values[0] for field in fields)]
+        for args in samples:
+            data = encode(name, *args)
+            assert callback_codec.is_compact(data) and len(data.encode('utf-8')) <= callback_codec.MAX_BYTES
+            assert decode(data) == (name, args), (name, args, data)
+    # Коды уже отправленных кнопок не меняются
+    assert encode('back_to_main') == '10'
+    assert encode('card_next', 'vitamins') == '1u2'
+    assert encode('calc_history_page', 'older', 71) == '190:1z'
+    print("Callback codec round trip OK")
+
+def test_legacy():
+    print("Testing legacy callback data...")
+    for data, expected in LEGACY.items():
+        assert decode(data) == expected, data
+        # Новая кнопка того же действия разбирается так же
+        assert decode(encode(*expected[:1], *expected[1])) == expected, data
+    print("Legacy callback data OK")
+
+def test_rejects():
+    print("Testing malformed callback data...")
+    for data in ('', '1', '1~', '10x', '1u', '1u2:3', '1uZ', '190', '19x:1', 'donate_abc', 'donate_',
+                 'gender_other', 'activity_extreme', 'calc_history_older', 'card_next_a', 'unknown', '2u2',
+                 # Целые только из [0-9a-z], числа только конечные
+                 '1i-1', '1i+1', '1i 1', '1i1_0', '190:-1', '190: 1', '1cnan', '1cinf', '1c-inf',
+                 'confirm_target_nan', 'confirm_target_inf', 'confirm_target_-Infinity'):
+        assert decode(data) is None, data
+    for action, args in (('unknown', ()), ('donate_amount', ()), ('donate_amount', (-1,)),
+                         ('gender', ('other',)), ('tips_category', ('x',)), ('tips_category', ('a' * 70,)),
+                         ('confirm_target', (float('nan'),)), ('confirm_target', (float('inf'),))):
+        try:
+            encode(action, *args)
+        except CodecError:
+            pass
+        else:
+            raise AssertionError((action, args))
+    print("Malformed callback data OK")
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_legacy()
+    test_rejects()
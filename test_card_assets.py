@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import os
+
+from PIL import Image
+
+import card_assets
+import database
+import db_pool
+from conftest import temporary_database
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def read_image(name):
+    with open(os.path.join(ROOT, 'images', name), 'rb') as f:
+        return f.read()
+
+def test_image_size():
+    print("Testing image headers...")
+    assert card_assets.image_size(read_image('main.jpg')) == (1024, 1024)
+    assert card_assets.image_size(read_image('screen_history.png')) == (1024, 1078)
+    assert card_assets.image_size(b'GIF89a\x10\x00\x20\x00' + b'\x00' * 8) == (16, 32)
+    for data in (b'', b'<html>', b'\xff\xd8\xff\xd9'):
+        try:
+            card_assets.image_size(data)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(data)
+    print("Image headers OK")
+
+def test_optimize():
+    print("Testing image optimization...")
+    # Большая PNG с прозрачностью и шумом, как скриншоты в images/
+    noise = Image.effect_noise((2000, 1500), 40)
+    alpha = Image.linear_gradient('L').resize((2000, 1500))
+    image = Image.merge('RGBA', (noise, noise.transpose(Image.FLIP_LEFT_RIGHT), noise.rotate(180), alpha))
+    source = io.BytesIO()
+    image.save(source, 'PNG')
+    source = source.getvalue()
+
+    data, width, height = card_assets.optimize(source)
+    assert (width, height) == (1280, 960), (width, height)
+    assert card_assets.image_extension(data) == '.jpg' and len(data) < len(source) / 2
+    with Image.open(io.BytesIO(data)) as result:
+        assert result.format == 'JPEG' and result.size == (1280, 960) and result.mode == 'RGB'
+    assert card_assets.image_size(data) == (1280, 960)
+
+    # Варианты для Telegram: каждый меньше предыдущего
+    variants = card_assets.optimize_variants(source, [side for _, side in card_assets.VARIANTS])
+    assert [variant[1:] for variant in variants] == [(1280, 960), (640, 480), (320, 240)]
+    assert variants[0][0] == data and len(variants[0][0]) > len(variants[1][0]) > len(variants[2][0])
+
+    # Маленькая и уже сжатая картинка остается как есть
+    small = io.BytesIO()
+    Image.effect_noise((200, 100), 60).convert('RGB').save(small, 'JPEG', quality=30)
+    assert card_assets.optimize(small.getvalue()) == (small.getvalue(), 200, 100)
+    print(f"Image optimization OK: {len(source)} -> {len(data)} bytes")
+
+def test_build_assets(temp_db):
+    print("Testing card asset pipeline...")
+    images = {'jpg': read_image('main.jpg'), 'png': read_image('screen_history.png')}
+
+    def fetch(image_url):
+        # Без сети: ссылки imgur отдают картинки из images/, заглушка - 404
+        if 'placeholder' in image_url:
+            raise OSError("404 Not Found")
+        return images['png' if 'A4' in image_url else 'jpg']
+
+    assets_dir = card_assets.ASSETS_DIR
+    card_assets.ASSETS_DIR = os.path.join(temp_db, 'assets')
+    try:
+        pending = database.get_cards_for_assets()
+        stats = card_assets.build_assets(fetch=fetch)
+        print(stats)
+        assert stats['built'] + stats['failed'] == len(pending) and stats['failed'] >= 1
+        assert stats['asset_bytes'] <= stats['source_bytes']
+
+        # Одинаковые картинки хранятся одним файлом с именем из хэша содержимого
+        files = [os.path.join(root, name) for root, _, names in os.walk(card_assets.ASSETS_DIR) for name in names]
+        assert len(images) <= len(files) <= len(images) * len(card_assets.VARIANTS)
+        cards = [card for card in database.get_nutrition_cards(limit=100) if card[6]]
+        assert len(cards) == stats['built']
+        for card in cards:
+            path, digest = card[6], card[7]
+            assert path == os.path.join(digest[:2], digest + os.path.splitext(path)[1])
+            with open(card_assets.asset_path(path), 'rb') as f:
+                data = f.read()
+            assert card_assets.image_size(data) is not None and len(data) > 0
+
+        with db_pool.connection() as conn:
+            row = conn.execute('''SELECT asset_width, asset_height, asset_size FROM nutrition_cards
+                                  WHERE id = ?''', (cards[0][0],)).fetchone()
+        assert max(row[:2]) <= card_assets.MAX_SIDE and row[2] > 0
+
+        # Все варианты записаны, основной совпадает с файлом карточки
+        with db_pool.connection() as conn:
+            variants = dict((row[0], row[1:]) for row in conn.execute(
+                'SELECT variant, path, width, height, size FROM card_asset_variants WHERE card_id = ?',
+                (cards[0][0],)))
+        assert set(variants) == {name for name, _ in card_assets.VARIANTS}
+        assert variants['photo'][0] == cards[0][6]
+        for name, side in card_assets.VARIANTS:
+            path, width, height, size = variants[name]
+            assert max(width, height) <= side and os.path.getsize(card_assets.asset_path(path)) == size
+        assert stats['variant_bytes'] > stats['asset_bytes']
+
+        # Повторный запуск берет только карточки без картинок
+        assert card_assets.build_assets(fetch=fetch)['built'] == 0
+        assert card_assets.build_assets(force=True, fetch=fetch)['built'] == stats['built']
+
+        # Смена image_url делает старый файл неактуальным
+        with db_pool.connection() as conn:
+            conn.execute("UPDATE nutrition_cards SET image_url = 'https://i.imgur.com/new.jpg' WHERE id = ?",
+                         (cards[0][0],))
+        database.invalidate_card_cache()
+        changed = [card for card in database.get_nutrition_cards(limit=100) if card[0] == cards[0][0]][0]
+        assert changed[6:8] == (None, None)
+        assert (cards[0][0], 'https://i.imgur.com/new.jpg') in database.get_cards_for_assets()
+        print("Card asset pipeline OK")
+    finally:
+        card_assets.ASSETS_DIR = assets_dir
+
+if __name__ == "__main__":
+    test_image_size()
+    test_optimize()
+    with temporary_database() as tmp:
+        test_build_assets(tmp)
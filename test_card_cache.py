@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import database
+from conftest import temporary_database
+
+def test_card_cache(temp_db):
+    print("Testing nutrition card cache...")
+
+    vitamins = database.get_nutrition_cards('vitamins')
+    assert len(vitamins) == 10
+    assert vitamins[0][1] == 'Витамин А'
+    assert [card[0] for card in vitamins] == sorted(card[0] for card in vitamins)
+    assert all(card[3] == 'vitamins' for card in vitamins)
+    assert len(database.get_nutrition_cards('vitamins', limit=100)) == 13
+    assert database.get_nutrition_cards('unknown') == []
+
+    # Повторные чтения не обращаются к базе
+    calls = []
+    original_connection = database.connection
+    database.connection = lambda: calls.append(1) or original_connection()
+    try:
+        for _ in range(5):
+            database.get_nutrition_cards('diets')
+        assert calls == []
+
+        # Запись карточки сбрасывает кэш
+        database.save_nutrition_card('Новая', 'https://example.com/new.png', 'diets', 'Текст')
+        diets = database.get_nutrition_cards('diets')
+        assert diets[-1][1] == 'Новая'
+
+        database.clear_all_nutrition_cards()
+        assert database.get_nutrition_cards('diets') == []
+    finally:
+        database.connection = original_connection
+    print("Card cache OK")
+
+def test_card_page():
+    print("Testing card pages...")
+    cards = [(id_, f"Карточка {id_}", None, 'diets', None, None) for id_ in (11, 12, 13)]
+
+    assert database.card_page(cards, 0) == (0, cards[0], None, (1, 12))
+    assert database.card_page(cards, 1, 12) == (1, cards[1], (0, 11), (2, 13))
+    assert database.card_page(cards, 2, 13) == (2, cards[2], (1, 12), None)
+    # Каталог изменился после отправки кнопки: карточка ищется по id
+    assert database.card_page(cards, 0, 13)[0] == 2
+    # Карточку удалили: остаемся на ближайшей позиции
+    assert database.card_page(cards, 5, 99)[0] == 2
+    assert database.card_page(cards[:1], 0, 11) == (0, cards[0], None, None)
+    print("Card pages OK")
+
+if __name__ == "__main__":
+    with temporary_database() as tmp:
+        test_card_cache(tmp)
+    test_card_page()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import os
+from types import SimpleNamespace
+
+from telegram import InputFile
+from telegram.error import BadRequest
+
+import card_assets
+import card_media
+import database
+from conftest import temporary_database
+
+class StubBotAPI:
+    """Ответы Bot API на отправку фото: ссылка скачивается и получает file_id"""
+
+    def __init__(self):
+        self.files = {}
+        self.downloads = []
+        self.uploads = []
+        self.sent = []
+        self._ids = itertools.count(1)
+
+    def upload(self, photo):
+        if isinstance(photo, InputFile):
+            # Файл пришел в теле запроса
+            self.uploads.append(photo.input_file_content)
+            file_id = f"file-{next(self._ids)}"
+            self.files[file_id] = photo.filename
+        elif photo.startswith('https://'):
+            self.sent.append(photo)
+            self.downloads.append(photo)
+            file_id = f"file-{next(self._ids)}"
+            self.files[file_id] = photo
+        elif photo in self.files:
+            self.sent.append(photo)
+            file_id = photo
+        else:
+            self.sent.append(photo)
+            raise BadRequest("Wrong file identifier/http url specified")
+        # Telegram отдает несколько размеров, исходный - последний
+        return StubMessage(self, [SimpleNamespace(file_id=f"{file_id}-thumb"), SimpleNamespace(file_id=file_id)])
+
+class StubMessage:
+    def __init__(self, api, photo=None):
+        self.api = api
+        self.photo = photo or []
+
+    async def reply_photo(self, photo, caption=None, reply_markup=None, parse_mode=None):
+        return self.api.upload(photo)
+
+    async def edit_media(self, media, reply_markup=None):
+        if media.caption == "same":
+            raise BadRequest("Message is not modified")
+        return self.api.upload(media.media)
+
+def test_card_media(temp_db):
+    print("Testing card media file_id cache...")
+
+    api = StubBotAPI()
+    card = (7, 'Витамин C', 'https://i.example.com/c.png', 'vitamins', None, 'Текст')
+
+    async def scenario():
+        # Первая отправка: Telegram скачивает картинку по ссылке
+        photo_message = await card_media.show_photo(StubMessage(api), card, "Текст")
+        assert api.downloads == [card[2]]
+        file_id = database.get_media_file_id(7, card_media.image_hash(card[2]))
+        assert file_id == "file-1"
+
+        # Дальше только file_id: и в новом сообщении, и при листании фото.
+        # file_id берется из памяти, база не читается
+        calls = []
+        original_connection = database.connection
+        database.connection = lambda: calls.append(1) or original_connection()
+        try:
+            await card_media.show_photo(StubMessage(api), card, "Текст")
+            await card_media.show_photo(photo_message, card, "Текст")
+        finally:
+            database.connection = original_connection
+        assert calls == []
+        assert api.downloads == [card[2]] and api.sent[1:] == ["file-1", "file-1"]
+
+        # Ошибка, не связанная с файлом, не сбрасывает кэш
+        try:
+            await card_media.show_photo(photo_message, card, "same")
+        except BadRequest:
+            pass
+        else:
+            raise AssertionError("BadRequest swallowed")
+        assert database.get_media_file_id(7, card_media.image_hash(card[2])) == "file-1"
+
+        # Telegram больше не знает file_id: загружаем заново по ссылке
+        api.files.clear()
+        await card_media.show_photo(photo_message, card, "Текст")
+        assert api.downloads == [card[2]] * 2
+        assert database.get_media_file_id(7, card_media.image_hash(card[2])) == "file-2"
+
+        # Новая картинка карточки - новый ключ, старая запись удаляется
+        changed = card[:2] + ('https://i.example.com/c2.png',) + card[3:]
+        await card_media.show_photo(photo_message, changed, "Текст")
+        assert database.get_media_file_id(7, card_media.image_hash(card[2])) is None
+        assert database.get_media_file_id(7, card_media.image_hash(changed[2])) == "file-3"
+
+        # Подготовленный файл загружается с диска, ключ кэша - хэш содержимого
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images', 'main.jpg'), 'rb') as f:
+            data = f.read()
+        asset = card_assets.store(data, 1024, 1024)
+        with_asset = (8, 'Витамин D', 'https://i.example.com/d.png', 'vitamins', None, 'Текст',
+                      asset.path, asset.digest)
+        photo_message = await card_media.show_photo(StubMessage(api), with_asset, "Текст")
+        await card_media.show_photo(photo_message, with_asset, "Текст")
+        assert api.uploads == [data] and with_asset[2] not in api.downloads
+        assert database.get_media_file_id(8, asset.digest) == "file-4"
+
+        # Файла нет на диске: отправляем ссылку
+        missing = with_asset[:6] + ('00/missing.jpg', '00' * 32)
+        await card_media.show_photo(photo_message, missing, "Текст")
+        assert api.downloads[-1] == with_asset[2] and len(api.uploads) == 1
+
+    assets_dir = card_assets.ASSETS_DIR
+    card_assets.ASSETS_DIR = os.path.join(temp_db, 'assets')
+    try:
+        asyncio.run(scenario())
+    finally:
+        card_assets.ASSETS_DIR = assets_dir
+    metrics = card_media.metrics()
+    print(metrics)
+    assert metrics['stale'] == 1 and metrics['cached'] >= 3 and metrics['uploaded'] >= 5
+    assert metrics['uploaded_from_disk'] == 1
+    print("Card media cache OK")
+
+if __name__ == "__main__":
+    with temporary_database() as tmp:
+        test_card_media(tmp)
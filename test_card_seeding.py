@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+
+import card_catalog
+import database
+import db_pool
+from conftest import temporary_database
+
+def card_rows():
+    with db_pool.connection() as conn:
+        return conn.execute('''SELECT id, title, category, content_hash, position
+                               FROM nutrition_cards ORDER BY id''').fetchall()
+
+def test_card_seeding(temp_db):
+    print("Testing card catalog seeding...")
+
+    rows = card_rows()
+    assert len(rows) == len(card_catalog.load_card_catalog().cards)
+
+    # Повторный запуск с тем же каталогом ничего не пишет
+    database.init_db()
+    assert database.seed_cards() == 0
+    assert card_rows() == rows
+
+    # Меняется одна карточка: обновляется только она, id остаются прежними
+    catalog = list(card_catalog.load_card_catalog().cards)
+    title, image_url, category, description = catalog[0]
+    catalog[0] = (title, image_url, category, description + '\nНовая строка')
+    assert database.seed_cards(catalog) == 1
+    updated = card_rows()
+    assert [row[0] for row in updated] == [row[0] for row in rows]
+    assert updated[0][3] != rows[0][3]
+    assert database.get_nutrition_cards(category)[0][5].endswith('Новая строка')
+
+    # Удаленная из каталога карточка удаляется, новая добавляется
+    removed = catalog.pop()
+    catalog.append(('Новая карточка', 'https://example.com/new.png', 'diets', 'Текст'))
+    assert database.seed_cards(catalog) == 2
+    titles = [row[1] for row in card_rows()]
+    assert removed[0] not in titles
+    assert titles[-1] == 'Новая карточка'
+
+    # Возврат к исходному каталогу
+    database.seed_cards()
+    assert [row[1:] for row in card_rows() if row[1] != removed[0]] == \
+        [row[1:] for row in rows if row[1] != removed[0]]
+    print("Card seeding OK")
+
+def test_card_catalog_file():
+    print("Testing card catalog file...")
+
+    catalog = card_catalog.load_card_catalog()
+    assert catalog.version == card_catalog.CATALOG_VERSION
+    assert len(catalog.cards) == 27
+    assert catalog.cards[0][:3] == ('Витамин А', 'https://i.imgur.com/s5la750.png', 'vitamins')
+    assert {card[2] for card in catalog.cards} == {'vitamins', 'seasonal', 'nutrition', 'diets'}
+
+    # Чтение через mmap дает тот же каталог
+    mapped = card_catalog.load_card_catalog(card_catalog.CATALOG_PATH, use_mmap=True)
+    assert mapped == catalog
+    assert card_catalog.catalog_digest() == catalog.digest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cards.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"version": 99, "cards": []}')
+        try:
+            card_catalog.load_card_catalog(path)
+            assert False, "unsupported version must fail"
+        except ValueError:
+            pass
+    print("Card catalog file OK")
+
+if __name__ == "__main__":
+    with temporary_database() as tmp:
+        test_card_seeding(tmp)
+    test_card_catalog_file()
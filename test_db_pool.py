@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import tempfile
+import threading
+
+from db_pool import ConnectionPool
+
+def test_connection_pool():
+    print("Testing connection pool...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'pool.db'), max_size=2, timeout=1)
+
+        with pool.connection() as conn:
+            conn.execute('CREATE TABLE items (value INTEGER)')
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+            # Вложенный вызов в том же потоке получает то же соединение
+            with pool.connection() as nested:
+                assert nested is conn
+                nested.execute('INSERT INTO items VALUES (1)')
+
+        # Ошибка внутри блока откатывает транзакцию
+        try:
+            with pool.connection() as conn:
+                conn.execute('INSERT INTO items VALUES (2)')
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+
+        with pool.connection() as conn:
+            values = [row[0] for row in conn.execute('SELECT value FROM items')]
+        assert values == [1], values
+        print("Commit/rollback OK")
+
+        # Соединения переиспользуются, а не открываются заново
+        seen = set()
+        for _ in range(5):
+            with pool.connection() as conn:
+                seen.add(id(conn))
+        assert len(seen) == 1
+
+        # Пул ограничен: третий поток ждет освобождения соединения
+        entered = threading.Barrier(3)
+        release = threading.Event()
+        errors = []
+
+        def hold():
+            with pool.connection():
+                entered.wait()
+                release.wait()
+
+        holders = [threading.Thread(target=hold) for _ in range(2)]
+        for thread in holders:
+            thread.start()
+        entered.wait()
+        try:
+            with pool.connection():
+                pass
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+        release.set()
+        for thread in holders:
+            thread.join()
+        assert len(errors) == 1
+        print("Pool limit OK")
+
+        pool.close()
+
+if __name__ == "__main__":
+    test_connection_pool()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import database
+import db_pool
+from conftest import temporary_database
+from nutrition import calculate_nutrition_norms
+
+def test_history_pages(temp_db):
+    print("Testing calculation history pagination...")
+
+    for weight in range(60, 67):
+        params = {'weight': weight, 'height': 170, 'age': 30, 'gender': 'женский', 'activity_level': 'средняя'}
+        results = calculate_nutrition_norms(weight, 170, 30, 'женский', 'средняя')
+        database.save_calculation_results(1, results, params)
+    database.save_calculation_results(2, results, params)
+
+    first, has_older, has_newer = database.get_calculation_page(1)
+    assert [calc['weight'] for calc in first] == [66, 65, 64]
+    assert has_older and not has_newer
+    assert set(first[0]) == set(database.HISTORY_COLUMNS)
+
+    second, has_older, has_newer = database.get_calculation_page(1, before_id=first[-1]['id'])
+    assert [calc['weight'] for calc in second] == [63, 62, 61]
+    assert has_older and has_newer
+
+    last, has_older, has_newer = database.get_calculation_page(1, before_id=second[-1]['id'])
+    assert [calc['weight'] for calc in last] == [60]
+    assert not has_older and has_newer
+
+    # Назад возвращаются те же страницы
+    back, has_older, has_newer = database.get_calculation_page(1, after_id=last[0]['id'])
+    assert back == second and has_older and has_newer
+    back, has_older, has_newer = database.get_calculation_page(1, after_id=back[0]['id'])
+    assert back == first and has_older and not has_newer
+
+    assert database.get_calculation_page(3) == ([], False, False)
+
+    # Каждая страница - один проход по индексу без сортировки
+    with db_pool.connection() as conn:
+        plan = ' '.join(row[-1] for row in conn.execute(
+            '''EXPLAIN QUERY PLAN SELECT id FROM calculation_history
+               WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT 4''', (1, 100)))
+    assert 'idx_calculation_history_user_id' in plan and 'TEMP B-TREE' not in plan
+    print("History pagination OK")
+
+if __name__ == "__main__":
+    with temporary_database() as tmp:
+        test_history_pages(tmp)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import callback_codec
+import keyboards
+
+# Клавиатуры в том виде, как их собирали обработчики до реестра, эталон для проверки
+
+def legacy_main_menu():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("🎯 Рассчитать норму", callback_data="calculate")],
+        [InlineKeyboardButton("📋 История расчетов", callback_data="calc_history")],
+        [InlineKeyboardButton("💝 Поддержать бота", callback_data="donate")]
+    ])
+
+def legacy_activity(back="back_to_main", text="◀️ Назад"):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("Минимальная", callback_data="activity_min")],
+        [InlineKeyboardButton("Низкая", callback_data="activity_low")],
+        [InlineKeyboardButton("Средняя", callback_data="activity_medium")],
+        [InlineKeyboardButton("Высокая", callback_data="activity_high")],
+        [InlineKeyboardButton("Очень высокая", callback_data="activity_very_high")],
+        [InlineKeyboardButton(text, callback_data=back)]
+    ])
+
+def legacy_calc_mode():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("Для себя", callback_data="calc_self")],
+        [InlineKeyboardButton("Для друга", callback_data="calc_friend")],
+        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
+    ])
+
+def legacy_gender(suffix=""):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("Мужской", callback_data=f"gender_male{suffix}")],
+        [InlineKeyboardButton("Женский", callback_data=f"gender_female{suffix}")],
+        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
+    ])
+
+def legacy_stats_period():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("📊 Общая статистика", callback_data="refresh_stats")],
+        [InlineKeyboardButton("📅 За сегодня", callback_data="stats_today")],
+        [InlineKeyboardButton("📊 За неделю", callback_data="stats_week")]
+    ])
+
+def legacy_seasonal_submenu():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("Весна", callback_data="season_spring")],
+        [InlineKeyboardButton("Лето", callback_data="season_summer")],
+        [InlineKeyboardButton("Осень", callback_data="season_autumn")],
+        [InlineKeyboardButton("Зима", callback_data="season_winter")],
+        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_tips")]
+    ])
+
+def legacy_tips_navigation(category, current_index=0, total_cards=0):
+    keyboard = []
+    if total_cards > 0:
+        nav_buttons = []
+        if current_index > 0:
+            nav_buttons.append(InlineKeyboardButton("◀️", callback_data=f"prev_{category}"))
+        if current_index < total_cards - 1:
+            nav_buttons.append(InlineKeyboardButton("▶️", callback_data=f"next_{category}"))
+        if nav_buttons:
+            keyboard.append(nav_buttons)
+        keyboard.append([InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_menu")])
+    return InlineKeyboardMarkup(keyboard)
+
+def legacy_card_browser(category):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("◀️", callback_data=f"card_prev_{category}")],
+        [InlineKeyboardButton("▶️", callback_data=f"card_next_{category}")],
+        [InlineKeyboardButton("🔙 Назад в меню", callback_data="back_to_tips")]
+    ])
+
+def legacy_history_navigation(newer_id=None, older_id=None):
+    navigation = []
+    if newer_id is not None:
+        navigation.append(InlineKeyboardButton("⬅️ Новее", callback_data=f"calc_history_newer_{newer_id}"))
+    if older_id is not None:
+        navigation.append(InlineKeyboardButton("Старее ➡️", callback_data=f"calc_history_older_{older_id}"))
+    keyboard = [navigation] if navigation else []
+    keyboard += [
+        [InlineKeyboardButton("🎯 Рассчитать норму", callback_data="calculate")],
+        [InlineKeyboardButton("💝 Поддержать бота", callback_data="donate")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def layout(markup):
+    """Текст кнопок и то, во что разбирается их callback_data"""
+    return [[(button.text, button.url, button.callback_data and callback_codec.decode(button.callback_data))
+             for button in row] for row in markup.inline_keyboard]
+
+def test_static_keyboards():
+    print("Testing static keyboards...")
+    expected = {
+        'MAIN_MENU': legacy_main_menu(),
+        'ACTIVITY': legacy_activity(),
+        'ACTIVITY_AFTER_AGE': legacy_activity("back_to_age", "◀️ Назад к возрасту"),
+        'CALC_MODE': legacy_calc_mode(),
+        'GENDER': legacy_gender(),
+        'STATS_PERIOD': legacy_stats_period(),
+        'SEASONAL_SUBMENU': legacy_seasonal_submenu(),
+    }
+    for name, markup in expected.items():
+        # Те же кнопки, что и раньше; новые callback_data означают то же, что прежние
+        assert layout(keyboards.REGISTRY[name]) == layout(markup), name
+    # Для друга пол выбирается теми же кнопками
+    assert layout(keyboards.GENDER) == layout(legacy_gender("_friend"))
+    assert keyboards.REGISTRY['MAIN_MENU'] is keyboards.MAIN_MENU
+
+    # Общий объект нельзя случайно изменить из обработчика
+    try:
+        keyboards.MAIN_MENU.inline_keyboard = ()
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError("keyboard is mutable")
+    assert layout(keyboards.MAIN_MENU) == layout(legacy_main_menu())
+
+    # Все кнопки в компактном формате и разбираются
+    for name, markup in keyboards.REGISTRY.items():
+        for row in markup.inline_keyboard:
+            for button in row:
+                assert callback_codec.is_compact(button.callback_data), name
+                assert callback_codec.decode(button.callback_data) is not None, name
+    print(f"{len(keyboards.REGISTRY)} static keyboards OK")
+
+def test_dynamic_keyboards():
+    print("Testing dynamic keyboards...")
+    for function in keyboards.DYNAMIC:
+        function.cache_clear()
+
+    # Стрелки ведут на соседние карточки: (позиция, id)
+    for previous, following in ((None, None), (None, (1, 12)), ((0, 11), (2, 13)), ((1, 12), None)):
+        rows = layout(keyboards.tips_navigation("seasonal", previous, following))
+        arrows = [("tips_card", ("seasonal", *neighbour)) for neighbour in (previous, following) if neighbour]
+        assert [[callback for _, _, callback in row] for row in rows[:-1]] == ([arrows] if arrows else [])
+        assert rows[-1] == [("🔙 Назад в меню", None, ("back_to_menu", ()))]
+    rows = layout(keyboards.card_browser("tables", (3, 40), (5, 42)))
+    assert [row[0][2] for row in rows] == [("card", ("tables", 3, 40)), ("card", ("tables", 5, 42)), ("back_to_tips", ())]
+    assert layout(keyboards.card_browser("tables")) == [[("🔙 Назад в меню", None, ("back_to_tips", ()))]]
+    for newer_id, older_id in ((None, None), (7, None), (None, 5), (9, 7)):
+        assert (layout(keyboards.history_navigation(newer_id, older_id))
+                == layout(legacy_history_navigation(newer_id, older_id)))
+    payment = keyboards.payment("https://pay.example/1").to_dict()['inline_keyboard']
+    assert payment[0][0]['url'] == "https://pay.example/1"
+    assert callback_codec.decode(payment[1][0]['callback_data']) == ("donate", ())
+
+    # Повторный запрос отдает тот же объект из кэша
+    assert keyboards.tips_navigation("seasonal", (0, 1), (2, 3)) is keyboards.tips_navigation("seasonal", (0, 1), (2, 3))
+    assert keyboards.card_browser("tables") is keyboards.card_browser("tables")
+
+    # Кэш ограничен: старые варианты вытесняются
+    for index in range(keyboards.KEYBOARD_CACHE_SIZE * 2):
+        keyboards.tips_navigation("seasonal", (index, index), (index + 2, index + 2))
+    metrics = keyboards.metrics()
+    print(metrics)
+    assert metrics['tips_navigation']['size'] == keyboards.KEYBOARD_CACHE_SIZE
+    assert metrics['card_browser'] == {'hits': 2, 'misses': 2, 'size': 2}
+    print("Dynamic keyboards OK")
+
+if __name__ == "__main__":
+    test_static_keyboards()
+    test_dynamic_keyboards()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+import itertools
+
+import messages
+from nutrition import calculate_nutrition_norms
+
+# Форматирование до messages.py, эталон для проверки
+
+def legacy_format_calculation_results(results):
+    """Форматирует результаты расчета в текст"""
+    return (
+        f"📊 *Результаты расчета*\n\n"
+        f"• Базовый обмен веществ: {results['bmr']} ккал\n"
+        f"• Норма калорий для поддержания текущего веса: {results['maintenance_calories']} ккал\n"
+        f"• Безопасный дефицит 15% для похудения: {results['deficit_calories_15']} ккал\n"
+        f"• Дефицит 20%: {results['deficit_calories_20']} ккал\n"
+        f"• Профицит 10%: {results['surplus_calories']} ккал\n\n"
+        f"🥗 *Рекомендуемые БЖУ:*\n"
+        f"🥩 *Белки:* {results['protein_min']}-{results['protein_max']}г\n"
+        f"🥑 *Жиры:* {results['fat_min']}-{results['fat_max']}г\n"
+        f"🍚 *Углеводы:* {results['carbs_min']}-{results['carbs_max']}г\n\n"
+        f"💧 *Норма воды:*\n"
+        f"• {results['water_norm_min']}-{results['water_norm_max']}мл в день\n"
+        f"• Это примерно {int(results['water_norm_min']/250)}-{int(results['water_norm_max']/250)} стаканов\n\n"
+        f"👣 *Рекомендуемые шаги:* {results['recommended_steps_min']}-{results['recommended_steps_max']}\n\n"
+        f"📏 *ИМТ:* {results['bmi']} ({results['bmi_category']})"
+    )
+
+def legacy_format_history_entry(calc):
+    # Тело цикла show_calculation_history из исходного main.py
+    try:
+        # SQLite возвращает дату в формате YYYY-MM-DD HH:MM:SS
+        date_obj = datetime.strptime(calc['date'], "%Y-%m-%d %H:%M:%S")
+        message = f"📅 *{date_obj.strftime('%d.%m.%Y')}*\n"
+    except (ValueError, TypeError) as e:
+        # Если формат даты неверный, используем дату как есть
+        message = f"📅 *{calc['date']}*\n"
+
+    message += f"👤 *Параметры:*\n"
+    message += f"• Вес: {calc['weight']} кг\n"
+    message += f"• Рост: {calc['height']} см\n"
+    message += f"• Возраст: {calc['age']} лет\n"
+    message += f"• Активность: {calc['activity_level']}\n\n"
+    message += f"🎯 *Расчетные нормы:*\n"
+    message += f"• Базовый метаболизм (BMR): {calc['bmr']} ккал\n"
+    message += f"• Норма калорий: {calc['maintenance_calories']} ккал\n"
+    message += f"• Дефицит (15%): {calc['deficit_calories_15']} ккал\n"
+    message += f"• Дефицит (20%): {calc['deficit_calories_20']} ккал\n"
+    message += f"• Профицит (+10%): {calc['surplus_calories']} ккал\n\n"
+    message += f"🥗 *БЖУ:*\n"
+    message += f"• Белки: {calc['protein_min']}-{calc['protein_max']}г\n"
+    message += f"• Жиры: {calc['fat_min']}-{calc['fat_max']}г\n"
+    message += f"• Углеводы: {calc['carbs_min']}-{calc['carbs_max']}г\n\n"
+    message += f"📏 *ИМТ:*\n"
+    message += f"• Индекс: {calc['bmi']:.1f}\n"
+    message += f"• Категория: {calc['bmi_category']}\n\n"
+    message += f"💧 *Норма воды:*\n"
+    message += f"• {int(calc['water_norm_min'])}-{int(calc['water_norm_max'])} мл в день\n"
+    message += f"• Это примерно {int(calc['water_norm_min']/250)}-{int(calc['water_norm_max']/250)} стаканов\n\n"
+
+    # Добавляем рекомендуемое количество шагов из истории, если есть
+    if 'recommended_steps_min' in calc and 'recommended_steps_max' in calc:
+        message += f"🚶 *Рекомендуемое количество шагов:*\n"
+        message += f"• {calc['recommended_steps_min']}-{calc['recommended_steps_max']} шагов в день\n\n"
+
+    message += "➖➖➖➖➖➖➖➖➖➖\n\n"
+    return message
+
+def legacy_format_statistics_message(stats):
+    if not stats:
+        return "❌ Не удалось получить статистику"
+    
+    message = "📊 *Статистика бота*\n\n"
+    
+    message += "👥 *Пользователи:*\n"
+    message += f"• Всего пользователей: {stats.get('total_users', 0)}\n"
+    message += f"• Активных за 7 дней: {stats.get('active_users_7d', 0)}\n"
+    message += f"• Активных за 30 дней: {stats.get('active_users_30d', 0)}\n"
+    message += f"• Новых сегодня: {stats.get('new_users_today', 0)}\n"
+    message += f"• Новых за неделю: {stats.get('new_users_week', 0)}\n\n"
+    
+    message += "🎯 *Расчеты:*\n"
+    message += f"• Всего расчетов: {stats.get('total_calculations', 0)}\n"
+    message += f"• Расчетов сегодня: {stats.get('calculations_today', 0)}\n"
+    message += f"• Расчетов за неделю: {stats.get('calculations_week', 0)}\n\n"
+    
+    if stats.get('gender_stats'):
+        message += "👤 *По полу:*\n"
+        for gender, count in stats['gender_stats'].items():
+            gender_emoji = "👨" if gender == "мужской" else "👩"
+            message += f"• {gender_emoji} {gender}: {count}\n"
+        message += "\n"
+    
+    if stats.get('avg_age', 0) > 0:
+        message += f"📅 *Средний возраст:* {stats['avg_age']} лет\n\n"
+    
+    if stats.get('activity_stats'):
+        message += "🏃 *По активности:*\n"
+        for activity, count in stats['activity_stats'].items():
+            message += f"• {activity}: {count}\n"
+        message += "\n"
+    
+    if stats.get('donations_total'):
+        message += "💝 *Донаты:*\n"
+        message += f"• Всего: {stats['donations_total']} на {stats.get('donations_amount_total', 0):g} ₽\n"
+        message += f"• За неделю: {stats.get('donations_week', 0)} на {stats.get('donations_amount_week', 0):g} ₽\n\n"
+    
+    return message
+
+def legacy_render_history(history):
+    message = "📊 *История расчетов:*\n\n"
+    message += "".join(legacy_format_history_entry(calc) for calc in history)
+    return message
+
+GOLDEN_RESULTS = (
+    "📊 *Результаты расчета*\n\n"
+    "• Базовый обмен веществ: 1483 ккал\n"
+    "• Норма калорий для поддержания текущего веса: 2298 ккал\n"
+    "• Безопасный дефицит 15% для похудения: 1954 ккал\n"
+    "• Дефицит 20%: 1839 ккал\n"
+    "• Профицит 10%: 2528 ккал\n\n"
+    "🥗 *Рекомендуемые БЖУ:*\n"
+    "🥩 *Белки:* 139-154г\n"
+    "🥑 *Жиры:* 64-89г\n"
+    "🍚 *Углеводы:* 206-277г\n\n"
+    "💧 *Норма воды:*\n"
+    "• 2194-2414мл в день\n"
+    "• Это примерно 8-9 стаканов\n\n"
+    "👣 *Рекомендуемые шаги:* 8550-10450\n\n"
+    "📏 *ИМТ:* 22.9 (Нормальный вес)"
+)
+
+def make_calculations():
+    rows = []
+    dates = ["2024-03-05 09:15:00", "2023-12-31 23:59:59", "2024-02-29 00:00:60",
+             "2024-02-30 10:00:00", "2024-1-5 3:04:05", "2024-03-05", "вчера", None]
+    profiles = itertools.product([48.5, 70, 93.2], [160, 181.5], [17, 33, 58],
+                                 ["мужской", "женский"], ["минимальная", "высокая"])
+    for number, (weight, height, age, gender, activity) in enumerate(profiles):
+        calc = calculate_nutrition_norms(weight, height, age, gender, activity)
+        calc.update(id=number, date=dates[number % len(dates)], weight=weight, height=height,
+                    age=age, activity_level=activity)
+        if number % 5 == 0:
+            calc['recommended_steps_min'] = calc['recommended_steps_max'] = 0
+        elif number % 7 == 0:
+            # Старые записи без шагов
+            del calc['recommended_steps_min'], calc['recommended_steps_max']
+        rows.append(calc)
+    return rows
+
+def test_messages_match_legacy():
+    print("Testing messages against legacy formatting...")
+    calculations = make_calculations()
+
+    for calc in calculations:
+        if 'recommended_steps_min' in calc:
+            assert messages.render_calculation_results(calc) == legacy_format_calculation_results(calc)
+        assert messages.render_history_entry(calc) == legacy_format_history_entry(calc)
+    for size in (1, 3, 10, len(calculations)):
+        assert messages.render_history(calculations[:size]) == legacy_render_history(calculations[:size])
+
+    results = calculate_nutrition_norms(70, 175, 30, "женский", "средняя")
+    assert messages.render_calculation_results(results).encode('utf-8') == GOLDEN_RESULTS.encode('utf-8')
+    assert messages.format_history_date("2024-03-05 09:15:00") == "05.03.2024"
+    assert messages.format_history_date("2024-02-30 10:00:00") == "2024-02-30 10:00:00"
+
+    stats_samples = [
+        {},
+        {'total_users': 10},
+        {'total_users': 120, 'active_users_7d': 40, 'active_users_30d': 80, 'new_users_today': 3,
+         'new_users_week': 12, 'total_calculations': 300, 'calculations_today': 7, 'calculations_week': 50,
+         'gender_stats': {'мужской': 100, 'женский': 190, 'другой': 10}, 'avg_age': 34.5,
+         'activity_stats': {'средняя': 150, 'высокая': 150},
+         'donations_total': 4, 'donations_amount_total': 2100.0, 'donations_week': 1, 'donations_amount_week': 300.5},
+        {'total_users': 5, 'gender_stats': {}, 'avg_age': 0, 'activity_stats': {}, 'donations_total': 0},
+    ]
+    for stats in stats_samples:
+        assert messages.render_statistics(stats) == legacy_format_statistics_message(stats)
+    print("Messages OK")
+
+if __name__ == "__main__":
+    test_messages_match_legacy()
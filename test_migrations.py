@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+
+import database
+import db_pool
+from conftest import temporary_database
+from migrations import MIGRATIONS, migrate, get_schema_version
+
+# Горячие запросы из database.py и индексы, которые они должны использовать
+HOT_QUERIES = [
+    ('''SELECT * FROM calculation_history WHERE user_id = ? ORDER BY date DESC LIMIT ?''',
+     (1, 5), 'idx_calculation_history_user_date'),
+    ('''SELECT action_type, COUNT(*) as count FROM user_actions
+        WHERE timestamp >= datetime('now', '-7 days', '+3 hours')
+        GROUP BY action_type ORDER BY count DESC''',
+     (), 'idx_user_actions_timestamp_type'),
+    ('''SELECT COUNT(DISTINCT user_id) FROM user_actions
+        WHERE timestamp >= datetime(?, 'start of day', '+3 hours')
+        AND timestamp < datetime(?, '+1 day', '+3 hours')''',
+     ('2024-01-01', '2024-01-01'), 'idx_user_actions_timestamp_user'),
+    ('''SELECT COUNT(*) FROM user_stats WHERE last_seen >= datetime('now', '-7 days', '+3 hours')''',
+     (), 'idx_user_stats_last_seen'),
+    ('''SELECT COUNT(*) FROM user_stats WHERE first_seen >= datetime('now', '-7 days', '+3 hours')''',
+     (), 'idx_user_stats_first_seen'),
+    ('''SELECT COUNT(*) FROM calculation_history WHERE date >= datetime('now', '-7 days', '+3 hours')''',
+     (), 'idx_calculation_history_date'),
+    ('''SELECT COUNT(*) FROM weight_history
+        WHERE date >= datetime(?, 'start of day', '+3 hours')
+        AND date < datetime(?, '+1 day', '+3 hours')''',
+     ('2024-01-01', '2024-01-01'), 'idx_weight_history_date'),
+]
+
+def test_migrations(temp_db):
+    print("Testing schema migrations and query plans...")
+
+    with db_pool.connection() as conn:
+        latest = MIGRATIONS[-1][0]
+        assert get_schema_version(conn) == latest
+        # Повторный запуск ничего не делает
+        assert migrate(conn) == latest
+        assert conn.execute('SELECT COUNT(*) FROM schema_version').fetchone()[0] == len(MIGRATIONS)
+
+        for sql, params, index in HOT_QUERIES:
+            plan = ' | '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+            print(f"{index}: {plan}")
+            assert index in plan, plan
+
+        # История пользователя читается по индексу без отдельной сортировки
+        plan = ' | '.join(row[3] for row in conn.execute(
+            'EXPLAIN QUERY PLAN ' + HOT_QUERIES[0][0], HOT_QUERIES[0][1]))
+        assert 'TEMP B-TREE' not in plan, plan
+
+def test_failed_migration_is_rolled_back():
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = db_pool.ConnectionPool(os.path.join(tmp, 'broken.db'))
+        broken = [
+            (1, "ok", ['CREATE TABLE a (x INTEGER)']),
+            (2, "broken", ['CREATE TABLE b (x INTEGER)', 'CREATE TABLE a (x INTEGER)']),
+        ]
+        try:
+            with pool.connection() as conn:
+                migrate(conn, broken)
+        except Exception:
+            pass
+        with pool.connection() as conn:
+            assert get_schema_version(conn) == 1
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            assert 'b' not in tables
+        pool.close()
+
+if __name__ == "__main__":
+    with temporary_database() as tmp:
+        test_migrations(tmp)
+    test_failed_migration_is_rolled_back()
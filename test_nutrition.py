@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import itertools
+
+import nutrition
+from nutrition import ACTIVITY_LEVELS, RESULT_FIELDS, calculate_nutrition_norms, calculate_nutrition_norms_batch
+
+GENDERS = ["мужской", "женский", "другой"]
+ACTIVITIES = list(nutrition.ACTIVITY_LEVELS) + ["неизвестная"]
+# Границы возрастных категорий, климакса и жиров с соседними значениями
+AGES = [12, 17, 18, 29, 30, 44, 45, 49, 50, 54, 55, 56, 64, 65, 80, 100]
+WEIGHTS = [45.0, 62.5, 70.0, 88.3, 120.0]
+HEIGHTS = [150.0, 165.0, 175.5, 190.0]
+
+def legacy_calculate_nutrition_norms(weight, height, age, gender, activity_level):
+    """Расчет до таблицы коэффициентов, эталон для проверки"""
+    # Базовый обмен веществ (формула Миффлина-Сан Жеора)
+    if gender == "мужской":
+        bmr = 10 * weight + 6.25 * height - 5 * age + 5
+    else:
+        bmr = 10 * weight + 6.25 * height - 5 * age - 161
+        
+    # Умножаем на коэффициент активности
+    activity_multiplier = ACTIVITY_LEVELS.get(activity_level, 1.55)
+    maintenance_calories = bmr * activity_multiplier
+    
+    # Рассчитываем дефицит и профицит
+    deficit_calories_15 = maintenance_calories * 0.85
+    deficit_calories_20 = maintenance_calories * 0.8
+    surplus_calories = maintenance_calories * 1.1
+    
+    # Рассчитываем БЖУ согласно научным рекомендациям с учетом возраста
+    # Определяем возрастную категорию
+    if age < 18:
+        age_category = "подросток"
+    elif age < 30:
+        age_category = "молодой"
+    elif age < 50:
+        age_category = "средний"
+    elif age < 65:
+        age_category = "зрелый"
+    else:
+        age_category = "пожилой"
+    
+    # Белки: современные рекомендации с учетом возраста, пола, активности и климакса
+    # Базовые нормы по возрасту (г/кг веса)
+    base_protein_multipliers = {
+        "подросток": (1.8, 2.2),  # Высокая потребность для роста и развития
+        "молодой": (1.8, 2.2),    # Стандартные рекомендации для активного возраста
+        "средний": (1.8, 2.0),    # Поддержание мышечной массы
+        "зрелый": (1.8, 2.0),     # Увеличенная потребность для предотвращения саркопении
+        "пожилой": (1.6, 1.8)     # Минимальные для поддержания здоровья, но достаточные
+    }
+    
+    # Корректировка по полу
+    gender_protein_multiplier = {
+        "мужской": 1.05,  # Мужчинам нужно немного больше белка
+        "женский": 1.0
+    }
+    
+    # Корректировка по уровню активности
+    activity_protein_multiplier = {
+        "минимальная": 1.0,      # Сидячий образ жизни
+        "низкая": 1.05,          # Легкие тренировки
+        "средняя": 1.1,          # Умеренные тренировки
+        "высокая": 1.15,         # Интенсивные тренировки
+        "очень высокая": 1.2     # Ежедневные интенсивные тренировки
+    }
+    
+    # Корректировка по климаксу для женщин (45-55 лет - перименопауза, 55+ - постменопауза)
+    menopause_multiplier = 1.0
+    if gender == "женский":
+        if age >= 45 and age <= 55:
+            menopause_multiplier = 1.1  # Перименопауза: повышенная потребность в белке
+        elif age > 55:
+            menopause_multiplier = 1.15  # Постменопауза: еще больше белка для предотвращения остеопороза
+    
+    # Получаем базовые множители для возраста
+    protein_min_mult, protein_max_mult = base_protein_multipliers.get(age_category, (1.8, 2.2))
+    
+    # Применяем корректировки по полу, активности и климаксу
+    gender_mult = gender_protein_multiplier.get(gender, 1.0)
+    activity_mult = activity_protein_multiplier.get(activity_level, 1.1)
+    
+    # Рассчитываем финальные нормы белков
+    protein_min = weight * protein_min_mult * gender_mult * activity_mult * menopause_multiplier
+    protein_max = weight * protein_max_mult * gender_mult * activity_mult * menopause_multiplier
+    
+    # Жиры: корректировка по полу, возрасту и климаксу
+    if gender == "мужской":
+        if age < 18:
+            fat_percentage_min, fat_percentage_max = 0.25, 0.35  # Подростки: больше жиров
+        elif age < 30:
+            fat_percentage_min, fat_percentage_max = 0.20, 0.30  # Молодые мужчины
+        elif age < 50:
+            fat_percentage_min, fat_percentage_max = 0.20, 0.30  # Средний возраст
+        else:
+            fat_percentage_min, fat_percentage_max = 0.25, 0.35  # Пожилые: больше жиров
+        fat_min_per_kg = 0.8
+    else:
+        # Учет климакса для женщин
+        if age < 18:
+            fat_percentage_min, fat_percentage_max = 0.30, 0.40  # Подростки: больше жиров
+        elif age < 30:
+            fat_percentage_min, fat_percentage_max = 0.25, 0.35  # Молодые женщины
+        elif age < 45:
+            fat_percentage_min, fat_percentage_max = 0.25, 0.35  # Средний возраст
+        elif age < 55:
+            # Перименопауза: немного больше жиров для гормональной поддержки
+            fat_percentage_min, fat_percentage_max = 0.30, 0.40
+        else:
+            # Постменопауза: больше жиров для усвоения жирорастворимых витаминов
+            fat_percentage_min, fat_percentage_max = 0.30, 0.40
+        fat_min_per_kg = 0.9
+    
+    # Рассчитываем жиры от калорийности
+    fat_min_calories = maintenance_calories * fat_percentage_min
+    fat_max_calories = maintenance_calories * fat_percentage_max
+    fat_min = max(fat_min_calories / 9, weight * fat_min_per_kg)  # Минимум из расчета и веса
+    fat_max = fat_max_calories / 9
+    
+    # Углеводы: оставшиеся калории после белков и жиров
+    # Используем дефицит калорий для расчета углеводов
+    protein_calories_min = protein_min * 4
+    protein_calories_max = protein_max * 4
+    fat_calories_min = fat_min * 9
+    fat_calories_max = fat_max * 9
+    
+    # Углеводы для дефицита (похудение)
+    remaining_calories_deficit = deficit_calories_15 - protein_calories_min - fat_calories_min
+    carbs_min = max(remaining_calories_deficit / 4, 50)  # Минимум 50г углеводов
+    
+    # Углеводы для профицита (набор массы)
+    remaining_calories_surplus = surplus_calories - protein_calories_max - fat_calories_max
+    carbs_max = remaining_calories_surplus / 4
+    
+    # Рассчитываем ИМТ
+    height_m = height / 100
+    bmi = weight / (height_m * height_m)
+    
+    # Определяем категорию ИМТ
+    if bmi < 18.5:
+        bmi_category = "Недостаточный вес"
+    elif bmi < 25:
+        bmi_category = "Нормальный вес"
+    elif bmi < 30:
+        bmi_category = "Избыточный вес"
+    else:
+        bmi_category = "Ожирение"
+        
+    # Рассчитываем норму воды согласно научным рекомендациям с учетом возраста, пола, активности и климакса
+    # Базовая норма: 30-35мл на кг веса
+    
+    # Корректировка по полу
+    if gender == "мужской":
+        water_multiplier = 1.1  # Мужчинам нужно больше воды
+    else:
+        water_multiplier = 1.0
+    
+    # Корректировка по возрасту (используем уже определенную age_category)
+    age_water_multipliers = {
+        "подросток": 1.1,    # Подростки: повышенная потребность в воде
+        "молодой": 1.0,      # Молодые: стандартная норма
+        "средний": 0.95,     # Средний возраст: небольшое снижение
+        "зрелый": 0.9,       # Зрелый возраст: снижение потребности
+        "пожилой": 0.85      # Пожилые: значительное снижение
+    }
+    age_multiplier = age_water_multipliers.get(age_category, 1.0)
+    
+    # Корректировка по активности
+    activity_water_multiplier = {
+        "минимальная": 1.0,
+        "низкая": 1.05,
+        "средняя": 1.1,
+        "высокая": 1.15,
+        "очень высокая": 1.2
+    }.get(activity_level, 1.1)
+    
+    # Корректировка по климаксу для женщин
+    menopause_water_multiplier = 1.0
+    if gender == "женский":
+        if age >= 45 and age <= 55:
+            menopause_water_multiplier = 1.05  # Перименопауза: немного больше воды
+        elif age > 55:
+            menopause_water_multiplier = 1.1   # Постменопауза: больше воды для вывода токсинов
+    
+    # Базовая норма воды в зависимости от возраста
+    base_water_per_kg = 30
+    
+    # Рассчитываем норму воды
+    water_norm_min = weight * base_water_per_kg * water_multiplier * age_multiplier * activity_water_multiplier * menopause_water_multiplier
+    water_norm_max = water_norm_min * 1.1  # +10% для индивидуальных различий
+    
+    # Рассчитываем рекомендуемые шаги с учетом возраста, пола и активности
+    # Базовые нормы шагов
+    base_steps = {
+        "минимальная": 6000,
+        "низкая": 8000,
+        "средняя": 10000,
+        "высокая": 12000,
+        "очень высокая": 15000
+    }
+    
+    # Корректировка по возрасту
+    age_steps_multiplier = {
+        "подросток": 1.1,    # Подростки: больше активности
+        "молодой": 1.0,      # Молодые: стандартная норма
+        "средний": 0.95,     # Средний возраст: небольшое снижение
+        "зрелый": 0.9,       # Зрелый возраст: снижение активности
+        "пожилой": 0.8       # Пожилые: значительное снижение
+    }.get(age_category, 1.0)
+    
+    # Корректировка по полу
+    gender_steps_multiplier = {
+        "мужской": 1.05,  # Мужчинам рекомендуется больше шагов
+        "женский": 1.0
+    }.get(gender, 1.0)
+    
+    # Корректировка по климаксу для женщин
+    menopause_steps_multiplier = 1.0
+    if gender == "женский":
+        if age >= 45 and age <= 55:
+            menopause_steps_multiplier = 0.95  # Перименопауза: немного меньше активности
+        elif age > 55:
+            menopause_steps_multiplier = 0.9   # Постменопауза: снижение активности
+    
+    # Рассчитываем рекомендуемые шаги
+    base_steps_for_activity = base_steps.get(activity_level, 10000)
+    recommended_steps_min = int(base_steps_for_activity * age_steps_multiplier * gender_steps_multiplier * menopause_steps_multiplier * 0.9)
+    recommended_steps_max = int(base_steps_for_activity * age_steps_multiplier * gender_steps_multiplier * menopause_steps_multiplier * 1.1)
+    
+    return {
+        'bmr': round(bmr),
+        'maintenance_calories': round(maintenance_calories),
+        'deficit_calories_15': round(deficit_calories_15),
+        'deficit_calories_20': round(deficit_calories_20),
+        'surplus_calories': round(surplus_calories),
+        'protein_min': round(protein_min),
+        'protein_max': round(protein_max),
+        'fat_min': round(fat_min),
+        'fat_max': round(fat_max),
+        'carbs_min': round(carbs_min),
+        'carbs_max': round(carbs_max),
+        'bmi': round(bmi, 1),
+        'bmi_category': bmi_category,
+        'water_norm_min': round(water_norm_min),
+        'water_norm_max': round(water_norm_max),
+        'recommended_steps_min': recommended_steps_min,
+        'recommended_steps_max': recommended_steps_max
+    }
+
+def profiles():
+    rows = list(itertools.product(WEIGHTS, HEIGHTS, AGES, GENDERS, ACTIVITIES))
+    return [list(column) for column in zip(*rows)]
+
+def check_batch(columns, batch):
+    for index, row in enumerate(zip(*columns)):
+        expected = calculate_nutrition_norms(*row)
+        for field in RESULT_FIELDS:
+            value = batch[field][index]
+            value = value.item() if hasattr(value, 'item') else value
+            assert value == expected[field] and type(value) is type(expected[field]), \
+                (row, field, value, expected[field])
+
+def test_batch_matches_scalar():
+    print("Testing batch nutrition calculation...")
+    columns = profiles()
+
+    check_batch(columns, calculate_nutrition_norms_batch(*columns, use_numpy=False))
+    if nutrition.np is None:
+        print("NumPy is not installed, vectorized path skipped")
+    else:
+        check_batch(columns, calculate_nutrition_norms_batch(*columns, use_numpy=True))
+        empty = calculate_nutrition_norms_batch([], [], [], [], [], use_numpy=True)
+        assert all(len(empty[field]) == 0 for field in RESULT_FIELDS)
+    print(f"Batch calculation OK for {len(columns[0])} profiles")
+
+def test_coefficient_table_matches_legacy():
+    print("Testing coefficient table against the legacy formula...")
+    ages = list(range(12, 101)) + [44.5, 45.0, 54.9, 55.0, 55.5, 64.9]
+    checked = 0
+    for gender, activity_level, age in itertools.product(GENDERS, ACTIVITIES, ages):
+        for weight, height in itertools.product(WEIGHTS, HEIGHTS):
+            expected = legacy_calculate_nutrition_norms(weight, height, age, gender, activity_level)
+            actual = calculate_nutrition_norms(weight, height, age, gender, activity_level)
+            assert actual == expected, (weight, height, age, gender, activity_level)
+            assert [type(actual[field]) for field in RESULT_FIELDS] == \
+                [type(expected[field]) for field in RESULT_FIELDS]
+            checked += 1
+    print(f"Coefficient table OK for {checked} combinations")
+
+def test_report_cache():
+    print("Testing nutrition report cache...")
+    nutrition.clear_nutrition_cache()
+
+    results, message = nutrition.get_nutrition_report(70, 175, 30, "мужской", "средняя")
+    assert results == calculate_nutrition_norms(70.0, 175.0, 30, "мужской", "средняя")
+    assert message == nutrition.format_calculation_results(results)
+    assert nutrition.nutrition_cache_info()['misses'] == 1
+
+    # Те же входы в другой записи попадают в кэш
+    results['bmr'] = 0
+    again, _ = nutrition.get_nutrition_report(70.0, 175.0, 30, "мужской", "средняя")
+    assert again['bmr'] != 0
+    nutrition.get_nutrition_report(60, 165, 40, "женский", "неизвестная")
+    nutrition.get_nutrition_report(60, 165, 40, "женский", "средняя")
+    info = nutrition.nutrition_cache_info()
+    assert (info['hits'], info['misses'], info['size']) == (2, 2, 2)
+    assert info['max_size'] == nutrition.NORMS_CACHE_SIZE
+
+    nutrition.clear_nutrition_cache()
+    assert nutrition.nutrition_cache_info()['size'] == 0
+    print("Report cache OK")
+
+if __name__ == "__main__":
+    test_batch_matches_scalar()
+    test_coefficient_table_matches_legacy()
+    test_report_cache()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import database
+import db_pool
+from conftest import temporary_database
+
+def test_payment_links(temp_db):
+    print("Testing payment link cache...")
+
+    assert database.get_payment_link(1, 300) is None
+    database.save_payment_link(1, 300, 'pay-1', 'https://pay.example/1', ttl=600, now=1000)
+    database.save_payment_link(1, 500, 'pay-2', 'https://pay.example/2', ttl=600, now=1000)
+
+    # Ссылка выдается повторно только тому же пользователю и на ту же сумму
+    assert database.get_payment_link(1, 300, now=1300) == ('pay-1', 'https://pay.example/1')
+    assert database.get_payment_link(2, 300, now=1300) is None
+    assert database.get_payment_link(1, 1000, now=1300) is None
+    # Истекает по времени
+    assert database.get_payment_link(1, 300, now=1600) is None
+
+    # И по статусу платежа
+    assert database.set_payment_link_status('pay-2', 'succeeded') == 1
+    assert database.get_payment_link(1, 500, now=1300) is None
+    assert database.set_payment_link_status('unknown', 'succeeded') == 0
+
+    # Новая ссылка заменяет старую, давно истекшие удаляются
+    database.save_payment_link(1, 500, 'pay-3', 'https://pay.example/3', ttl=600, now=1400)
+    assert database.get_payment_link(1, 500, now=1500) == ('pay-3', 'https://pay.example/3')
+    database.save_payment_link(2, 300, 'pay-4', 'https://pay.example/4', ttl=600, now=2300)
+    with db_pool.connection() as conn:
+        rows = conn.execute('SELECT payment_id FROM payment_links ORDER BY payment_id').fetchall()
+    assert rows == [('pay-3',), ('pay-4',)]
+    print("Payment link cache OK")
+
+def test_record_payment(temp_db):
+    print("Testing donation recording...")
+
+    database.save_payment_link(1, 300, 'pay-1', 'https://pay.example/1')
+
+    assert database.record_payment('pay-1', 'waiting_for_capture', 300.0, 1) is False
+    assert database.get_payment_link(1, 300) is None
+
+    # Повторное уведомление о том же платеже не удваивает статистику
+    assert database.record_payment('pay-1', 'succeeded', 300.0, 1) is True
+    assert database.record_payment('pay-1', 'succeeded', 300.0, 1) is False
+    assert database.record_payment('pay-2', 'succeeded', 500.0, None) is True
+    assert database.record_payment('pay-3', 'canceled', 1000.0, 2) is False
+
+    today = database.get_daily_stats()
+    assert today['donations'] == 2 and today['donations_amount'] == 800
+    stats = database.get_user_statistics()
+    assert stats['donations_total'] == 2 and stats['donations_amount_week'] == 800
+    message = database.format_statistics_message(stats)
+    assert "Всего: 2 на 800 ₽" in message
+    with db_pool.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM donations').fetchone()[0] == 2
+    print("Donation recording OK")
+
+if __name__ == "__main__":
+    with temporary_database() as tmp:
+        test_payment_links(tmp)
+    with temporary_database() as tmp:
+        test_record_payment(tmp)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import database
+import db_pool
+import rollups
+from conftest import temporary_database
+
+RESULTS = {
+    'bmr': 1500, 'maintenance_calories': 1800, 'deficit_calories_15': 1530,
+    'deficit_calories_20': 1440, 'surplus_calories': 1980, 'protein_min': 120,
+    'protein_max': 150, 'fat_min': 40, 'fat_max': 60, 'carbs_min': 180,
+    'carbs_max': 220, 'bmi': 22.5, 'bmi_category': 'Нормальный вес',
+    'water_norm_min': 2000, 'water_norm_max': 2500,
+    'recommended_steps_min': 8000, 'recommended_steps_max': 10000
+}
+
+def snapshot(conn):
+    return (
+        conn.execute('SELECT name, key, value FROM stats_counters ORDER BY name, key').fetchall(),
+        conn.execute('''SELECT date, new_users, active_users, total_calculations, total_weight_entries
+                        FROM daily_stats ORDER BY date''').fetchall(),
+    )
+
+def test_rollups(temp_db):
+    print("Testing incremental statistics...")
+
+    database.register_user(1, "first")
+    database.register_user(1, "first")  # повторная регистрация не считается
+    database.register_user(2, "second")
+    database.track_user_action(1, "start_bot")
+    database.track_user_action(1, "calculate")
+    database.track_user_action(3, "calculate")  # пользователь без /start
+
+    database.save_calculation_results(1, RESULTS, {
+        'weight': 70, 'height': 175, 'age': 30, 'gender': 'мужской', 'activity_level': 'средняя'})
+    database.save_calculation_results(2, RESULTS, {
+        'weight': 60, 'height': 165, 'age': 40, 'gender': 'женский', 'activity_level': 'высокая'})
+    database.save_calculation_results(2, RESULTS, {
+        'weight': 61, 'height': 165, 'age': 41, 'gender': 'женский', 'activity_level': 'высокая'})
+    database.save_weight(1, 70)
+
+    stats = database.get_user_statistics()
+    print(stats)
+    assert stats['total_users'] == 3
+    assert stats['new_users_today'] == 3
+    assert stats['new_users_week'] == 3
+    assert stats['active_users_7d'] == 3
+    assert stats['total_calculations'] == 3
+    assert stats['calculations_today'] == 3
+    assert stats['calculations_week'] == 3
+    assert stats['gender_stats'] == {'мужской': 1, 'женский': 2}
+    assert stats['activity_stats'] == {'средняя': 1, 'высокая': 2}
+    assert stats['avg_age'] == 37.0
+
+    today = database.get_daily_stats()
+    assert today['new_users'] == 3
+    assert today['active_users'] == 2
+    assert today['calculations'] == 3
+    assert today['weight_entries'] == 1
+
+    # Пересборка с нуля дает те же агрегаты, что и инкрементальные обновления
+    with db_pool.connection() as conn:
+        incremental = snapshot(conn)
+        rollups.rebuild(conn)
+        assert snapshot(conn) == incremental
+
+if __name__ == "__main__":
+    with temporary_database() as tmp:
+        test_rollups(tmp)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+from types import SimpleNamespace
+
+from callback_codec import encode
+from router import CallbackRouter
+
+class StubQuery:
+    def __init__(self, data):
+        self.data = data
+        self.answered = 0
+
+    async def answer(self):
+        self.answered += 1
+
+def make_router(calls):
+    def handler(name):
+        async def handle(update, context):
+            calls.append((name, tuple(context.args)))
+            if name == "fail":
+                raise RuntimeError("handler failed")
+        return handle
+
+    router = CallbackRouter()
+    for action in ("back_to_main", "calculate", "calc_history", "calc_history_page", "donate_amount",
+                   "gender", "activity", "card_next"):
+        router.route(action, handler(action))
+    router.route("about_bot", handler("fail"))
+    return router
+
+def test_resolve():
+    print("Testing callback routes...")
+    router = make_router([])
+    cases = {
+        "calculate": ("calculate", ()),
+        encode("calculate"): ("calculate", ()),
+        "donate_500": ("donate_amount", (500,)),
+        encode("donate_amount", 500): ("donate_amount", (500,)),
+        "gender_female_friend": ("gender", ("female",)),
+        "activity_very_high": ("activity", ("very_high",)),
+        "card_next_seasonal": ("card_next", ("seasonal",)),
+        encode("card_next", "seasonal"): ("card_next", ("seasonal",)),
+        "calc_history_older_17": ("calc_history_page", ("older", 17)),
+    }
+    for data, (name, args) in cases.items():
+        route, parsed = router.resolve(data)
+        assert route is not None and (route.name, parsed) == (name, args), data
+
+    # Неразборчивые строки и действия без обработчика
+    for data in ("donate_abc", "calc_history_older", "unknown", "", "1", "1~", encode("donate"), "season_spring"):
+        assert router.resolve(data) == (None, ()), data
+
+    try:
+        router.route("calculate", None)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("duplicate route accepted")
+    print("Callback routes OK")
+
+def test_dispatch():
+    print("Testing callback dispatch...")
+    calls = []
+    router = make_router(calls)
+
+    async def press(data):
+        update = SimpleNamespace(callback_query=StubQuery(data))
+        context = SimpleNamespace(args=None)
+        try:
+            await router.dispatch(update, context)
+        except RuntimeError:
+            pass
+        return update.callback_query
+
+    async def run():
+        await press("donate_300")
+        await press("gender_male_friend")
+        await press(encode("gender", "female"))
+        await press(encode("about_bot"))
+        # Неизвестная кнопка: отвечаем, чтобы у пользователя не висели часики
+        assert (await press("season_spring")).answered == 1
+
+    asyncio.run(run())
+    assert calls == [("donate_amount", (300,)), ("gender", ("male",)), ("gender", ("female",)), ("fail", ())]
+    metrics = router.metrics()
+    print(metrics)
+    assert metrics['unmatched'] == 1 and metrics['legacy'] == 2
+    assert metrics['calls']['gender']['calls'] == 2
+    assert sum(metrics['calls']['gender']['histogram'].values()) == 2
+    assert metrics['calls']['about_bot']['errors'] == 1
+    assert 'calculate' not in metrics['calls']
+    print("Callback dispatch OK")
+
+if __name__ == "__main__":
+    test_resolve()
+    test_dispatch()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import random
+from types import SimpleNamespace
+
+from scheduler import UserScheduler
+from update_processor import PerUserUpdateProcessor
+
+async def check_ordering():
+    scheduler = UserScheduler(max_workers=4)
+    log = {user: [] for user in range(10)}
+    running = set()
+    peak = 0
+    rng = random.Random(7)
+
+    async def handler(user, number):
+        nonlocal peak
+        assert user not in running, "updates of one user overlapped"
+        running.add(user)
+        peak = max(peak, len(running))
+        await asyncio.sleep(rng.random() / 500)
+        log[user].append(number)
+        running.discard(user)
+
+    tasks = [asyncio.create_task(scheduler.run(user, handler(user, number)))
+             for number in range(20) for user in range(10)]
+    await asyncio.gather(*tasks)
+
+    assert all(numbers == list(range(20)) for numbers in log.values())
+    metrics = scheduler.metrics()
+    print(metrics)
+    assert peak == 4 and metrics['max_active'] == 4
+    assert metrics['completed'] == 200 and metrics['failed'] == 0
+    assert metrics['queue_depth'] == 0 and metrics['active'] == 0 and metrics['users_pending'] == 0
+    assert metrics['max_queue_depth'] == 200 - 4  # первые четыре стартуют сразу
+
+async def check_failures_and_cancellation():
+    scheduler = UserScheduler(max_workers=2)
+    order = []
+    release = asyncio.Event()
+
+    async def slow():
+        await release.wait()
+        order.append('slow')
+
+    async def failing():
+        order.append('failing')
+        raise ValueError("boom")
+
+    async def record(name):
+        order.append(name)
+
+    first = asyncio.create_task(scheduler.run(1, slow()))
+    second = asyncio.create_task(scheduler.run(1, failing()))
+    cancelled = asyncio.create_task(scheduler.run(1, record('cancelled')))
+    last = asyncio.create_task(scheduler.run(1, record('last')))
+    await asyncio.sleep(0.01)
+
+    # Отмена задачи в очереди не дает следующей обогнать выполняющуюся
+    cancelled.cancel()
+    await asyncio.sleep(0.01)
+    assert order == []
+    release.set()
+
+    await first
+    try:
+        await second
+        assert False, "exception must propagate"
+    except ValueError:
+        pass
+    await last
+    assert cancelled.cancelled()
+    assert order == ['slow', 'failing', 'last']
+    metrics = scheduler.metrics()
+    assert metrics['failed'] == 1 and metrics['completed'] == 3 and metrics['users_pending'] == 0
+
+    # Задачи без ключа не упорядочиваются
+    await asyncio.gather(scheduler.run(None, record('a')), scheduler.run(None, record('b')))
+
+async def check_update_processor():
+    # Апдейты идут через process_update базового класса, как в Application
+    processor = PerUserUpdateProcessor(2)
+    assert 'process_update' not in vars(PerUserUpdateProcessor)
+    release = asyncio.Event()
+    running = []
+    peak = 0
+    order = []
+
+    async def handler(user, number):
+        nonlocal peak
+        running.append(user)
+        peak = max(peak, len(running))
+        if user == 0:
+            await release.wait()
+        await asyncio.sleep(0)
+        order.append((user, number))
+        running.remove(user)
+
+    def update(user):
+        return SimpleNamespace(effective_user=SimpleNamespace(id=user), effective_chat=None)
+
+    # Очередь первого пользователя не занимает слоты остальных
+    busy = [asyncio.create_task(processor.process_update(update(0), handler(0, n))) for n in range(5)]
+    others = [processor.process_update(update(user), handler(user, 0)) for user in range(1, 4)]
+    await asyncio.gather(*others)
+    assert sorted(order) == [(1, 0), (2, 0), (3, 0)] and peak == 2
+    release.set()
+    await asyncio.gather(*busy)
+    assert [number for user, number in order if user == 0] == list(range(5))
+    assert processor.metrics()['completed'] == 8
+
+def test_scheduler():
+    print("Testing per-user update scheduler...")
+    asyncio.run(check_ordering())
+    asyncio.run(check_failures_and_cancellation())
+    asyncio.run(check_update_processor())
+    print("Scheduler OK")
+
+if __name__ == "__main__":
+    test_scheduler()
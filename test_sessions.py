@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import db_pool
+from conftest import temporary_database
+from sessions import SessionStore, strip_volatile, write_sessions
+
+def test_sessions(temp_db):
+    print("Testing persistent user sessions...")
+
+    store = SessionStore(ttl=100, max_sessions=2, flush_interval=60)
+    try:
+        # Запись отложенная, повторные сохранения схлопываются в одну строку
+        store.save(1, {'state': 'waiting_weight', 'weight': 70}, now=1000)
+        store.save(1, {'state': 'waiting_height', 'weight': 70, 'vitamins_index': 3}, now=1010)
+        store.save(2, {'calc_mode': 'self'}, now=1020)
+        with db_pool.connection() as conn:
+            assert conn.execute('SELECT COUNT(*) FROM user_sessions').fetchone()[0] == 0
+        assert store.flush() == 3
+        with db_pool.connection() as conn:
+            assert conn.execute('SELECT COUNT(*) FROM user_sessions').fetchone()[0] == 2
+
+        assert store.load(1, now=1050) == {'state': 'waiting_height', 'weight': 70, 'vitamins_index': 3}
+        # После TTL незавершенный диалог отбрасывается, остальные данные остаются
+        assert store.load(1, now=2000) == {'weight': 70}
+        assert store.load(3) is None
+
+        # Пустая сессия удаляется
+        store.save(2, {}, now=1030)
+        store.save(3, {'weight': 80}, now=1040)
+        store.save(4, {'height': 180}, now=1050)
+        store.delete(4)
+        store.flush()
+        with db_pool.connection() as conn:
+            rows = conn.execute('SELECT user_id FROM user_sessions ORDER BY user_id').fetchall()
+        assert rows == [(1,), (3,)]
+
+        # При запуске загружаются только последние max_sessions сессий
+        store.save(5, {'weight': 90}, now=1060)
+        store.flush()
+        fresh = SessionStore(ttl=100, max_sessions=2, flush_interval=60)
+        try:
+            assert fresh.load_all(now=1070) == {3: {'weight': 80}, 5: {'weight': 90}}
+            assert fresh.is_loaded(3) and not fresh.is_loaded(1)
+        finally:
+            fresh.close()
+
+        # Выгрузка из памяти: сначала истекшие, затем сверх лимита
+        for user_id in list(store._last_seen):
+            store.forget(user_id)
+        store.touch(1, now=1000)
+        store.touch(3, now=1100)
+        store.touch(5, now=1150)
+        store.touch(6, now=1160)
+        assert store.eviction_candidates(now=1120) == ([1], [3])
+        store.forget(1)
+        assert store.eviction_candidates(now=1120) == ([], [3])
+        assert not store.is_loaded(1)
+
+        assert strip_volatile({'state': 1, 'current_diets_index': 2, 'target_weight': 60}) == {'target_weight': 60}
+        write_sessions([(7, '{"a": 1}', 1.0), (7, None, 2.0)])
+        assert store.load(7) is None
+
+        metrics = store.metrics()
+        assert metrics['flush_errors'] == 0 and metrics['sessions_in_memory'] == 3
+        print("Sessions OK")
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    with temporary_database() as tmp:
+        test_sessions(tmp)
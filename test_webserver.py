@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+
+from webserver import WebServer, webhook_handler
+
+async def request(reader, writer, method, path, body=b'', headers=()):
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(body)}"]
+    lines.extend(f"{name}: {value}" for name, value in headers)
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ')[1])
+    length = int(head.lower().split(b'content-length: ')[1].split(b'\r\n')[0])
+    return status, await reader.readexactly(length)
+
+async def run_checks():
+    received = []
+
+    async def submit(data):
+        received.append(data)
+
+    server = WebServer()
+    hook = webhook_handler(submit, secret_token="s3cret")
+    server.add_route('POST', '/telegram', hook)
+    server.add_status_section('updates', lambda: dict(hook.stats))
+    await server.start('127.0.0.1', 0)
+    try:
+        # Все запросы идут по одному keep-alive соединению
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+
+        status, body = await request(reader, writer, 'GET', '/')
+        assert status == 200 and 'Бот работает' in body.decode('utf-8')
+        assert await request(reader, writer, 'GET', '/health') == (200, b'ok')
+        assert (await request(reader, writer, 'GET', '/missing'))[0] == 404
+        assert (await request(reader, writer, 'GET', '/telegram'))[0] == 405
+
+        update = json.dumps({'update_id': 1, 'message': {'text': 'привет'}}).encode('utf-8')
+        assert (await request(reader, writer, 'POST', '/telegram', update))[0] == 403
+        assert (await request(reader, writer, 'POST', '/telegram', update,
+                              [('X-Telegram-Bot-Api-Secret-Token', 'wrong')]))[0] == 403
+        assert (await request(reader, writer, 'POST', '/telegram', b'not json',
+                              [('X-Telegram-Bot-Api-Secret-Token', 's3cret')]))[0] == 400
+        assert await request(reader, writer, 'POST', '/telegram', update,
+                             [('X-Telegram-Bot-Api-Secret-Token', 's3cret')]) == (200, b'ok')
+        assert received == [{'update_id': 1, 'message': {'text': 'привет'}}]
+
+        status, body = await request(reader, writer, 'GET', '/status')
+        status_data = json.loads(body)
+        assert status == 200 and status_data['status'] == 'online'
+        assert status_data['updates'] == {'updates_received': 1, 'updates_rejected': 3}
+        assert status_data['http']['requests'] == 9
+        writer.close()
+
+        # Слишком большое тело отклоняется до чтения
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        writer.write(b"POST /telegram HTTP/1.1\r\nContent-Length: 99999999\r\n\r\n")
+        await writer.drain()
+        assert (await reader.readuntil(b'\r\n\r\n')).startswith(b'HTTP/1.1 413')
+        writer.close()
+    finally:
+        await server.stop()
+
+def test_webserver():
+    print("Testing webhook HTTP server...")
+    asyncio.run(run_checks())
+    print("Webhook server OK")
+
+if __name__ == "__main__":
+    test_webserver()
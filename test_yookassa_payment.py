@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+
+from webserver import Request, WebServer, json_response, text_response
+from yookassa_payment import PaymentError, YooKassaPayment, notification_handler
+
+class StubYooKassa:
+    """Заглушка API: первые failures запросов отвечают 503, затем платеж создается"""
+
+    def __init__(self, failures=0, delay=0.0, status=200):
+        self.failures = failures
+        self.delay = delay
+        self.status = status
+        self.requests = []
+        self.peers = set()
+        self.active = 0
+        self.max_active = 0
+
+    async def create(self, request):
+        self.requests.append(request)
+        self.peers.add(request.peer)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if len(self.requests) <= self.failures:
+            return text_response(503, "try later")
+        if self.status != 200:
+            return text_response(self.status, "bad request")
+        body = json.loads(request.body)
+        return json_response({
+            'id': 'pay-1',
+            'status': 'pending',
+            'amount': body['amount'],
+            'confirmation': {'type': 'redirect', 'confirmation_url': 'https://pay.example/pay-1'},
+            'metadata': body['metadata'],
+        })
+
+    async def get(self, request):
+        return json_response({'id': 'pay-1', 'status': 'succeeded', 'amount': {'value': '300.00'}})
+
+    async def get_without_status(self, request):
+        return json_response({'id': 'pay-2', 'amount': {'value': '300.00'}})
+
+    async def get_not_json(self, request):
+        return text_response(200, "<html>maintenance</html>")
+
+async def with_stub(stub, check, **client_kwargs):
+    server = WebServer()
+    server.add_route('POST', '/payments', stub.create)
+    server.add_route('GET', '/payments/pay-1', stub.get)
+    server.add_route('GET', '/payments/pay-2', stub.get_without_status)
+    server.add_route('GET', '/payments/pay-3', stub.get_not_json)
+    await server.start('127.0.0.1', 0)
+    client = YooKassaPayment('shop', 'secret', api_url=f'http://127.0.0.1:{server.port}', **client_kwargs)
+    try:
+        await check(client)
+    finally:
+        await client.close()
+        # Даем заглушке доответить на брошенные по сроку запросы
+        while stub.active:
+            await asyncio.sleep(0.01)
+        await server.stop()
+        await asyncio.sleep(0.01)
+
+async def check_retries(client):
+    stub = check_retries.stub
+    payment = await client.create_payment(300, "Донат", user_id=42)
+    assert payment.id == 'pay-1' and payment.confirmation_url == 'https://pay.example/pay-1'
+    assert payment.metadata['user_id'] == '42'
+    # Повторы идут с тем же ключом идемпотентности и по одному соединению
+    keys = {request.headers['idempotence-key'] for request in stub.requests}
+    assert len(stub.requests) == 3 and keys == {payment.metadata['order_id']}
+    assert all(request.headers['authorization'].startswith('Basic ') for request in stub.requests)
+    assert len(stub.peers) == 1
+    assert (await client.get_payment('pay-1')).status == 'succeeded'
+    metrics = client.metrics()
+    print(metrics)
+    assert metrics['requests'] == 4 and metrics['retries'] == 2 and metrics['failures'] == 0
+
+async def check_client_error(client):
+    assert await client.create_payment(300, "Донат") is None
+    assert len(check_client_error.stub.requests) == 1
+    assert client.metrics()['failures'] == 1
+
+async def check_bad_responses(client):
+    # Ответ без статуса или не в JSON не должен сойти за состояние платежа
+    for payment_id in ('pay-2', 'pay-3'):
+        try:
+            await client.get_payment(payment_id)
+        except PaymentError:
+            pass
+        else:
+            raise AssertionError(f"{payment_id} accepted")
+    assert client.metrics()['failures'] == 1
+
+async def check_deadline(client):
+    started = asyncio.get_running_loop().time()
+    assert await client.create_payment(300, "Донат") is None
+    assert asyncio.get_running_loop().time() - started < 0.4
+
+async def check_concurrency(client):
+    payments = await asyncio.gather(*(client.create_payment(300, "Донат", user_id=user) for user in range(10)))
+    assert all(payments)
+    assert check_concurrency.stub.max_active == 3
+    assert client.metrics()['max_in_flight'] == 3
+
+def test_yookassa_payment():
+    print("Testing YooKassa payment client...")
+    check_retries.stub = StubYooKassa(failures=2)
+    asyncio.run(with_stub(check_retries.stub, check_retries, backoff=0.01))
+    check_client_error.stub = StubYooKassa(status=400)
+    asyncio.run(with_stub(check_client_error.stub, check_client_error, backoff=0.01))
+    asyncio.run(with_stub(StubYooKassa(), check_bad_responses, backoff=0.01))
+    asyncio.run(with_stub(StubYooKassa(delay=0.5), check_deadline, timeout=0.2, backoff=0.01))
+    check_concurrency.stub = StubYooKassa(delay=0.05)
+    asyncio.run(with_stub(check_concurrency.stub, check_concurrency, max_concurrency=3))
+    print("YooKassa payment client OK")
+
+async def check_notifications():
+    recorded = []
+
+    async def record(payment):
+        if payment.id == 'broken':
+            raise RuntimeError("database is locked")
+        recorded.append(payment)
+
+    handle = notification_handler(record, networks=('185.71.76.0/27', '2a02:5180::/32'))
+
+    def notification(peer, event='payment.succeeded', status='succeeded', payment_id='pay-1', headers=None):
+        body = json.dumps({'type': 'notification', 'event': event, 'object': {
+            'id': payment_id, 'status': status, 'paid': True,
+            'amount': {'value': '300.00', 'currency': 'RUB'}, 'metadata': {'user_id': '42'},
+        }}).encode('utf-8')
+        return Request('POST', '/yookassa/notify', '', headers or {}, body, (peer, 443))
+
+    assert (await handle(notification('185.71.76.5'))).status == 200
+    assert (await handle(notification('::ffff:185.71.76.6'))).status == 200
+    assert (await handle(notification('2a02:5180::1'))).status == 200
+    assert recorded[0].amount == '300.00' and recorded[0].metadata['user_id'] == '42'
+    # Чужой адрес, в том числе подставленный в X-Forwarded-For, отклоняется
+    assert (await handle(notification('10.0.0.1'))).status == 403
+    assert (await handle(notification('10.0.0.1', headers={'x-forwarded-for': '185.71.76.5'}))).status == 403
+    # Событие должно соответствовать статусу платежа
+    assert (await handle(notification('185.71.76.5', status='pending'))).status == 400
+    assert (await handle(notification('185.71.76.5', event='refund.succeeded'))).status == 400
+    assert (await handle(Request('POST', '/', '', {}, b'{', ('185.71.76.5', 443)))).status == 400
+    # Ошибка записи - 500, чтобы YooKassa повторила уведомление
+    assert (await handle(notification('185.71.76.5', payment_id='broken'))).status == 500
+    assert len(recorded) == 3
+    assert handle.stats == {'notifications_received': 3, 'notifications_rejected': 5, 'notifications_failed': 1}
+
+    proxied = notification_handler(record, networks=('185.71.76.0/27',), trust_forwarded=True)
+    forwarded = {'x-forwarded-for': '10.0.0.1, 185.71.76.5'}
+    assert (await proxied(notification('127.0.0.1', headers=forwarded))).status == 200
+
+def test_notification_handler():
+    print("Testing YooKassa notification handler...")
+    asyncio.run(check_notifications())
+    print("Notification handler OK")
+
+if __name__ == "__main__":
+    test_yookassa_payment()
+    test_notification_handler()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Процессор апдейтов python-telegram-bot поверх UserScheduler.
+
+Подключается через Application.builder().concurrent_updates(PerUserUpdateProcessor(n)):
+апдейты разных пользователей обрабатываются параллельно (не больше n сразу),
+апдейты одного пользователя - строго по очереди.
+
+Семафор BaseUpdateProcessor ограничивает число принятых апдейтов: и
+выполняемых, и ждущих очереди своего пользователя. Ждущие апдейты не должны
+занимать слоты остальных пользователей, поэтому принимается в
+PENDING_PER_WORKER раз больше, а выполняется сразу не больше n - это
+ограничивает UserScheduler.
+"""
+
+from telegram.ext import BaseUpdateProcessor
+
+from scheduler import UserScheduler
+
+# Сколько апдейтов принимается на один слот выполнения
+PENDING_PER_WORKER = 4
+
+
+def update_key(update):
+    """Ключ очереди: пользователь, а для апдейтов без пользователя - чат"""
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return ('user', user.id)
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return ('chat', chat.id)
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates * PENDING_PER_WORKER)
+        self.scheduler = UserScheduler(max_concurrent_updates)
+
+    async def do_process_update(self, update, coroutine):
+        # Вызывается из process_update базового класса под его семафором
+        await self.scheduler.run(update_key(update), coroutine)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def metrics(self):
+        return self.scheduler.metrics()
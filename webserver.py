@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Встроенный HTTP-сервер для режима webhook.
+
+Работает в том же цикле событий, что и бот: принимает апдейты от Telegram
+(POST на путь webhook с секретным заголовком) и отвечает на пинги
+мониторинга по /, /status и /health. Отдельный поток с Flask не нужен.
+
+Сервер намеренно минимальный: HTTP/1.1 с keep-alive, тело только с
+Content-Length, без TLS (его делает прокси или платформа хостинга).
+"""
+
+import asyncio
+from collections import namedtuple
+from contextlib import suppress
+from datetime import datetime
+from http import HTTPStatus
+import hmac
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает secret_token из setWebhook
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+KEEPALIVE_TIMEOUT = 75
+
+Request = namedtuple('Request', ['method', 'path', 'query', 'headers', 'body', 'peer'])
+Response = namedtuple('Response', ['status', 'body', 'content_type', 'headers'])
+
+
+def text_response(status, text, headers=()):
+    return Response(status, text.encode('utf-8'), 'text/plain; charset=utf-8', tuple(headers))
+
+
+def json_response(data, status=200):
+    body = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+    return Response(status, body, 'application/json', ())
+
+
+class WebServer:
+    """HTTP-сервер на asyncio с таблицей маршрутов {путь: {метод: обработчик}}.
+
+    Обработчик - корутина, которая получает Request и возвращает Response.
+    """
+
+    def __init__(self, max_body=MAX_BODY_BYTES, keepalive_timeout=KEEPALIVE_TIMEOUT):
+        self.max_body = max_body
+        self.keepalive_timeout = keepalive_timeout
+        self.started_at = datetime.now()
+        self._routes = {}
+        self._status_sections = {}
+        self._server = None
+        self._connections = set()
+        self._metrics = {'requests': 0, 'responses_4xx': 0, 'responses_5xx': 0}
+
+        self.add_route('GET', '/', self._home)
+        self.add_route('GET', '/status', self._status)
+        self.add_route('GET', '/health', self._health)
+
+    def add_route(self, method, path, handler):
+        self._routes.setdefault(path, {})[method.upper()] = handler
+
+    def add_status_section(self, name, func):
+        """Добавляет в ответ /status раздел name со значением func()"""
+        self._status_sections[name] = func
+
+    def metrics(self):
+        return dict(self._metrics, open_connections=len(self._connections))
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1] if self._server else None
+
+    async def start(self, host='0.0.0.0', port=8080):
+        self._server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        logger.info(f"HTTP server listening on {host}:{self.port}")
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        # Закрываем и простаивающие keep-alive соединения, иначе wait_closed будет ждать их
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _home(self, request):
+        return text_response(200, f"Бот работает! Время запуска: {self.started_at.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    async def _status(self, request):
+        now = datetime.now()
+        data = {
+            "status": "online",
+            "uptime": str(now - self.started_at),
+            "last_check": now.strftime('%Y-%m-%d %H:%M:%S'),
+            "http": self.metrics(),
+        }
+        for name, func in self._status_sections.items():
+            try:
+                data[name] = func()
+            except Exception as e:
+                logger.error(f"Status section {name} failed: {e}")
+                data[name] = None
+        return json_response(data)
+
+    async def _health(self, request):
+        return text_response(200, "ok")
+
+    async def _dispatch(self, request):
+        methods = self._routes.get(request.path)
+        if methods is None:
+            return text_response(404, "not found")
+        handler = methods.get(request.method)
+        if handler is None and request.method == 'HEAD':
+            handler = methods.get('GET')
+        if handler is None:
+            return text_response(405, "method not allowed", [('Allow', ', '.join(sorted(methods)))])
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"Error handling {request.method} {request.path}: {e}", exc_info=True)
+            return text_response(500, "internal error")
+
+    async def _handle_connection(self, reader, writer):
+        self._connections.add(writer)
+        peer = writer.get_extra_info('peername')
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.keepalive_timeout)
+                except asyncio.LimitOverrunError:
+                    await self._write(writer, text_response(431, "headers too large"), False)
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+
+                request, error = self._parse_head(head, peer)
+                if error is not None:
+                    await self._write(writer, error, False)
+                    break
+                length = request.headers.get('content-length', '0')
+                if not length.isdigit():
+                    await self._write(writer, text_response(400, "bad content-length"), False)
+                    break
+                if int(length) > self.max_body:
+                    await self._write(writer, text_response(413, "payload too large"), False)
+                    break
+                try:
+                    body = await reader.readexactly(int(length)) if int(length) else b''
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                self._metrics['requests'] += 1
+                response = await self._dispatch(request._replace(body=body))
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                await self._write(writer, response, keep_alive, head_only=request.method == 'HEAD')
+                if not keep_alive:
+                    break
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            with suppress(Exception):
+                await writer.wait_closed()
+
+    def _parse_head(self, head, peer):
+        """Разбирает строку запроса и заголовки. Возвращает (Request, None) или (None, ответ с ошибкой)"""
+        lines = head[:-4].decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            return None, text_response(400, "bad request")
+        method, target, version = parts
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            return None, text_response(501, "chunked encoding is not supported")
+        if version == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive':
+            headers['connection'] = 'close'
+        path, _, query = target.partition('?')
+        return Request(method.upper(), path, query, headers, b'', peer), None
+
+    async def _write(self, writer, response, keep_alive, head_only=False):
+        if response.status >= 500:
+            self._metrics['responses_5xx'] += 1
+        elif response.status >= 400:
+            self._metrics['responses_4xx'] += 1
+        lines = [
+            f"HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}",
+            f"Content-Type: {response.content_type}",
+            f"Content-Length: {len(response.body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in response.headers)
+        data = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        if not head_only:
+            data += response.body
+        try:
+            writer.write(data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def webhook_handler(submit, secret_token=None):
+    """Обработчик POST от Telegram: проверяет секрет и передает JSON апдейта в submit(data).
+
+    submit должен быстро поставить апдейт в очередь, обработка идет отдельно,
+    а Telegram сразу получает 200.
+    """
+    expected = secret_token.encode('utf-8') if secret_token else None
+    stats = {'updates_received': 0, 'updates_rejected': 0}
+
+    async def handle(request):
+        if expected is not None:
+            provided = request.headers.get(SECRET_HEADER, '').encode('utf-8')
+            if not hmac.compare_digest(provided, expected):
+                stats['updates_rejected'] += 1
+                return text_response(403, "forbidden")
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            stats['updates_rejected'] += 1
+            return text_response(400, "bad update")
+        await submit(data)
+        stats['updates_received'] += 1
+        return text_response(200, "ok")
+
+    handle.stats = stats
+    return handle
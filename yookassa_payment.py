@@ -1,55 +1,287 @@
-import os
+"""Асинхронный клиент API YooKassa.
+
+Запросы идут через один httpx.AsyncClient с пулом keep-alive соединений,
+одновременно выполняется не больше max_concurrency запросов. На весь вызов
+с повторами отводится timeout секунд. Повторяются сетевые ошибки и ответы
+202/429/5xx; создание платежа повторяется с тем же Idempotence-Key, поэтому
+повтор не создаст второй платеж.
+
+notification_handler принимает HTTP-уведомления YooKassa о смене статуса
+платежа на встроенном веб-сервере бота.
+"""
+
+import asyncio
+from collections import namedtuple
+from ipaddress import ip_address, ip_network
+import json
 import logging
-from yookassa import Configuration, Payment
+import os
+import time
 import uuid
 
+import httpx
+
+from webserver import text_response
+
 logger = logging.getLogger(__name__)
 
+API_URL = os.environ.get('YOOKASSA_API_URL', 'https://api.yookassa.ru/v3')
+RETURN_URL = 'https://t.me/norma_zhora_bot'
+MAX_CONCURRENCY = int(os.environ.get('YOOKASSA_MAX_CONCURRENCY', 8))
+# Срок на весь вызов вместе с повторами и на установку соединения, в секундах
+TIMEOUT = float(os.environ.get('YOOKASSA_TIMEOUT', 10))
+CONNECT_TIMEOUT = float(os.environ.get('YOOKASSA_CONNECT_TIMEOUT', 3))
+MAX_RETRIES = int(os.environ.get('YOOKASSA_MAX_RETRIES', 3))
+# 202: YooKassa еще обрабатывает запрос и просит повторить его с тем же ключом
+RETRY_STATUSES = frozenset((202, 429, 500, 502, 503, 504))
+
+# Сети, из которых YooKassa присылает уведомления. Подписи у уведомлений нет,
+# поэтому источник проверяется по адресу
+NOTIFICATION_NETWORKS = tuple(os.environ.get('YOOKASSA_NOTIFY_NETWORKS', ','.join((
+    '185.71.76.0/27', '185.71.77.0/27', '77.75.153.0/25', '77.75.156.11/32',
+    '77.75.156.35/32', '77.75.154.128/25', '2a02:5180::/32',
+))).split(','))
+# За обратным прокси адрес отправителя берется из последнего элемента X-Forwarded-For
+TRUST_FORWARDED = os.environ.get('YOOKASSA_TRUST_FORWARDED') == '1'
+# Событие уведомления и статус, в котором должен быть платеж
+EVENT_STATUSES = {
+    'payment.waiting_for_capture': 'waiting_for_capture',
+    'payment.succeeded': 'succeeded',
+    'payment.canceled': 'canceled',
+}
+
+PaymentInfo = namedtuple('PaymentInfo', 'id status amount currency confirmation_url metadata')
+
+
+class PaymentError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_payment(data):
+    confirmation = data.get('confirmation') or {}
+    return PaymentInfo(
+        id=data.get('id'),
+        status=data.get('status'),
+        amount=(data.get('amount') or {}).get('value'),
+        currency=(data.get('amount') or {}).get('currency'),
+        confirmation_url=confirmation.get('confirmation_url'),
+        metadata=data.get('metadata') or {},
+    )
+
+
 class YooKassaPayment:
-    def __init__(self):
-        """Инициализация класса для работы с YooKassa"""
-        self.shop_id = os.environ.get('YOOKASSA_SHOP_ID')
-        self.secret_key = os.environ.get('YOOKASSA_SECRET_KEY')
-        
+    def __init__(self, shop_id=None, secret_key=None, api_url=API_URL, max_concurrency=MAX_CONCURRENCY,
+                 timeout=TIMEOUT, connect_timeout=CONNECT_TIMEOUT, max_retries=MAX_RETRIES, backoff=0.5):
+        """Инициализация клиента YooKassa"""
+        self.shop_id = shop_id or os.environ.get('YOOKASSA_SHOP_ID')
+        self.secret_key = secret_key or os.environ.get('YOOKASSA_SECRET_KEY')
+
         if not self.shop_id or not self.secret_key:
             logger.error("Missing YooKassa credentials!")
             raise ValueError("Missing YooKassa credentials!")
-            
-        # Настройка YooKassa
-        Configuration.account_id = self.shop_id
-        Configuration.secret_key = self.secret_key
-        
-    def create_payment(self, amount, description):
-        """Создание платежа через YooKassa"""
+
+        self.api_url = api_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Клиент и семафор создаются в цикле событий бота при первом запросе
+        self._client = None
+        self._semaphore = None
+
+        self._requests = 0
+        self._retries = 0
+        self._failures = 0
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._total_ms = 0.0
+        self._max_ms = 0.0
+        self._last_ms = 0.0
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_url,
+                auth=(self.shop_id, self.secret_key),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def _send(self, client, method, path, json, headers, remaining):
+        async with self._semaphore:
+            self._requests += 1
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+            started = time.perf_counter()
+            try:
+                return await asyncio.wait_for(client.request(method, path, json=json, headers=headers), remaining)
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self._in_flight -= 1
+                self._last_ms = elapsed_ms
+                self._total_ms += elapsed_ms
+                self._max_ms = max(self._max_ms, elapsed_ms)
+
+    async def _request(self, method, path, json=None, idempotence_key=None):
+        """Выполняет запрос с повторами до истечения срока. Возвращает JSON ответа"""
+        client = self._get_client()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        headers = {'Idempotence-Key': idempotence_key} if idempotence_key else None
+        attempt = 0
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self._failures += 1
+                raise PaymentError(f"{method} {path}: deadline exceeded after {attempt} attempts")
+            error = None
+            delay = self.backoff * 2 ** attempt
+            try:
+                response = await self._send(client, method, path, json, headers, remaining)
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                error = PaymentError(f"{method} {path}: {type(e).__name__}: {str(e) or 'timed out'}")
+            else:
+                if response.status_code < 300 and response.status_code not in RETRY_STATUSES:
+                    try:
+                        data = response.json()
+                    except ValueError:
+                        data = None
+                    if isinstance(data, dict):
+                        return data
+                    self._failures += 1
+                    raise PaymentError(f"{method} {path}: invalid JSON response: {response.text[:200]}",
+                                       status=response.status_code)
+                error = PaymentError(f"{method} {path}: HTTP {response.status_code}: {response.text[:200]}",
+                                     status=response.status_code)
+                if response.status_code not in RETRY_STATUSES:
+                    self._failures += 1
+                    raise error
+                retry_after = response.headers.get('Retry-After')
+                if retry_after and retry_after.replace('.', '', 1).isdigit():
+                    delay = float(retry_after)
+
+            attempt += 1
+            if attempt > self.max_retries or loop.time() + delay >= deadline:
+                self._failures += 1
+                raise error
+            logger.warning(f"YooKassa request failed, retry {attempt} in {delay:.2f}s: {error}")
+            self._retries += 1
+            await asyncio.sleep(delay)
+
+    async def create_payment(self, amount, description, user_id=None, idempotence_key=None):
+        """Создание платежа через YooKassa. Возвращает PaymentInfo или None"""
+        order_id = idempotence_key or str(uuid.uuid4())
+        metadata = {"order_id": order_id}
+        if user_id is not None:
+            metadata["user_id"] = str(user_id)
         try:
             logger.info(f"Creating payment for amount: {amount} RUB")
-            logger.info(f"Using shop_id: {self.shop_id}")
-            
-            payment = Payment.create({
+            data = await self._request('POST', '/payments', json={
                 "amount": {
                     "value": str(amount),
                     "currency": "RUB"
                 },
                 "confirmation": {
                     "type": "redirect",
-                    "return_url": "https://t.me/norma_zhora_bot"
+                    "return_url": RETURN_URL
                 },
                 "capture": True,
                 "description": description,
-                "metadata": {
-                    "order_id": str(uuid.uuid4())
-                }
-            })
-            
-            if payment and payment.confirmation and payment.confirmation.confirmation_url:
-                logger.info(f"Payment created successfully. Confirmation URL: {payment.confirmation.confirmation_url}")
-                return payment
-            else:
-                logger.error("Payment created but confirmation URL is missing")
-                return None
-                
+                "metadata": metadata
+            }, idempotence_key=order_id)
+        except PaymentError as e:
+            logger.error(f"Error creating payment: {e}")
+            return None
+
+        payment = parse_payment(data)
+        if payment.confirmation_url:
+            logger.info(f"Payment {payment.id} created. Confirmation URL: {payment.confirmation_url}")
+            return payment
+        logger.error("Payment created but confirmation URL is missing")
+        return None
+
+    async def get_payment(self, payment_id):
+        """Текущее состояние платежа. Ошибки API пробрасываются как PaymentError"""
+        payment = parse_payment(await self._request('GET', f'/payments/{payment_id}'))
+        if not payment.status:
+            raise PaymentError(f"GET /payments/{payment_id}: response without payment status")
+        return payment
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def metrics(self):
+        attempts = self._requests
+        return {
+            'max_concurrency': self.max_concurrency,
+            'requests': attempts,
+            'retries': self._retries,
+            'failures': self._failures,
+            'in_flight': self._in_flight,
+            'max_in_flight': self._max_in_flight,
+            'last_latency_ms': round(self._last_ms, 3),
+            'avg_latency_ms': round(self._total_ms / attempts, 3) if attempts else 0.0,
+            'max_latency_ms': round(self._max_ms, 3),
+        }
+
+
+def notification_handler(record, networks=NOTIFICATION_NETWORKS, trust_forwarded=TRUST_FORWARDED):
+    """Обработчик POST с уведомлениями YooKassa.
+
+    Принимает уведомления только из сетей networks и только согласованные
+    (событие соответствует статусу платежа), затем вызывает record(payment).
+    Если record упал, отвечает 500, и YooKassa повторит уведомление позже.
+    """
+    allowed = [ip_network(network.strip()) for network in networks if network.strip()]
+    stats = {'notifications_received': 0, 'notifications_rejected': 0, 'notifications_failed': 0}
+
+    def sender(request):
+        address = request.peer[0] if request.peer else ''
+        forwarded = request.headers.get('x-forwarded-for')
+        if trust_forwarded and forwarded:
+            address = forwarded.split(',')[-1].strip()
+        try:
+            ip = ip_address(address)
+        except ValueError:
+            return None
+        # Сервер, слушающий IPv6, видит IPv4-адреса как ::ffff:a.b.c.d
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        return ip
+
+    async def handle(request):
+        ip = sender(request)
+        if ip is None or not any(ip in network for network in allowed):
+            stats['notifications_rejected'] += 1
+            logger.warning(f"Rejected YooKassa notification from {ip}")
+            return text_response(403, "forbidden")
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            data = None
+        payment_data = data.get('object') if isinstance(data, dict) else None
+        payment = parse_payment(payment_data) if isinstance(payment_data, dict) else None
+        if (payment is None or data.get('type') != 'notification' or not payment.id
+                or EVENT_STATUSES.get(data.get('event')) != payment.status):
+            stats['notifications_rejected'] += 1
+            return text_response(400, "bad notification")
+        try:
+            await record(payment)
         except Exception as e:
-            logger.error(f"Error creating payment: {str(e)}")
-            logger.error(f"Error type: {type(e).__name__}")
-            logger.error(f"Error details: {e.__dict__ if hasattr(e, '__dict__') else 'No details available'}")
-            return None 
\ No newline at end of file
+            stats['notifications_failed'] += 1
+            logger.error(f"Error recording payment {payment.id}: {e}")
+            return text_response(500, "internal error")
+        stats['notifications_received'] += 1
+        return text_response(200, "ok")
+
+    handle.stats = stats
+    return handle